@@ -0,0 +1,131 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+from collections import OrderedDict
+import numpy as np
+
+import learn.rl.RLConfig as config
+
+CACHE_SIZE = config.geti('activationCacheSize', 10000)
+CACHE_QUANTUM = config.geti('activationCacheQuantum', 1)
+
+########################################
+## LRU CACHE OF REGION ACTIVATIONS
+########################################
+# Entries are keyed by (image, covered regions, quantized box). Covering a
+# region changes the pixels seen by the network, so the list of covers
+# applied since the image was prepared is part of the key.
+class ActivationCache():
+
+  def __init__(self, size=CACHE_SIZE, quantum=CACHE_QUANTUM):
+    self.size = size
+    self.quantum = quantum
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def quantize(self, box):
+    return tuple([int(x)/self.quantum for x in box])
+
+  def key(self, image, covers, box):
+    return (image, covers, self.quantize(box))
+
+  def get(self, key):
+    try:
+      value = self.entries.pop(key)
+    except KeyError:
+      self.misses += 1
+      return None
+    self.entries[key] = value
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    if self.size <= 0:
+      return
+    if key in self.entries:
+      self.entries.pop(key)
+    elif len(self.entries) >= self.size:
+      self.entries.popitem(last=False)
+    self.entries[key] = value
+
+  def hitRate(self):
+    total = self.hits + self.misses
+    return float(self.hits)/total if total > 0 else 0.0
+
+  def resetCounters(self):
+    self.hits = 0
+    self.misses = 0
+
+  def report(self):
+    print 'ActivationCache: {:d} hits, {:d} misses, hit rate {:5.3f}, {:d} entries'.format(self.hits, self.misses, self.hitRate(), len(self.entries))
+
+########################################
+## BATCHED ACTIVATIONS WITH CACHE
+########################################
+# Backends implement forwardRegions(boxes), which returns a dictionary with
+# one (len(boxes) x dim) array per layer for at most self.batchSize boxes,
+# and applyCover(boxes, source), which covers regions of the current image.
+# A context identifies an image with the regions covered on it, so several
+# images can share one backend (see VectorizedBoxSearchEnvironment). Backends
+# that switch contexts without preparing the image again and replaying its
+# covers set cheapContexts.
+class ActivationBackend():
+
+  cheapContexts = False
+
+  def initCache(self):
+    self.cache = ActivationCache()
+    self.imageName = ''
+    self.resetCovers()
+
+  def resetCovers(self):
+    self.covers = ()
+    self.coverLog = []
+
+  def getContext(self):
+    return {'image':self.imageName, 'covers':self.covers, 'log':self.coverLog[:]}
+
+  def setContext(self, context):
+    if context['image'] == self.imageName and context['covers'] == self.covers:
+      return
+    self.prepareImage(context['image'])
+    for boxes,source in context['log']:
+      self.applyCover(boxes, source)
+
+  def getActivations(self, box):
+    result = self.getActivationsBatch([box])
+    return dict([ (layer,result[layer][0]) for layer in result.keys() ])
+
+  def getActivationsBatch(self, boxes):
+    return self.getActivationsMulti([self.getContext()]*len(boxes), boxes)
+
+  def getActivationsMulti(self, contexts, boxes):
+    keys = [self.cache.key(contexts[i]['image'], contexts[i]['covers'], boxes[i]) for i in range(len(boxes))]
+    rows = [self.cache.get(k) for k in keys]
+    # Boxes that share the same key are computed only once
+    pending = OrderedDict()
+    for i in range(len(boxes)):
+      if rows[i] is None:
+        pending.setdefault(keys[i], []).append(i)
+    # Missing boxes are grouped by context to switch images as few times as possible
+    groups = OrderedDict()
+    for k in pending.keys():
+      groups.setdefault(k[0:2], []).append(k)
+    for group in groups.values():
+      self.setContext(contexts[pending[group[0]][0]])
+      for s in range(0, len(group), self.batchSize):
+        batchKeys = group[s:s+self.batchSize]
+        outputs = self.forwardRegions([boxes[pending[k][0]] for k in batchKeys])
+        for j in range(len(batchKeys)):
+          row = dict([ (layer,outputs[layer][j].copy()) for layer in outputs.keys() ])
+          self.cache.put(batchKeys[j], row)
+          for i in pending[batchKeys[j]]:
+            rows[i] = row
+    if len(rows) == 0:
+      return {}
+    return dict([ (layer,np.asarray([r[layer] for r in rows])) for layer in rows[0].keys() ])
+
+  def registerCover(self, boxes, source=''):
+    self.covers = self.covers + ( (source,) + tuple([self.cache.quantize(b) for b in boxes]), )
+    self.coverLog.append( (boxes, source) )
+
@@ -0,0 +1,200 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import random
+import time
+import Queue
+import numpy as np
+from multiprocessing import Process, Queue as ProcessQueue
+
+import utils.utils as cu
+import learn.rl.RLConfig as config
+
+from pybrain.rl.experiments import Experiment
+
+from QNetwork import QNetwork
+from QLearning import QLearning
+from BoxSearchEnvironment import BoxSearchEnvironment
+from BoxSearchTask import BoxSearchTask
+from BoxSearchAgent import BoxSearchAgent, SharedReplayMemory
+
+PUBLISH_INTERVAL = config.geti('weightsPublishInterval', 1)
+LEARNER_IDLE_TIME = 0.1
+# Seconds between checks of the learner process while waiting for it
+LEARNER_POLL_TIME = 5.0
+
+########################################
+## ACTOR/LEARNER TRAINING
+########################################
+# Actor processes run episodes with their own environment, CNN backend and
+# acting copy of the Q-network, and push transitions into a shared-memory
+# replay (SharedReplayMemory). A learner process trains continuously on
+# minibatches of that memory and publishes new weights to the actors, which
+# pick them up between episodes. The runner keeps the epsilon schedule: every
+# epoch it sends the epsilon and the number of episodes to the actors and
+# collects their episode statistics.
+#
+# Without learner, the actors form a pool that generates exploration epochs
+# (epsilon 1.0, no Q-network involved) for a learner in the parent process.
+#
+# Processes are forked when ActorLearner is created, so it must be created
+# before the parent process loads any network.
+
+def reseed():
+  # Forked processes start with the random state of the parent
+  random.seed()
+  np.random.seed()
+
+def latest(queue):
+  # Drain a queue and keep its most recent item
+  item = None
+  try:
+    while True:
+      item = queue.get_nowait()
+  except Queue.Empty:
+    return item
+
+class Actor():
+
+  def __init__(self, index, memory, weights, actors):
+    reseed()
+    self.index = index
+    self.weights = weights
+    self.environment = BoxSearchEnvironment(config.get('trainDatabase'), 'train', config.get('trainGroundTruth'))
+    # Every actor runs the episodes of its own slice of the image list
+    images = [x.strip() for x in open(config.get('trainDatabase'))]
+    self.environment.imageList = images[index::actors]
+    random.shuffle(self.environment.imageList)
+    self.environment.idx = -1
+    self.environment.loadNextEpisode()
+    self.controller = QNetwork()
+    self.agent = BoxSearchAgent(self.controller)
+    memory.attach(index)
+    self.agent.replayMemory = memory
+    self.task = BoxSearchTask(self.environment, config.get('trainGroundTruth'))
+    self.experiment = Experiment(self.task, self.agent)
+
+  def refreshWeights(self):
+    weights = latest(self.weights)
+    if weights is not None:
+      self.controller.setWeights(weights, updateTarget=False)
+
+  def runEpisodes(self, epsilon, interactions, episodes):
+    self.controller.setEpsilonGreedy(epsilon, self.environment.sampleAction)
+    for img in range(episodes):
+      self.refreshWeights()
+      k = 0
+      while not self.environment.episodeDone and k < interactions:
+        self.experiment._oneInteraction()
+        k += 1
+      self.agent.reset()
+      self.environment.loadNextEpisode()
+    self.environment.cnn.cache.report()
+    self.environment.cnn.cache.resetCounters()
+    stats = (self.index, self.task.epochRecall, self.task.epochMaxIoU, self.task.epochLandmarks)
+    self.task.epochRecall = []
+    self.task.epochMaxIoU = []
+    self.task.epochLandmarks = []
+    return stats
+
+def actorProcess(index, memory, commands, results, weights, actors):
+  actor = Actor(index, memory, weights, actors)
+  for command in iter(commands.get, 'stop'):
+    results.put( actor.runEpisodes(*command) )
+
+def learnerProcess(memory, commands, results, weights):
+  reseed()
+  learner = QLearning()
+  controller = QNetwork()
+  started = False
+  updates = 0
+  while True:
+    if not started or not commands.empty():
+      command = commands.get()
+      if command == 'stop':
+        break
+      elif command == 'start':
+        started = True
+      elif command[0] == 'save':
+        learner.saveNetwork(command[1])
+        results.put('saved')
+      continue
+    memory.sync()
+    if memory.sampleable() == 0:
+      time.sleep(LEARNER_IDLE_TIME)
+      continue
+    learner.learn(memory, controller)
+    controller.setWeights(learner.getWeights())
+    updates += 1
+    if updates % PUBLISH_INTERVAL == 0:
+      published = learner.getWeights()
+      for queue in weights:
+        # Actors that did not take the previous weights yet skip this update
+        if queue.empty():
+          queue.put(published)
+  # Weights that no actor will read must not block the exit
+  for queue in weights:
+    queue.cancel_join_thread()
+
+class ActorLearner():
+
+  def __init__(self, numImages, recordsPerImage, actors, learner=True):
+    self.memory = SharedReplayMemory(numImages, recordsPerImage, actors)
+    self.actorCommands = [ProcessQueue() for i in range(actors)]
+    self.actorResults = ProcessQueue()
+    self.weights = [ProcessQueue() for i in range(actors)]
+    self.learnerCommands = ProcessQueue()
+    self.learnerResults = ProcessQueue()
+    self.processes = []
+    for i in range(actors):
+      p = Process(target=actorProcess, args=(i, self.memory, self.actorCommands[i], self.actorResults, self.weights[i], actors))
+      p.daemon = True
+      p.start()
+      self.processes.append(p)
+    # Without learner the actors only generate experience (exploration pool)
+    self.hasLearner = learner
+    if learner:
+      p = Process(target=learnerProcess, args=(self.memory, self.learnerCommands, self.learnerResults, self.weights))
+      p.daemon = True
+      p.start()
+      self.processes.append(p)
+      self.learner = p
+    self.learning = False
+
+  def runEpoch(self, epsilon, interactions, episodes, task):
+    # Episodes are split among the actors; their statistics are added to task
+    actors = len(self.actorCommands)
+    s = cu.tic()
+    for i in range(actors):
+      self.actorCommands[i].put( (epsilon, interactions, episodes/actors + (1 if i < episodes % actors else 0)) )
+    for i in range(actors):
+      index, recall, maxIoU, landmarks = self.actorResults.get()
+      task.epochRecall += recall
+      task.epochMaxIoU += maxIoU
+      task.epochLandmarks += landmarks
+    print 'ActorLearner: replay memory with', self.memory.sync(), 'records'
+    s = cu.toc('Run epoch with ' + str(episodes) + ' episodes in ' + str(actors) + ' actor processes', s)
+
+  def startLearner(self):
+    if self.hasLearner and not self.learning:
+      self.learnerCommands.put('start')
+      self.learning = True
+
+  def saveNetwork(self, networkFile):
+    if self.learning:
+      self.learnerCommands.put( ('save', networkFile) )
+      # A learner that died would never answer
+      while True:
+        try:
+          self.learnerResults.get(timeout=LEARNER_POLL_TIME)
+          return
+        except Queue.Empty:
+          if not self.learner.is_alive():
+            raise RuntimeError('ActorLearner: the learner process died (exit code ' + str(self.learner.exitcode) + '), ' + networkFile + ' not saved')
+
+  def stop(self):
+    for queue in self.actorCommands:
+      queue.put('stop')
+    if self.hasLearner:
+      self.learnerCommands.put('stop')
+    for p in self.processes:
+      p.join()
@@ -4,7 +4,9 @@ import learn.rl.RLConfig as config
 
 import numpy as np
 import scipy.io
+import multiprocessing
 import utils.MemoryUsage
+import utils.ringBuffer as rb
 
 import BoxSearchState as bss
 import PriorMemory as prm
@@ -15,6 +17,18 @@ NUM_ACTIONS = config.geti('outputActions')
 TEMPORAL_WINDOW = config.geti('temporalWindow')
 HISTORY_FACTOR = config.geti('historyFactor')
 NEGATIVE_PROBABILITY = config.getf('negativeEpisodeProb')
+PRIORITIZED_REPLAY = config.geti('prioritizedReplay', 0) > 0
+PRIORITY_ALPHA = config.getf('priorityAlpha', 0.6)
+PRIORITY_BETA = config.getf('priorityBeta', 0.4)
+PRIORITY_EPSILON = 1e-3
+FRAME_REPLAY = config.geti('frameReplay', 0) > 0
+FRAME_DTYPE = {'float32':np.float32, 'float16':np.float16}[config.get('frameReplayDtype', default='float32')]
+EMPTY_FRAME = -1
+NEW_FRAME = -2
+# Kinds of the records of the shared memory
+PLAIN_RECORD = 0
+DETECTION_RECORD = 1
+DETECTION_COPY = 2
 
 class BoxSearchAgent():
 
@@ -32,7 +46,12 @@ class BoxSearchAgent():
     self.priorMemory = None
 
   def startReplayMemory(self, memoryImages, recordsPerImage):
-    self.replayMemory = ReplayMemory(memoryImages, recordsPerImage)
+    if PRIORITIZED_REPLAY:
+      self.replayMemory = PrioritizedReplayMemory(memoryImages, recordsPerImage)
+    elif FRAME_REPLAY:
+      self.replayMemory = FrameReplayMemory(memoryImages, recordsPerImage, FRAME_DTYPE)
+    else:
+      self.replayMemory = ReplayMemory(memoryImages, recordsPerImage)
 
   def assignPriorMemory(self, prior):
     self.priorMemory = prior
@@ -40,14 +59,17 @@ class BoxSearchAgent():
   def integrateObservation(self, obs):
     if obs['image'] != self.image:
       self.actionsH = [0 for i in range(NUM_ACTIONS)]
-      self.observation = np.zeros( (TEMPORAL_WINDOW, STATE_FEATURES), np.float32 )
+      # The last TEMPORAL_WINDOW states, newest first. The shift loop used
+      # before repeated the previous state in all older rows (utils/test_ringBuffer)
+      self.observation = rb.RingBuffer(TEMPORAL_WINDOW, (STATE_FEATURES,), np.float32)
+      self.frameIds = rb.RingBuffer(TEMPORAL_WINDOW, (), np.int64, EMPTY_FRAME)
       self.image = obs['image']
       self.negative = obs['negEpisode']
       self.timer = 0
       self.avgReward = 0.0
-    for t in range(TEMPORAL_WINDOW-1):
-      self.observation[t+1,:] = self.observation[t,:]
-    self.observation[0,:] = obs['state']
+    self.observation.push(obs['state'])
+    # The new frame is not in the replay memory yet
+    self.frameIds.push(NEW_FRAME)
     self.action = None
     self.reward = None
 
@@ -56,9 +78,14 @@ class BoxSearchAgent():
     assert self.action == None
     assert self.reward == None
 
+    values = self.controller.getActionValues(self.getObservation())
+    return self.setActionValues(values)
+
+  def getObservation(self):
+    return self.observation.window().reshape( (1, TEMPORAL_WINDOW*STATE_FEATURES) )
+
+  def setActionValues(self, values):
     self.timer += 1
-    obs = self.observation.reshape( (1, TEMPORAL_WINDOW*STATE_FEATURES) )
-    values = self.controller.getActionValues(obs)
     self.action = np.argmax(values, 1)[0]
     v = values[0,self.action]
     return (self.action,float(v))
@@ -70,21 +97,22 @@ class BoxSearchAgent():
 
     self.reward = r
     self.avgReward = (self.avgReward*(self.timer-1) + r)/(self.timer)
-    obs = self.observation.reshape((TEMPORAL_WINDOW*STATE_FEATURES))
+    obs = self.observation.flat()
     if self.replayMemory != None:
       if not self.negative:
-        self.replayMemory.add(self.image, self.timer, self.action, obs, self.reward)
         # Oversample terminal state
         if self.action == bss.PLACE_LANDMARK and self.reward > 0: 
-          for copy in range(HISTORY_FACTOR):
-            self.replayMemory.add(self.image+'_'+str(copy), self.timer, self.action, obs, self.reward)
+          self.replayMemory.addDetection(self.image, self.timer, self.action, obs, self.reward, self.frameIds)
+        else:
+          self.replayMemory.add(self.image, self.timer, self.action, obs, self.reward, self.frameIds)
       else:
         # Any negative sample should be remembered as a bad landmark rather than a bad movement
         if random.random() < 2*NEGATIVE_PROBABILITY:
-          self.replayMemory.add(self.image, self.timer, bss.PLACE_LANDMARK, obs, -2.0)
+          self.replayMemory.add(self.image, self.timer, bss.PLACE_LANDMARK, obs, -2.0, self.frameIds)
     if self.action == bss.PLACE_LANDMARK:
       # Clean history of observations
-      self.observation = np.zeros( (TEMPORAL_WINDOW, STATE_FEATURES), np.float32 )
+      self.observation.clear()
+      self.frameIds.clear()
     self.actionsH[self.action] += 1
     print 'Agent::MemoryRecord => image:',self.image,'time:',self.timer,'action:',self.action,'reward',self.reward,'avgReward:',self.avgReward
 
@@ -101,30 +129,326 @@ class BoxSearchAgent():
       self.learner.learn(self.replayMemory, self.controller)
       #if self.priorMemory != None:
       #  self.learner.learnFromPriors(self.priorMemory)
-      self.controller.loadNetwork()
+      self.controller.setWeights(self.learner.getWeights())
 
 class ReplayMemory():
 
-  def __init__(self, numImages, recordsPerImage):
-    self.O = np.zeros( (HISTORY_FACTOR*numImages*recordsPerImage, TEMPORAL_WINDOW*STATE_FEATURES), np.float32 )
-    self.A = np.zeros( (HISTORY_FACTOR*numImages*recordsPerImage, 1), np.int )
-    self.R = np.zeros( (HISTORY_FACTOR*numImages*recordsPerImage, 1), np.float32 )
-    self.I = ['' for i in range(HISTORY_FACTOR*numImages*recordsPerImage)]
+  def __init__(self, numImages, recordsPerImage, copies=HISTORY_FACTOR):
+    self.size = copies*numImages*recordsPerImage
+    self.allocateObservations()
+    self.A = np.zeros( (self.size, 1), np.int )
+    self.R = np.zeros( (self.size, 1), np.float32 )
+    # Image names are stored as integer ids to compare records in bulk
+    self.I = np.zeros( (self.size), np.int32 )
+    self.imageIds = {}
     self.recordsPerImage = recordsPerImage
     self.pointer = -1
     self.usableRecords = 0
 
-  def add(self, img, time, action, observation, reward):
-    if self.pointer < self.O.shape[0]-1:
+  def allocateObservations(self):
+    self.O = np.zeros( (self.size, TEMPORAL_WINDOW*STATE_FEATURES), np.float32 )
+
+  # frames identifies the frames of the observation window (see FrameReplayMemory)
+  def add(self, img, time, action, observation, reward, frames=None):
+    if self.pointer < self.size-1:
       self.pointer += 1
     else:
       self.pointer = 0
 
     self.A[self.pointer,0] = action
-    self.O[self.pointer,:] = observation
+    self.storeObservation(observation, frames)
     self.R[self.pointer,0] = reward
-    self.I[self.pointer] = img
+    self.I[self.pointer] = self.imageId(img)
 
-    if self.usableRecords < self.O.shape[0]:
+    if self.usableRecords < self.size:
       self.usableRecords += 1
 
+  def storeObservation(self, observation, frames):
+    self.O[self.pointer,:] = observation
+
+  def observations(self, records):
+    return self.O[records,:]
+
+  def addDetection(self, img, time, action, observation, reward, frames=None):
+    # Correct detections are stored HISTORY_FACTOR more times as terminal records
+    self.add(img, time, action, observation, reward, frames)
+    for copy in range(HISTORY_FACTOR):
+      self.add(img+'_'+str(copy), time, action, observation, reward, frames)
+
+  def imageId(self, img):
+    try:
+      return self.imageIds[img]
+    except KeyError:
+      self.imageIds[img] = len(self.imageIds) + 1
+      return self.imageIds[img]
+
+  def sample(self, n):
+    # Uniform sampling: no importance weights
+    return (np.random.randint(0, self.usableRecords-1, n), None)
+
+  def nextRecords(self, records):
+    return records + 1
+
+  def terminalStates(self, records):
+    # The next record belongs to a different image
+    return self.I[records] != self.I[records+1]
+
+  def updatePriorities(self, records, errors):
+    return
+
+########################################
+## PRIORITIZED REPLAY
+########################################
+# Binary sum-tree over record priorities: leaves hold priorities and every
+# internal node the sum of its children, so sampling proportionally to the
+# priorities and updating them take O(log n) vectorized steps per batch.
+class SumTree():
+
+  def __init__(self, capacity):
+    self.leaves = 1
+    while self.leaves < capacity:
+      self.leaves *= 2
+    self.tree = np.zeros( (2*self.leaves), np.float64 )
+
+  def total(self):
+    return self.tree[1]
+
+  def get(self, records):
+    return self.tree[np.asarray(records, np.int64) + self.leaves]
+
+  def update(self, records, priorities):
+    nodes = np.asarray(records, np.int64) + self.leaves
+    self.tree[nodes] = priorities
+    nodes = np.unique(nodes/2)
+    while nodes[0] >= 1:
+      self.tree[nodes] = self.tree[2*nodes] + self.tree[2*nodes+1]
+      nodes = np.unique(nodes/2)
+
+  def sample(self, values):
+    # Descend from the root for all values at once
+    nodes = np.ones( (len(values)), np.int64 )
+    values = np.asarray(values, np.float64).copy()
+    while nodes[0] < self.leaves:
+      left = 2*nodes
+      right = values >= self.tree[left]
+      values[right] -= self.tree[left][right]
+      nodes = left + right
+    return nodes - self.leaves
+
+# Records are stored once; correct detections get a priority boost equivalent
+# to the HISTORY_FACTOR copies of the plain memory and are marked as terminal.
+# New records enter with the maximum priority seen so far.
+class PrioritizedReplayMemory(ReplayMemory):
+
+  def __init__(self, numImages, recordsPerImage):
+    ReplayMemory.__init__(self, numImages, recordsPerImage, copies=1)
+    self.T = np.zeros( (self.size), np.bool )
+    self.boost = np.ones( (self.size), np.float32 )
+    self.tree = SumTree(self.size)
+    self.maxPriority = 1.0
+
+  def add(self, img, time, action, observation, reward, frames=None, boost=1.0, terminal=False):
+    ReplayMemory.add(self, img, time, action, observation, reward, frames)
+    self.T[self.pointer] = terminal
+    self.boost[self.pointer] = boost
+    self.tree.update([self.pointer], [boost*self.maxPriority])
+
+  def addDetection(self, img, time, action, observation, reward, frames=None):
+    self.add(img, time, action, observation, reward, frames, boost=1.0+HISTORY_FACTOR, terminal=True)
+
+  def sample(self, n):
+    records = self.tree.sample(np.random.random(n)*self.tree.total())
+    records = np.minimum(records, self.usableRecords-1)
+    probabilities = self.tree.get(records)/self.tree.total()
+    weights = (self.usableRecords*probabilities)**(-PRIORITY_BETA)
+    return (records, (weights/weights.max()).astype(np.float32))
+
+  def nextRecords(self, records):
+    return (records + 1) % self.size
+
+  def terminalStates(self, records):
+    # The most recent record has no successor yet
+    nextRecords = self.nextRecords(records)
+    return (self.I[records] != self.I[nextRecords]) | self.T[records] | (records == self.pointer)
+
+  def updatePriorities(self, records, errors):
+    priorities = (np.abs(errors) + PRIORITY_EPSILON)**PRIORITY_ALPHA
+    self.maxPriority = max(self.maxPriority, priorities.max())
+    self.tree.update(records, self.boost[records]*priorities)
+
+########################################
+## FRAME-DEDUPLICATED REPLAY
+########################################
+# Consecutive observation windows share TEMPORAL_WINDOW-1 frames, so frames
+# are stored once in a ring and records keep the int32 serial number of each
+# frame of their window (-1 for the empty frames of a new window). Windows are
+# assembled when sampled. The ring holds one frame per record, but a record
+# adds up to TEMPORAL_WINDOW frames (windows without frame ids, steps of
+# negative episodes that were not stored): records with a frame overwritten
+# by the ring, or whose successor has one, are not sampled.
+class FrameReplayMemory(ReplayMemory):
+
+  def __init__(self, numImages, recordsPerImage, dtype=np.float32):
+    self.dtype = dtype
+    ReplayMemory.__init__(self, numImages, recordsPerImage)
+
+  def allocateObservations(self):
+    self.F = np.zeros( (self.size + TEMPORAL_WINDOW, STATE_FEATURES), self.dtype )
+    self.FI = -np.ones( (self.size, TEMPORAL_WINDOW), np.int32 )
+    self.framesWritten = 0
+
+  def addFrame(self, frame):
+    self.F[self.framesWritten % self.F.shape[0],:] = frame
+    self.framesWritten += 1
+    return self.framesWritten - 1
+
+  def storeObservation(self, observation, frames):
+    window = observation.reshape( (TEMPORAL_WINDOW, STATE_FEATURES) )
+    if frames is None:
+      frames = [NEW_FRAME for i in range(TEMPORAL_WINDOW)]
+    for t in range(TEMPORAL_WINDOW):
+      if frames[t] == NEW_FRAME:
+        frames[t] = self.addFrame(window[t])
+    self.FI[self.pointer,:] = [frames[t] for t in range(TEMPORAL_WINDOW)]
+
+  def observations(self, records):
+    ids = self.FI[records,:]
+    windows = self.F[ids % self.F.shape[0],:].astype(np.float32)
+    windows[ids < 0] = 0.0
+    return windows.reshape( (len(records), TEMPORAL_WINDOW*STATE_FEATURES) )
+
+  def liveRecords(self):
+    # Records whose frames are all still in the ring
+    ids = self.FI[:self.usableRecords,:]
+    return np.all( (ids < 0) | (ids >= self.framesWritten - self.F.shape[0]), 1 )
+
+  def sample(self, n):
+    if self.framesWritten <= self.F.shape[0]:
+      return ReplayMemory.sample(self, n)
+    live = self.liveRecords()
+    records = np.where(live[:-1] & live[1:])[0]
+    return (records[np.random.randint(0, len(records), n)], None)
+
+########################################
+## SHARED-MEMORY REPLAY
+########################################
+# Arrays live in shared memory and survive the fork of actor processes (see
+# ActorLearner). Every actor owns a segment of the memory and writes it as a
+# ring, so consecutive records of a segment are consecutive steps of the same
+# actor and image ids only need to be unique within the segment. The learner
+# samples across all segments; the most recent record of a segment has no
+# successor and is never sampled. Records also keep their kind (detections
+# and their copies) and the serial numbers of the frames of their window
+# within the segment, so copyTo can rebuild them with the add path of any
+# other memory.
+def sharedArray(shape, dtype):
+  size = int(np.prod(shape))*np.dtype(dtype).itemsize
+  return np.frombuffer(multiprocessing.RawArray('b', size), dtype).reshape(shape)
+
+class SharedReplayMemory(ReplayMemory):
+
+  def __init__(self, numImages, recordsPerImage, actors):
+    self.actors = actors
+    self.segment = max(2, HISTORY_FACTOR*numImages*recordsPerImage/actors)
+    self.size = self.segment*actors
+    self.O = sharedArray( (self.size, TEMPORAL_WINDOW*STATE_FEATURES), np.float32 )
+    self.A = sharedArray( (self.size, 1), np.int64 )
+    self.R = sharedArray( (self.size, 1), np.float32 )
+    self.I = sharedArray( (self.size), np.int32 )
+    self.K = sharedArray( (self.size), np.int8 )
+    self.FI = sharedArray( (self.size, TEMPORAL_WINDOW), np.int64 )
+    self.pointers = sharedArray( (actors), np.int64 )
+    self.pointers[:] = -1
+    self.filled = sharedArray( (actors), np.int64 )
+    self.lock = multiprocessing.Lock()
+    self.imageIds = {}
+    self.recordsPerImage = recordsPerImage
+    self.actor = 0
+    self.framesWritten = 0
+    self.pointer = -1
+    self.usableRecords = 0
+
+  def attach(self, actor):
+    # Called in the actor process: records are written to its own segment
+    self.actor = actor
+
+  def add(self, img, time, action, observation, reward, frames=None):
+    with self.lock:
+      a = self.actor
+      self.pointers[a] = (self.pointers[a] + 1) % self.segment
+      self.pointer = a*self.segment + self.pointers[a]
+      self.A[self.pointer,0] = action
+      self.O[self.pointer,:] = observation
+      self.R[self.pointer,0] = reward
+      self.I[self.pointer] = self.imageId(img)
+      self.K[self.pointer] = PLAIN_RECORD
+      self.storeFrames(frames)
+      self.filled[a] = min(self.filled[a] + 1, self.segment)
+
+  def storeFrames(self, frames):
+    # New frames get the next serial number of the segment, written back to
+    # frames like FrameReplayMemory does. Without frames all are new
+    if frames is None:
+      self.FI[self.pointer,:] = NEW_FRAME
+      return
+    for t in range(TEMPORAL_WINDOW):
+      if frames[t] == NEW_FRAME:
+        frames[t] = self.framesWritten
+        self.framesWritten += 1
+    self.FI[self.pointer,:] = [frames[t] for t in range(TEMPORAL_WINDOW)]
+
+  def addDetection(self, img, time, action, observation, reward, frames=None):
+    ReplayMemory.addDetection(self, img, time, action, observation, reward, frames)
+    # The detection is followed by its HISTORY_FACTOR copies
+    a = self.actor
+    for k in range(HISTORY_FACTOR + 1):
+      self.K[a*self.segment + (self.pointers[a] - k) % self.segment] = DETECTION_COPY if k < HISTORY_FACTOR else DETECTION_RECORD
+
+  def sync(self):
+    self.usableRecords = int(self.filled.sum())
+    return self.usableRecords
+
+  def sampleable(self):
+    # Records with a successor: sample() needs at least one
+    return int(np.maximum(self.filled - 1, 0).sum())
+
+  def observations(self, records):
+    with self.lock:
+      return self.O[records,:]
+
+  def sample(self, n):
+    filled = self.filled.copy()
+    pointers = self.pointers.copy()
+    counts = np.maximum(filled - 1, 0).astype(np.float64)
+    segments = np.random.choice(self.actors, n, p=counts/counts.sum())
+    # Offsets are counted from the oldest record of each segment
+    oldest = np.where(filled[segments] == self.segment, (pointers[segments] + 1) % self.segment, 0)
+    offsets = (np.random.random(n)*counts[segments]).astype(np.int64)
+    return (segments*self.segment + (oldest + offsets) % self.segment, None)
+
+  def nextRecords(self, records):
+    return (records/self.segment)*self.segment + (records % self.segment + 1) % self.segment
+
+  def terminalStates(self, records):
+    return self.I[records] != self.I[self.nextRecords(records)]
+
+  def copyTo(self, memory):
+    # Records of every segment go through the add path of memory, oldest
+    # first: detections are added with addDetection (without their copies)
+    # and frames shared by consecutive windows are shared in memory too
+    for a in range(self.actors):
+      oldest = (self.pointers[a] + 1) % self.segment if self.filled[a] == self.segment else 0
+      frameIds = {}
+      for k in range(self.filled[a]):
+        r = a*self.segment + (oldest + k) % self.segment
+        if self.K[r] == DETECTION_COPY:
+          continue
+        serials = self.FI[r,:].tolist()
+        frames = [EMPTY_FRAME if f == EMPTY_FRAME else frameIds.get(f, NEW_FRAME) for f in serials]
+        if self.K[r] == DETECTION_RECORD:
+          memory.addDetection(str(a) + '_' + str(self.I[r]), 0, self.A[r,0], self.O[r,:], self.R[r,0], frames)
+        else:
+          memory.add(str(a) + '_' + str(self.I[r]), 0, self.A[r,0], self.O[r,:], self.R[r,0], frames)
+        for f,t in zip(serials, frames):
+          if f >= 0:
+            frameIds[f] = t
@@ -5,14 +5,13 @@ from pybrain.rl.environments.environment import Environment
 from PriorMemory import PriorMemory
 
 import BoxSearchState as bs
-import ConvNet as cn
 
 import random
 import numpy as np
-import json
 
 import utils.utils as cu
 import utils.libDetection as det
+import utils.episodeLog as el
 import learn.rl.RLConfig as config
 
 def sigmoid(x, a=1.0, b=0.0):
@@ -22,14 +21,30 @@ def tanh(x, a=5, b=0.5, c=2.0):
   return c*np.tanh(a*x + b)
 
 TEST_TIME_OUT = config.geti('testTimeOut')
-ACTION_HISTORY_SIZE = bs.NUM_ACTIONS*config.geti('actionHistoryLength')
+TEST_MEMORY_FORMAT = config.get('testMemoryFormat', default='json')
+PREFETCH_CANDIDATES = config.geti('prefetchCandidateBoxes', 0) > 0
+
+def loadConvNet():
+  # 'numpy' selects a deterministic CPU stand-in that does not require Caffe,
+  # 'roipool' pools the boxes from one feature map per image
+  backend = config.get('convnetBackend', default='caffe')
+  if backend == 'numpy':
+    from NumpyConvNet import NumpyConvNet
+    return NumpyConvNet()
+  elif backend == 'roipool':
+    from RoiPoolingConvNet import RoiPoolingConvNet
+    return RoiPoolingConvNet()
+  else:
+    import ConvNet as cn
+    return cn.ConvNet()
 
 class BoxSearchEnvironment(Environment, Named):
 
-  def __init__(self, imageList, mode, groundTruthFile=None):
+  def __init__(self, imageList, mode, groundTruthFile=None, cnn=None):
     self.mode = mode
-    self.cnn = cn.ConvNet()
+    self.cnn = cnn if cnn is not None else loadConvNet()
     self.testRecord = None
+    self.testLog = el.openTestMemory(config.get('testMemory'), mode, TEST_MEMORY_FORMAT)
     self.idx = -1
     self.imageList = [x.strip() for x in open(imageList)]
     self.groundTruth = cu.loadBoxIndexFile(groundTruthFile)
@@ -54,8 +69,7 @@ class BoxSearchEnvironment(Environment, Named):
     if self.selectNegativeSample(): return
     # Save actions performed during this episode
     if self.mode == 'test' and self.testRecord != None:
-      with open(config.get('testMemory') + self.imageList[self.idx] + '.txt', 'w') as outfile:
-        json.dump(self.testRecord, outfile)
+      el.saveTestRecord(config.get('testMemory'), self.testLog, self.imageList[self.idx], self.testRecord)
     # Load a new episode
     self.idx += 1
     if self.idx < len(self.imageList):
@@ -63,7 +77,7 @@ class BoxSearchEnvironment(Environment, Named):
       self.cnn.prepareImage(self.imageList[self.idx])
       restartMode = {'train':'Random','test':'Full'}
       self.state = bs.BoxSearchState(self.imageList[self.idx], groundTruth=self.groundTruth, boxReset=restartMode[self.mode])
-      print 'Environment::LoadNextEpisode => Image',self.idx,self.imageList[self.idx],'('+str(self.state.visibleImage.size[0])+','+str(self.state.visibleImage.size[1])+')'
+      print 'Environment::LoadNextEpisode => Image',self.idx,self.imageList[self.idx],'('+str(self.state.imageSize[0])+','+str(self.state.imageSize[1])+')'
     else:
       if self.mode == 'train':
         random.shuffle(self.imageList)
@@ -75,6 +89,17 @@ class BoxSearchEnvironment(Environment, Named):
     if self.mode == 'test':
       self.testRecord = {'boxes':[], 'actions':[], 'values':[], 'rewards':[], 'scores':[]}
 
+  def restart(self):
+    # Goes through the image list again from the start
+    self.idx = -1
+    self.testRecord = None
+    self.testLog = el.openTestMemory(config.get('testMemory'), self.mode, TEST_MEMORY_FORMAT)
+    self.loadNextEpisode()
+
+  def flushTestMemory(self):
+    if self.testLog is not None:
+      self.testLog.flush()
+
   def selectNegativeSample(self):
     if self.mode == 'train' and random.random() < self.negativeProbability:
       idx = random.randint(0,len(self.negativeSamples)-1)
@@ -108,9 +133,14 @@ class BoxSearchEnvironment(Environment, Named):
 
   def getSensors(self):
     # Compute features of visible region (4096)
-    activations = self.cnn.getActivations(self.state.box)
+    if PREFETCH_CANDIDATES:
+      # Boxes reachable in the next step are computed in the same batch and cached
+      batch = self.cnn.getActivationsBatch( [self.state.box] + self.state.candidateBoxes() )
+      activations = dict([ (layer,batch[layer][0]) for layer in batch.keys() ])
+    else:
+      activations = self.cnn.getActivations(self.state.box)
     # Action history (90)
-    actions = np.ones((ACTION_HISTORY_SIZE))*self.state.actionHistory
+    actions = self.state.actionHistory.flat()
 
     # Concatenate all info in the state representation vector
     state = np.hstack( (activations[config.get('convnetLayer')], actions) )
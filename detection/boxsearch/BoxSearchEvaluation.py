@@ -1,9 +1,12 @@
 import os,sys
 import utils.utils as cu
 import utils.libDetection as det
+import utils.episodeLog as el
+import utils.multiproc as mp
 import detection.evaluation as eval
 
 import json
+import multiprocessing
 import scipy.io
 import numpy as np
 
@@ -36,6 +39,8 @@ def getRelationCategories():
   return categories, catIndex
 
 def loadScores(memDir, catI):
+  if el.isEpisodeLog(memDir):
+    return loadLogScores(el.logFile(memDir), catI)
   totalNumberOfBoxes = 0
   sumOfPercentBoxesUsed = 0
   totalImages = 0
@@ -67,6 +72,89 @@ def loadScores(memDir, catI):
   print 'Average boxes per image: {:5.1f}'.format(totalNumberOfBoxes/float(totalImages))
   return scoredDetections
 
+def loadLogScores(logFile, catI):
+  # Same output of loadScores, read from a binary episode log
+  log = el.EpisodeLog(logFile)
+  totalNumberOfBoxes = 0
+  scoredDetections = {}
+  for imageName in log.images():
+    rows = log.episode(imageName)
+    landmarks = np.where(rows['action'] == 8, rows['value'], float('-inf'))
+    scoredDetections[imageName] = {'boxes':rows['box'].tolist(), 'scores':rows['scores'][:,catI].tolist(),
+                                   'values':rows['value'].tolist(), 'landmarks':landmarks.tolist()}
+    totalNumberOfBoxes += len(rows)
+    print imageName,'detections:',len(rows)
+  print 'Average boxes per image: {:5.1f}'.format(totalNumberOfBoxes/float(len(scoredDetections)))
+  return scoredDetections
+
+########################################
+## ALL CATEGORIES FROM ONE LOAD
+########################################
+# The test memory is read once into arrays with one row per detection:
+# boxes (D x 4), scores (D x 21), values and actions (D). Rows of an image are
+# contiguous, from offsets[i] to offsets[i+1].
+def loadScoreMatrix(memDir):
+  images, boxes, scores, values, actions = [], [], [], [], []
+  if el.isEpisodeLog(memDir):
+    log = el.EpisodeLog(el.logFile(memDir))
+    for imageName in log.images():
+      rows = log.episode(imageName)
+      images.append(imageName)
+      boxes.append(rows['box'])
+      scores.append(rows['scores'])
+      values.append(rows['value'])
+      actions.append(rows['action'])
+  else:
+    for f in os.listdir(memDir):
+      if not f.endswith('.txt'): continue
+      data = json.load( open(memDir + f, 'r') )
+      if len(data['boxes']) == 0: continue
+      images.append(f.replace('.txt',''))
+      boxes.append(np.asarray(data['boxes'], np.float64))
+      scores.append(np.asarray(data['scores'], np.float32))
+      values.append(np.asarray(data['values'], np.float64))
+      actions.append(np.asarray(data['actions'], np.int32))
+  counts = [len(b) for b in boxes]
+  matrix = {'images':images, 'offsets':np.concatenate( ([0], np.cumsum(counts)) ).astype(np.int64)}
+  matrix['boxes'] = np.vstack(boxes).astype(np.float64) if len(boxes) > 0 else np.zeros( (0,4) )
+  matrix['scores'] = np.vstack(scores).astype(np.float64) if len(scores) > 0 else np.zeros( (0,21) )
+  matrix['values'] = np.concatenate(values).astype(np.float64) if len(values) > 0 else np.zeros( (0) )
+  matrix['actions'] = np.concatenate(actions) if len(actions) > 0 else np.zeros( (0), np.int32 )
+  print 'Loaded',len(images),'images with',len(matrix['boxes']),'detections'
+  return matrix
+
+def categoryScores(matrix, catI):
+  # Same output of loadScores for one category
+  landmarks = np.where(matrix['actions'] == 8, matrix['values'], float('-inf'))
+  scoredDetections = {}
+  for i in range(len(matrix['images'])):
+    rows = slice(matrix['offsets'][i], matrix['offsets'][i+1])
+    scoredDetections[matrix['images'][i]] = {'boxes':matrix['boxes'][rows].tolist(), 'scores':matrix['scores'][rows,catI].tolist(),
+        'values':matrix['values'][rows].tolist(), 'landmarks':landmarks[rows].tolist()}
+  return scoredDetections
+
+# groundTruthFiles maps category indices to ground truth files. Categories are
+# evaluated by a pool of processes forked after loading the matrix, which they
+# share copy-on-write. Returns {catI:{ranking:(precision,recall)}}.
+def evaluateAllCategories(memDir, groundTruthFiles, rankings=['scores','landmarks'], output=None, numProcs=None):
+  matrix = loadScoreMatrix(memDir)
+  def task(catI):
+    scoredDetections = categoryScores(matrix, catI)
+    out = output + '.' + str(catI) if output is not None else None
+    return [ (catI, dict([ (r,evaluateCategory(scoredDetections, r, groundTruthFiles[catI], out)) for r in rankings ])) ]
+  if numProcs is None:
+    numProcs = multiprocessing.cpu_count()
+  categories = sorted(groundTruthFiles.keys())
+  return dict( mp.processData(categories, task, min(numProcs, len(categories))) )
+
+def printCategoryTable(table, categories, rankings=['scores','landmarks'], out=sys.stdout):
+  out.write('Category\t' + '\t'.join([r + ' P\t' + r + ' R' for r in rankings]) + '\n')
+  for catI in sorted(table.keys()):
+    out.write(categories[catI] + '\t' + '\t'.join(['{:5.3f}\t{:5.3f}'.format(*table[catI][r]) for r in rankings]) + '\n')
+  for r in rankings:
+    avg = np.average([table[c][r] for c in table.keys()], axis=0)
+    out.write('Average ' + r + '\t{:5.3f}\t{:5.3f}\n'.format(avg[0], avg[1]))
+
 def evaluateCategory(scoredDetections, ranking, groundTruthFile, output=None):
   performance = []
   detections = []
@@ -101,6 +189,16 @@ if __name__ == "__main__":
   elif params['catIndex'] == 'finetunedRelations':
     categories, catIndex = getRelationCategories()
 
+  if params['category'] == 'all':
+    # Every category with ground truth, from one load of the test memory
+    rankings = ['scores','values','landmarks']
+    groundTruthFiles = dict( [(i, params['groundTruthDir'] + '/' + categories[i] + '_test_bboxes.txt') for i in catIndex] )
+    table = evaluateAllCategories(params['testMemDir'], groundTruthFiles, rankings, params['outputDir'] + '/all.out')
+    out = open(params['outputDir'] + '/evaluation.txt','w')
+    printCategoryTable(table, categories, rankings, out)
+    out.close()
+    sys.exit()
+
   catI = categories.index(params['category'])
   scoredDetections = loadScores(params['testMemDir'], catI)
   
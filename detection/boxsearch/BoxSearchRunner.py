@@ -7,21 +7,50 @@ from pybrain.rl.learners import Q, SARSA
 from pybrain.rl.experiments import Experiment
 
 import shutil
+import numpy as np
+from multiprocessing import Process, Queue
 
 class BoxSearchRunner():
 
-  def __init__(self, mode):
+  def __init__(self, mode, cnn=None):
     self.mode = mode
+    # Read here, the configuration is loaded after this module is imported
+    self.parallelEpisodes = config.geti('parallelEpisodes', 1)
+    self.actorProcesses = config.geti('actorProcesses', 0)
+    self.explorationWorkers = config.geti('explorationWorkers', 0)
+    self.backgroundValidation = config.geti('backgroundValidation', 0) > 0
     cu.mem('Reinforcement Learning Started')
-    self.environment = BoxSearchEnvironment(config.get(mode+'Database'), mode, config.get(mode+'GroundTruth'))
+    self.actorLearner = None
+    self.explorers = None
+    self.validator = None
+    if mode == 'train' and self.backgroundValidation:
+      # Forked before any network is loaded, see BackgroundValidator
+      self.validator = BackgroundValidator()
+    if mode == 'train' and self.actorProcesses > 0:
+      # Actor and learner processes are forked before any network is loaded
+      numImages = len([x for x in open(config.get('trainDatabase'))])
+      self.actorLearner = ActorLearner(numImages, config.geti('trainInteractions'), self.actorProcesses)
+    elif mode == 'train' and self.explorationWorkers > 0:
+      numImages = len([x for x in open(config.get('trainDatabase'))])
+      self.explorers = ActorLearner(numImages, config.geti('trainInteractions'), self.explorationWorkers, learner=False)
+    self.environment = BoxSearchEnvironment(config.get(mode+'Database'), mode, config.get(mode+'GroundTruth'), cnn)
     self.controller = QNetwork()
     cu.mem('QNetwork controller created')
     self.learner = None
     self.agent = BoxSearchAgent(self.controller, self.learner)
     self.task = BoxSearchTask(self.environment, config.get(mode+'GroundTruth'))
     self.experiment = Experiment(self.task, self.agent)
+    if self.parallelEpisodes > 1:
+      self.vectorEnvironment = VectorizedBoxSearchEnvironment(config.get(mode+'Database'), mode, config.get(mode+'GroundTruth'), self.parallelEpisodes, self.environment.cnn)
+      self.vectorAgents = [BoxSearchAgent(self.controller) for i in range(self.parallelEpisodes)]
 
   def runEpoch(self, interactions, maxImgs):
+    if self.actorLearner != None:
+      return self.actorLearner.runEpoch(self.controller.epsilon, interactions, maxImgs, self.task)
+    if self.explorers != None:
+      return self.explorers.runEpoch(self.controller.epsilon, interactions, maxImgs, self.task)
+    if self.parallelEpisodes > 1:
+      return self.runEpochVectorized(interactions, maxImgs)
     img = 0
     s = cu.tic()
     while img < maxImgs:
@@ -34,11 +63,52 @@ class BoxSearchRunner():
       self.environment.loadNextEpisode()
       img += 1
     s = cu.toc('Run epoch with ' + str(maxImgs) + ' episodes', s)
+    self.environment.cnn.cache.report()
+    self.environment.cnn.cache.resetCounters()
+
+  def runEpochVectorized(self, interactions, maxImgs):
+    env = self.vectorEnvironment
+    agents = self.vectorAgents
+    for agent in agents:
+      agent.replayMemory = self.agent.replayMemory
+    s = cu.tic()
+    img = 0
+    for i in range(env.slots):
+      if img < maxImgs and env.loadEpisode(i):
+        img += 1
+    while env.active.any():
+      slots = np.where(env.active)[0]
+      observations = env.getSensors()
+      for i in slots:
+        agents[i].integrateObservation(observations[i])
+      # One Q-network forward pass for all active slots
+      states = np.vstack( [agents[i].getObservation() for i in slots] )
+      values = self.controller.getActionValuesBatch(states, [env.sampler(i) for i in slots])
+      actions = dict( [(slots[j], agents[slots[j]].setActionValues(values[j:j+1,:])) for j in range(len(slots))] )
+      rewards = env.performActions(actions)
+      for i in slots:
+        agents[i].giveReward(rewards[i])
+        if env.episodeDone[i] or env.steps[i] >= interactions:
+          self.agent.learn()
+          agents[i].reset()
+          env.finishEpisode(i)
+          if img < maxImgs and env.loadEpisode(i):
+            img += 1
+    s = cu.toc('Run epoch with ' + str(maxImgs) + ' episodes in ' + str(env.slots) + ' parallel slots', s)
+    self.environment.cnn.cache.report()
+    self.environment.cnn.cache.resetCounters()
+
+  def flushStats(self):
+    if self.parallelEpisodes > 1 and self.actorLearner == None and self.explorers == None:
+      self.vectorEnvironment.flushStats()
+    else:
+      self.task.flushStats()
 
   def run(self):
     if self.mode == 'train':
       self.agent.persistMemory = True
-      self.agent.startReplayMemory(len(self.environment.imageList), config.geti('trainInteractions'))
+      if self.actorLearner == None:
+        self.agent.startReplayMemory(len(self.environment.imageList), config.geti('trainInteractions'))
       #self.agent.assignPriorMemory(self.environment.priorMemory)
       self.train()
     elif self.mode == 'test':
@@ -58,11 +128,16 @@ class BoxSearchRunner():
       s = cu.tic()
       print 'Epoch',epoch,': Exploration (epsilon=1.0)'
       self.runEpoch(interactions, len(self.environment.imageList))
-      self.task.flushStats()
+      self.flushStats()
       s = cu.toc('Epoch done in ',s)
       epoch += 1
-    self.learner = QLearning()
-    self.agent.learner = self.learner
+    if self.actorLearner != None:
+      self.actorLearner.startLearner()
+    else:
+      self.learner = QLearning()
+      self.agent.learner = self.learner
+    if self.explorers != None:
+      self.collectExplorationMemory()
     egEpochs = config.geti('epsilonGreedyEpochs')
     while epoch <= egEpochs + exEpochs:
       s = cu.tic()
@@ -71,7 +146,8 @@ class BoxSearchRunner():
       self.controller.setEpsilonGreedy(epsilon, self.environment.sampleAction)
       print 'Epoch',epoch ,'(epsilon-greedy:{:5.3f})'.format(epsilon)
       self.runEpoch(interactions, epochSize)
-      self.task.flushStats()
+      self.flushStats()
+      self.saveNetwork(networkFile)
       self.doValidation(epoch)
       s = cu.toc('Epoch done in ',s)
       epoch += 1
@@ -80,22 +156,90 @@ class BoxSearchRunner():
       s = cu.tic()
       print 'Epoch',epoch,'(exploitation mode: epsilon={:5.3f})'.format(epsilon)
       self.runEpoch(interactions, epochSize)
-      self.task.flushStats()
+      self.flushStats()
+      self.saveNetwork(networkFile)
       self.doValidation(epoch)
       s = cu.toc('Epoch done in ',s)
       shutil.copy(networkFile, networkFile + '.' + str(epoch))
       epoch += 1
+    if self.actorLearner != None:
+      self.actorLearner.stop()
+    if self.validator != None:
+      self.validator.stop()
+
+  def collectExplorationMemory(self):
+    # Experience of the exploration pool goes to the replay memory of the
+    # agent. As in serial exploration (no learner yet), nothing is learned
+    # until the first epsilon-greedy episode
+    s = cu.tic()
+    self.explorers.memory.copyTo(self.agent.replayMemory)
+    self.explorers.stop()
+    self.explorers = None
+    s = cu.toc('Collected exploration memory with ' + str(self.agent.replayMemory.usableRecords) + ' records', s)
+
+  def saveNetwork(self, networkFile):
+    # Disk checkpoints are only written at epoch boundaries
+    if self.actorLearner != None:
+      self.actorLearner.saveNetwork(networkFile)
+    elif self.learner != None:
+      self.learner.saveNetwork(networkFile)
 
   def test(self):
     interactions = config.geti('testInteractions')
     self.controller.setEpsilonGreedy(config.getf('testEpsilon'))
     self.runEpoch(interactions, len(self.environment.imageList))
+    if self.parallelEpisodes > 1:
+      self.vectorEnvironment.flushTestMemory()
+    else:
+      self.environment.flushTestMemory()
+
+  def restart(self):
+    # Prepares a test runner to go through its image list again
+    self.environment.restart()
+    if self.parallelEpisodes > 1:
+      self.vectorEnvironment.restart()
 
   def doValidation(self, epoch):
     if epoch % config.geti('validationEpochs') != 0:
       return
-    auxRL = BoxSearchRunner('test')
-    auxRL.run()
+    # Snapshot of the current weights (in actor/learner mode, the saved network)
+    weights = self.learner.getWeights() if self.learner != None else None
+    if self.validator == None:
+      self.validator = Validator(self.environment.cnn)
+    self.validator.validate(epoch, weights)
+
+########################################
+## VALIDATION
+########################################
+# The test runner is built once and reused in every validation: its
+# environment shares the feature backend of the training environment, and the
+# Q-network receives a snapshot of the learner weights instead of reloading
+# them from disk.
+class Validator():
+
+  def __init__(self, cnn=None):
+    self.cnn = cnn
+    self.runner = None
+
+  def validate(self, epoch, weights):
+    s = cu.tic()
+    context = self.cnn.getContext() if self.cnn is not None else None
+    if self.runner == None:
+      self.runner = BoxSearchRunner('test', self.cnn)
+    else:
+      self.runner.restart()
+    if weights is not None:
+      self.runner.controller.setWeights(weights, updateTarget=False)
+    else:
+      self.runner.controller.loadNetwork()
+    self.runner.run()
+    if context is not None:
+      # Give the backend back to the training episode
+      self.cnn.setContext(context)
+    self.evaluate(epoch)
+    s = cu.toc('Validation of epoch ' + str(epoch) + ' done in', s)
+
+  def evaluate(self, epoch):
     indexType = config.get('evaluationIndexType')
     category = config.get('category')
     if indexType == 'pascal':
@@ -104,6 +248,14 @@ class BoxSearchRunner():
       categories, catIndex = bse.getCategories()
     elif indexType == 'finetunedRelations':
       categories, catIndex = bse.getRelationCategories()
+    print 'Validation of epoch',epoch
+    groundTruthDir = config.get('validationGroundTruthDir', default='')
+    if groundTruthDir != '':
+      # Report all categories with one load of the test memory
+      groundTruthFiles = dict( [(i, groundTruthDir + '/' + categories[i] + '_test_bboxes.txt') for i in catIndex] )
+      table = bse.evaluateAllCategories(config.get('testMemory'), groundTruthFiles)
+      bse.printCategoryTable(table, categories)
+      return
     catI = categories.index(category)
     scoredDetections = bse.loadScores(config.get('testMemory'), catI)
     groundTruthFile = config.get('testGroundTruth')
@@ -113,6 +265,35 @@ class BoxSearchRunner():
     print line('Validation Scores:',ps,rs)
     print line('Validation Landmarks:',pl,rl)
 
+  def stop(self):
+    return
+
+# Validates in a separate process, so the next training epoch starts at once.
+# Every request carries a frozen copy of the weights; results are logged by
+# the validation process when they are ready. The process owns its own
+# backend, so it is forked before the trainer loads any network.
+def validationProcess(requests):
+  validator = Validator()
+  for epoch,weights in iter(requests.get, 'stop'):
+    validator.validate(epoch, weights)
+
+class BackgroundValidator():
+
+  def __init__(self):
+    self.requests = Queue()
+    self.process = Process(target=validationProcess, args=(self.requests,))
+    self.process.daemon = True
+    self.process.start()
+
+  def validate(self, epoch, weights):
+    self.requests.put( (epoch, weights) )
+    print 'Validation of epoch',epoch,'sent to the background'
+
+  def stop(self):
+    # Pending validations finish before training returns
+    self.requests.put('stop')
+    self.process.join()
+
 
 #def main():
 if __name__ == "__main__":
@@ -126,6 +307,8 @@ if __name__ == "__main__":
   from QNetwork import QNetwork
   from QLearning import QLearning
   from BoxSearchEnvironment import BoxSearchEnvironment
+  from VectorizedBoxSearchEnvironment import VectorizedBoxSearchEnvironment
+  from ActorLearner import ActorLearner
   from BoxSearchTask import BoxSearchTask
   from BoxSearchAgent import BoxSearchAgent
   import BoxSearchEvaluation as bse
@@ -3,8 +3,9 @@ __author__ = "Juan C. Caicedo, caicedo@illinois.edu"
 import time
 import utils.utils as cu
 import utils.libDetection as det
+import utils.ringBuffer as rb
+import utils.imageCache as ic
 import numpy as np
-import Image
 import random
 
 import BoxSearchTask as bst
@@ -31,17 +32,95 @@ DELTA_SIZE       = config.getf('boxResizeStep')
 
 # OTHER DEFINITIONS
 NUM_ACTIONS = config.geti('outputActions')
+ACTION_CODES = np.eye(NUM_ACTIONS, dtype=np.float32)
 RESET_BOX_FACTOR = 2
 QUADRANT_SIZE = 0.7
 
 def fingerprint(b):
   return '_'.join( map(str, map(int, b)) )
 
+########################################
+## TRANSITION KERNEL
+########################################
+# Change of each coordinate for the 8 box moves (X_COORD_UP ... ASPECT_RATIO_DOWN)
+# in units of the box size (w,h,w,h). Rows are scaled by the step of each move.
+MOVE_DIRECTIONS = np.array([ [ 1.0, 0.0, 1.0, 0.0], [ 0.0, 1.0, 0.0, 1.0], [-0.5,-0.5, 0.5, 0.5], [ 0.0,-0.5, 0.0, 0.5],
+                             [-1.0, 0.0,-1.0, 0.0], [ 0.0,-1.0, 0.0,-1.0], [ 0.5, 0.5,-0.5,-0.5], [-0.5, 0.0, 0.5, 0.0] ])
+
+def scaleUpDelta(w, h, W, H):
+  # Preserves aspect ratio
+  if w + DELTA_SIZE*w < W:
+    if h + DELTA_SIZE*h < H: return DELTA_SIZE
+    else: return H/h - 1
+  newDelta = W/w - 1
+  if h + newDelta*h >= H:
+    newDelta = H/h - 1
+  return newDelta
+
+def scaleDownDelta(w, h):
+  # Preserves aspect ratio
+  if w - DELTA_SIZE*w >= MIN_BOX_SIDE:
+    if h - DELTA_SIZE*h >= MIN_BOX_SIDE: return DELTA_SIZE
+    else: return MIN_BOX_SIDE/h - 1
+  newDelta = MIN_BOX_SIDE/w - 1
+  if h - newDelta*h < MIN_BOX_SIDE:
+    newDelta = MIN_BOX_SIDE/h - 1
+  return newDelta
+
+def aspectRatioUpDelta(w, h, H):
+  # Preserves width
+  if h + DELTA_SIZE*h < H:
+    return DELTA_SIZE if (h + DELTA_SIZE*h)/w < MAX_ASPECT_RATIO else 0.0
+  newDelta = H/h - 1
+  return newDelta if (h + newDelta*h)/w <= MAX_ASPECT_RATIO else 0.0
+
+def aspectRatioDownDelta(w, h, W):
+  # Preserves height
+  if w + DELTA_SIZE*w < W:
+    return DELTA_SIZE if h/(w + DELTA_SIZE*w) >= MIN_ASPECT_RATIO else 0.0
+  newDelta = W/w - 1
+  return newDelta if h/(w + newDelta*w) >= MIN_ASPECT_RATIO else 0.0
+
+def adjustAndClip(boxes, W, H):
+  # Boxes crossing the image border are shifted back inside, or span the
+  # whole side of the image when they do not fit
+  for lo,hi,size in [(0,2,W),(1,3,H)]:
+    step = -boxes[:,lo]
+    under = boxes[:,lo] < 0
+    fits = boxes[:,hi] + step < size
+    shift, span = under & fits, under & ~fits
+    boxes[shift,lo] += step[shift]
+    boxes[shift,hi] += step[shift]
+    boxes[span,lo] = 0
+    boxes[span,hi] = size - 1
+    step = boxes[:,hi] - size
+    over = boxes[:,hi] >= size
+    fits = boxes[:,lo] - step >= 0
+    shift, span = over & fits, over & ~fits
+    boxes[shift,lo] -= step[shift]
+    boxes[shift,hi] -= step[shift]
+    boxes[span,lo] = 0
+    boxes[span,hi] = size - 1
+  return boxes
+
+# Next box of each move from a box with size (w,h) in an image of size (W,H): 8x4 array
+def transitionKernel(box, w, h, W, H):
+  box = np.asarray(box, np.float64)
+  steps = np.array([STEP_FACTOR, STEP_FACTOR, scaleUpDelta(w,h,W,H), aspectRatioUpDelta(w,h,H),
+                    STEP_FACTOR, STEP_FACTOR, scaleDownDelta(w,h), aspectRatioDownDelta(w,h,W)])
+  boxes = box + MOVE_DIRECTIONS*np.array([w,h,w,h])*steps[:,np.newaxis]
+  # Translations that leave the image stop at the border and preserve width and height
+  if not box[0] + STEP_FACTOR*w + w < W: boxes[X_COORD_UP,[0,2]] = [W - w - 1, W - 1]
+  if not box[1] + STEP_FACTOR*h + h < H: boxes[Y_COORD_UP,[1,3]] = [H - h - 1, H - 1]
+  if not box[0] - STEP_FACTOR*w >= 0: boxes[X_COORD_DOWN,[0,2]] = [0, w]
+  if not box[1] - STEP_FACTOR*h >= 0: boxes[Y_COORD_DOWN,[1,3]] = [0, h]
+  return adjustAndClip(boxes, W, H)
+
 class BoxSearchState():
 
   def __init__(self, imageName, boxReset='Full', groundTruth=None):
     self.imageName = imageName
-    self.visibleImage = Image.open(config.get('imageDir') + '/' + self.imageName + '.jpg')
+    self.imageSize = ic.imageSize(config.get('imageDir') + '/' + self.imageName + '.jpg')
     self.box = [0,0,0,0]
     self.resets = 1
     self.reset(boxReset)
@@ -54,22 +133,16 @@ class BoxSearchState():
       self.taskSimulator.groundTruth = self.groundTruth
       self.taskSimulator.loadGroundTruth(self.imageName)
     self.stepsWithoutLandmark = 0
-    self.actionHistory = [0 for i in range(NUM_ACTIONS*config.geti('actionHistoryLength'))]
+    # One-hot codes of the last actions, the most recent first
+    self.actionHistory = rb.RingBuffer(config.geti('actionHistoryLength'), (NUM_ACTIONS,), np.float32)
 
   def performAction(self, action):
     self.actionChosen = action[0]
     self.actionValue = action[1]
     self.stepsWithoutLandmark += 1
-    self.actionHistory = [1 if x == action[0] else 0 for x in range(NUM_ACTIONS)] + self.actionHistory[:-NUM_ACTIONS]
+    self.actionHistory.push(ACTION_CODES[action[0]])
 
-    if action[0] == X_COORD_UP:           newBox = self.xCoordUp()
-    elif action[0] == Y_COORD_UP:         newBox = self.yCoordUp()
-    elif action[0] == SCALE_UP:           newBox = self.scaleUp()
-    elif action[0] == ASPECT_RATIO_UP:    newBox = self.aspectRatioUp()
-    elif action[0] == X_COORD_DOWN:       newBox = self.xCoordDown()
-    elif action[0] == Y_COORD_DOWN:       newBox = self.yCoordDown()
-    elif action[0] == SCALE_DOWN:         newBox = self.scaleDown()
-    elif action[0] == ASPECT_RATIO_DOWN:  newBox = self.aspectRatioDown()
+    if action[0] < PLACE_LANDMARK:        newBox = self.moveBoxes()[action[0]].tolist()
     elif action[0] == PLACE_LANDMARK:     newBox = self.placeLandmark()
     if NUM_ACTIONS == 10 and action[0] == SKIP_REGION:        newBox = self.skipRegion()
 
@@ -79,176 +152,8 @@ class BoxSearchState():
     self.taskSimulator.computeObjectReward(self.box, self.actionChosen)
     return self.box
 
-  def xCoordUp(self):
-    newBox = self.box[:]
-    step = STEP_FACTOR*self.boxW
-    # This action preserves box width and height
-    if self.box[0] + step + self.boxW < self.visibleImage.size[0]:
-      newBox[0] += step
-      newBox[2] += step
-    else:
-      newBox[0] = self.visibleImage.size[0] - self.boxW - 1
-      newBox[2] = self.visibleImage.size[0] - 1
-    return self.adjustAndClip(newBox)
-
-  def yCoordUp(self):
-    newBox = self.box[:]
-    step = STEP_FACTOR*self.boxH
-    # This action preserves box width and height
-    if self.box[1] + step + self.boxH < self.visibleImage.size[1]:
-      newBox[1] += step
-      newBox[3] += step
-    else:
-      newBox[1] = self.visibleImage.size[1] - self.boxH - 1
-      newBox[3] = self.visibleImage.size[1] - 1
-    return self.adjustAndClip(newBox)
-
-  def scaleUp(self):
-    newBox = self.box[:]
-    # This action preserves aspect ratio
-    widthChange = DELTA_SIZE*self.boxW
-    heightChange = DELTA_SIZE*self.boxH
-    if self.boxW + widthChange < self.visibleImage.size[0]:
-      if self.boxH + heightChange < self.visibleImage.size[1]:
-        newDelta = DELTA_SIZE
-      else:
-        newDelta = self.visibleImage.size[1]/self.boxH - 1
-    else:
-      newDelta = self.visibleImage.size[0]/self.boxW - 1
-      if self.boxH + newDelta*self.boxH >= self.visibleImage.size[1]:
-        newDelta = self.visibleImage.size[1]/self.boxH - 1
-    widthChange = newDelta*self.boxW/2.0
-    heightChange = newDelta*self.boxH/2.0
-    newBox[0] -= widthChange
-    newBox[1] -= heightChange
-    newBox[2] += widthChange
-    newBox[3] += heightChange
-    return self.adjustAndClip(newBox)
-
-  def aspectRatioUp(self):
-    newBox = self.box[:]
-    # This action preserves width
-    heightChange = DELTA_SIZE*self.boxH
-    if self.boxH + heightChange < self.visibleImage.size[1]:
-      ar = (self.boxH + heightChange)/self.boxW
-      if ar < MAX_ASPECT_RATIO:
-        newDelta = DELTA_SIZE
-      else:
-        newDelta = 0.0
-    else:
-      newDelta = self.visibleImage.size[1]/self.boxH - 1
-      ar = (self.boxH + newDelta*self.boxH)/self.boxW
-      if ar > MAX_ASPECT_RATIO:
-        newDelta =  0.0
-    heightChange = newDelta*self.boxH/2.0
-    newBox[1] -= heightChange
-    newBox[3] += heightChange
-    return self.adjustAndClip(newBox)
-
-  def xCoordDown(self):
-    newBox = self.box[:]
-    step = STEP_FACTOR*self.boxW
-    # This action preserves box width and height
-    if self.box[0] - step >= 0:
-      newBox[0] -= step
-      newBox[2] -= step
-    else:
-      newBox[0] = 0
-      newBox[2] = self.boxW
-    return self.adjustAndClip(newBox)
-
-  def yCoordDown(self):
-    newBox = self.box[:]
-    step = STEP_FACTOR*self.boxH
-    # This action preserves box width and height
-    if self.box[1] - step >= 0:
-      newBox[1] -= step
-      newBox[3] -= step
-    else:
-      newBox[1] = 0
-      newBox[3] = self.boxH
-    return self.adjustAndClip(newBox)
-
-  def scaleDown(self):
-    newBox = self.box[:]
-    # This action preserves aspect ratio
-    widthChange = DELTA_SIZE*self.boxW
-    heightChange = DELTA_SIZE*self.boxH
-    if self.boxW - widthChange >= MIN_BOX_SIDE:
-      if self.boxH - heightChange >= MIN_BOX_SIDE:
-        newDelta = DELTA_SIZE
-      else:
-        newDelta = MIN_BOX_SIDE/self.boxH - 1
-    else:
-      newDelta = MIN_BOX_SIDE/self.boxW - 1
-      if self.boxH - newDelta*self.boxH < MIN_BOX_SIDE:
-        newDelta = MIN_BOX_SIDE/self.boxH - 1
-    widthChange = newDelta*self.boxW/2.0
-    heightChange = newDelta*self.boxH/2.0
-    newBox[0] += widthChange
-    newBox[1] += heightChange
-    newBox[2] -= widthChange
-    newBox[3] -= heightChange
-    return self.adjustAndClip(newBox)
-
-  def aspectRatioDown(self):
-    newBox = self.box[:]
-    # This action preserves height
-    widthChange = DELTA_SIZE*self.boxW
-    if self.boxW + widthChange < self.visibleImage.size[0]:
-      ar = self.boxH/(self.boxW + widthChange)
-      if ar >= MIN_ASPECT_RATIO:
-        newDelta = DELTA_SIZE
-      else:
-        newDelta = 0.0
-    else:
-      newDelta = self.visibleImage.size[0]/self.boxW - 1
-      ar = self.boxH/(self.boxW + newDelta*self.boxW)
-      if ar < MIN_ASPECT_RATIO:
-        newDelta =  0.0
-    widthChange = newDelta*self.boxW/2.0
-    newBox[0] -= widthChange
-    newBox[2] += widthChange
-    return self.adjustAndClip(newBox)
-
-  def adjustAndClip(self, box):
-    if box[0] < 0:
-      # Can we move it to the right?
-      step = -box[0]
-      if box[2] + step < self.visibleImage.size[0]:
-        box[0] += step
-        box[2] += step
-      else:
-        box[0] = 0
-        box[2] = self.visibleImage.size[0] - 1
-    if box[1] < 0:
-      step = -box[1]
-      # Can we move it down?
-      if box[3] + step < self.visibleImage.size[1]:
-        box[1] += step
-        box[3] += step
-      else:
-        box[1] = 0
-        box[3] = self.visibleImage.size[1] - 1
-    if box[2] >= self.visibleImage.size[0]:
-      step = box[2] - self.visibleImage.size[0]
-      # Can we move it to the left?
-      if box[0] - step >= 0:
-        box[0] -= step
-        box[2] -= step
-      else:
-        box[0] = 0
-        box[2] = self.visibleImage.size[0] - 1
-    if box[3] >= self.visibleImage.size[1]:
-      step = box[3] - self.visibleImage.size[1]
-      # Can we move it up?
-      if box[1] - step >= 0:
-        box[1] -= step
-        box[3] -= step
-      else:
-        box[1] = 0
-        box[3] = self.visibleImage.size[1] - 1
-    return box
+  def moveBoxes(self):
+    return transitionKernel(self.box, self.boxW, self.boxH, self.imageSize[0], self.imageSize[1])
 
   def placeLandmark(self):
     self.landmarkIndex[ fingerprint(self.box) ] = self.box[:]
@@ -256,8 +161,8 @@ class BoxSearchState():
     return self.box
 
   def skipRegion(self, updateCounter=True):
-    w = self.visibleImage.size[0]   
-    h = self.visibleImage.size[1]
+    w = self.imageSize[0]   
+    h = self.imageSize[1]
     newBox = self.box[:]
     if self.resets % 4 == 1:
       newBox = map(float, [0,0,w*QUADRANT_SIZE,h*QUADRANT_SIZE])
@@ -276,17 +181,17 @@ class BoxSearchState():
     #oldBox = self.box[:]
     self.stepsWithoutLandmark = 0
     if boxReset == 'Full':
-      self.box = map(float, [0,0,self.visibleImage.size[0]-1,self.visibleImage.size[1]-1])
+      self.box = map(float, [0,0,self.imageSize[0]-1,self.imageSize[1]-1])
       self.boxW = self.box[2]+1.0
       self.boxH = self.box[3]+1.0
     elif boxReset == 'Random':
       # Random Reset:
-      wlimit = self.visibleImage.size[0]/(RESET_BOX_FACTOR*2)
-      hlimit = self.visibleImage.size[1]/(RESET_BOX_FACTOR*2)
-      a = random.randint(wlimit, self.visibleImage.size[0] - wlimit)
-      b = random.randint(hlimit, self.visibleImage.size[1] - hlimit)
-      c = random.randint(wlimit, min(self.visibleImage.size[0] - a, a) )
-      d = random.randint(hlimit, min(self.visibleImage.size[1] - b, b) )
+      wlimit = self.imageSize[0]/(RESET_BOX_FACTOR*2)
+      hlimit = self.imageSize[1]/(RESET_BOX_FACTOR*2)
+      a = random.randint(wlimit, self.imageSize[0] - wlimit)
+      b = random.randint(hlimit, self.imageSize[1] - hlimit)
+      c = random.randint(wlimit, min(self.imageSize[0] - a, a) )
+      d = random.randint(hlimit, min(self.imageSize[1] - b, b) )
       self.box = map(float, [a-c, b-d, a+c, b+d] )
       self.boxW = float(RESET_BOX_FACTOR)*c
       self.boxH = float(RESET_BOX_FACTOR)*d
@@ -296,26 +201,20 @@ class BoxSearchState():
       self.boxW = self.box[2] - self.box[0]
       self.boxH = self.box[3] - self.box[1]
 
+  def candidateBoxes(self):
+    # Boxes reached by each action from the current state, without side effects
+    nextBoxes = self.moveBoxes().tolist() + [self.box[:]]
+    if NUM_ACTIONS == 10: nextBoxes.append( self.skipRegion(False) )
+    return nextBoxes
+
   def sampleNextAction(self):
     if self.groundTruth is None:
       return np.argmax( np.random.random([1, NUM_ACTIONS]), 1 )
     else:
-      nextBoxes = []
-      nextBoxes.append( self.xCoordUp() )
-      nextBoxes.append( self.yCoordUp() )
-      nextBoxes.append( self.scaleUp() )
-      nextBoxes.append( self.aspectRatioUp() )
-      nextBoxes.append( self.xCoordDown() )
-      nextBoxes.append( self.yCoordDown() )
-      nextBoxes.append( self.scaleDown() )
-      nextBoxes.append( self.aspectRatioDown() )
-      nextBoxes.append( self.placeLandmark() )
-      if NUM_ACTIONS == 10: nextBoxes.append( self.skipRegion(False) )
-
-      rewards = []
-      for a in range(len(nextBoxes)):
-        r = self.taskSimulator.computeObjectReward(nextBoxes[a], a, False)
-        rewards.append(r)
+      nextBoxes = self.candidateBoxes()
+      # Sampling visits the landmark action as the per-action evaluation did
+      self.placeLandmark()
+      rewards = self.taskSimulator.computeObjectRewards(nextBoxes, range(len(nextBoxes)))
       positiveActions = [i for i in range(len(nextBoxes)) if rewards[i]  > 0 ]
       negativeActions = [i for i in range(len(nextBoxes)) if rewards[i] <= 0 ]
       value = random.random()
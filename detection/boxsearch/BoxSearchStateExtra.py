@@ -3,8 +3,8 @@ __author__ = "Juan C. Caicedo, caicedo@illinois.edu"
 import time
 import utils.utils as cu
 import utils.libDetection as det
+import utils.imageCache as ic
 import numpy as np
-import Image
 import random
 
 import BoxSearchTask as bst
@@ -41,19 +41,19 @@ class BoxSearchState():
 
   def __init__(self, imageName, randomStart=False, groundTruth=None):
     self.imageName = imageName
-    self.visibleImage = Image.open(config.get('imageDir') + '/' + self.imageName + '.jpg')
+    self.imageSize = ic.imageSize(config.get('imageDir') + '/' + self.imageName + '.jpg')
     if not randomStart:
-      self.box = map(float, [0,0,self.visibleImage.size[0]-1,self.visibleImage.size[1]-1])
+      self.box = map(float, [0,0,self.imageSize[0]-1,self.imageSize[1]-1])
       self.boxW = self.box[2]+1.0
       self.boxH = self.box[3]+1.0
       self.aspectRatio = self.boxH/self.boxW
     else:
-      wlimit = self.visibleImage.size[0]/4
-      hlimit = self.visibleImage.size[1]/4
-      a = random.randint(wlimit, self.visibleImage.size[0] - wlimit)
-      b = random.randint(hlimit, self.visibleImage.size[1] - hlimit)
-      c = random.randint(wlimit, min(self.visibleImage.size[0] - a, a) )
-      d = random.randint(hlimit, min(self.visibleImage.size[1] - b, b) )
+      wlimit = self.imageSize[0]/4
+      hlimit = self.imageSize[1]/4
+      a = random.randint(wlimit, self.imageSize[0] - wlimit)
+      b = random.randint(hlimit, self.imageSize[1] - hlimit)
+      c = random.randint(wlimit, min(self.imageSize[0] - a, a) )
+      d = random.randint(hlimit, min(self.imageSize[1] - b, b) )
       self.box = map(float, [a-c, b-d, a+c, b+d] )
       self.boxW = 2.0*c
       self.boxH = 2.0*d
@@ -94,24 +94,24 @@ class BoxSearchState():
     newBox = self.box[:]
     step = STEP_FACTOR*self.boxW
     # This action preserves box width and height
-    if self.box[0] + step + self.boxW < self.visibleImage.size[0]:
+    if self.box[0] + step + self.boxW < self.imageSize[0]:
       newBox[0] += step
       newBox[2] += step
     else:
-      newBox[0] = self.visibleImage.size[0] - self.boxW - 1
-      newBox[2] = self.visibleImage.size[0] - 1
+      newBox[0] = self.imageSize[0] - self.boxW - 1
+      newBox[2] = self.imageSize[0] - 1
     return self.adjustAndClip(newBox)
 
   def yCoordUp(self):
     newBox = self.box[:]
     step = STEP_FACTOR*self.boxH
     # This action preserves box width and height
-    if self.box[1] + step + self.boxH < self.visibleImage.size[1]:
+    if self.box[1] + step + self.boxH < self.imageSize[1]:
       newBox[1] += step
       newBox[3] += step
     else:
-      newBox[1] = self.visibleImage.size[1] - self.boxH - 1
-      newBox[3] = self.visibleImage.size[1] - 1
+      newBox[1] = self.imageSize[1] - self.boxH - 1
+      newBox[3] = self.imageSize[1] - 1
     return self.adjustAndClip(newBox)
 
   def scaleUp(self):
@@ -119,15 +119,15 @@ class BoxSearchState():
     # This action preserves aspect ratio
     widthChange = DELTA_SIZE*self.boxW
     heightChange = DELTA_SIZE*self.boxH
-    if self.boxW + widthChange < self.visibleImage.size[0]:
-      if self.boxH + heightChange < self.visibleImage.size[1]:
+    if self.boxW + widthChange < self.imageSize[0]:
+      if self.boxH + heightChange < self.imageSize[1]:
         newDelta = DELTA_SIZE
       else:
-        newDelta = self.visibleImage.size[1]/self.boxH - 1
+        newDelta = self.imageSize[1]/self.boxH - 1
     else:
-      newDelta = self.visibleImage.size[0]/self.boxW - 1
-      if self.boxH + newDelta*self.boxH >= self.visibleImage.size[1]:
-        newDelta = self.visibleImage.size[1]/self.boxH - 1
+      newDelta = self.imageSize[0]/self.boxW - 1
+      if self.boxH + newDelta*self.boxH >= self.imageSize[1]:
+        newDelta = self.imageSize[1]/self.boxH - 1
     widthChange = newDelta*self.boxW/2.0
     heightChange = newDelta*self.boxH/2.0
     newBox[0] -= widthChange
@@ -140,14 +140,14 @@ class BoxSearchState():
     newBox = self.box[:]
     # This action preserves width
     heightChange = DELTA_SIZE*self.boxH
-    if self.boxH + heightChange < self.visibleImage.size[1]:
+    if self.boxH + heightChange < self.imageSize[1]:
       ar = (self.boxH + heightChange)/self.boxW
       if ar < MAX_ASPECT_RATIO:
         newDelta = DELTA_SIZE
       else:
         newDelta = 0.0
     else:
-      newDelta = self.visibleImage.size[1]/self.boxH - 1
+      newDelta = self.imageSize[1]/self.boxH - 1
       ar = (self.boxH + newDelta*self.boxH)/self.boxW
       if ar > MAX_ASPECT_RATIO:
         newDelta =  0.0
@@ -206,14 +206,14 @@ class BoxSearchState():
     newBox = self.box[:]
     # This action preserves height
     widthChange = DELTA_SIZE*self.boxW
-    if self.boxW + widthChange < self.visibleImage.size[0]:
+    if self.boxW + widthChange < self.imageSize[0]:
       ar = self.boxH/(self.boxW + widthChange)
       if ar >= MIN_ASPECT_RATIO:
         newDelta = DELTA_SIZE
       else:
         newDelta = 0.0
     else:
-      newDelta = self.visibleImage.size[0]/self.boxW - 1
+      newDelta = self.imageSize[0]/self.boxW - 1
       ar = self.boxH/(self.boxW + newDelta*self.boxW)
       if ar < MIN_ASPECT_RATIO:
         newDelta =  0.0
@@ -226,39 +226,39 @@ class BoxSearchState():
     if box[0] < 0:
       # Can we move it to the right?
       step = -box[0]
-      if box[2] + step < self.visibleImage.size[0]:
+      if box[2] + step < self.imageSize[0]:
         box[0] += step
         box[2] += step
       else:
         box[0] = 0
-        box[2] = self.visibleImage.size[0] - 1
+        box[2] = self.imageSize[0] - 1
     if box[1] < 0:
       step = -box[1]
       # Can we move it down?
-      if box[3] + step < self.visibleImage.size[1]:
+      if box[3] + step < self.imageSize[1]:
         box[1] += step
         box[3] += step
       else:
         box[1] = 0
-        box[3] = self.visibleImage.size[1] - 1
-    if box[2] >= self.visibleImage.size[0]:
-      step = box[2] - self.visibleImage.size[0]
+        box[3] = self.imageSize[1] - 1
+    if box[2] >= self.imageSize[0]:
+      step = box[2] - self.imageSize[0]
       # Can we move it to the left?
       if box[0] - step >= 0:
         box[0] -= step
         box[2] -= step
       else:
         box[0] = 0
-        box[2] = self.visibleImage.size[0] - 1
-    if box[3] >= self.visibleImage.size[1]:
-      step = box[3] - self.visibleImage.size[1]
+        box[2] = self.imageSize[0] - 1
+    if box[3] >= self.imageSize[1]:
+      step = box[3] - self.imageSize[1]
       # Can we move it up?
       if box[1] - step >= 0:
         box[1] -= step
         box[3] -= step
       else:
         box[1] = 0
-        box[3] = self.visibleImage.size[1] - 1
+        box[3] = self.imageSize[1] - 1
     return box
 
   def splitHorizontal(self):
@@ -285,7 +285,7 @@ class BoxSearchState():
     if len(self.splitsQueue) > 0:
       return self.splitsQueue.pop(0)
     else:
-      return [0, 0, self.visibleImage.size[0] - 1, self.visibleImage.size[1] - 1]
+      return [0, 0, self.imageSize[0] - 1, self.imageSize[1] - 1]
 
   def placeLandmark(self):
     return self.box
@@ -98,6 +98,27 @@ class BoxSearchTask(Task):
         reward = -DETECTION_REWARD
     return reward
 
+  # Reward oracle: rewards of several (box, action) pairs without updating the
+  # episode control. Same rules of computeObjectReward with one IoU matrix.
+  def computeObjectRewards(self, boxes, actions):
+    self.cover = []
+    iou, idx = self.matchBoxesArray(boxes)
+    actions = np.asarray(actions)
+    landmark = actions == bss.PLACE_LANDMARK
+    skip = actions == bss.SKIP_REGION
+    improved = iou > np.asarray(self.control['IOU'] + [0.0])[idx]
+    reward = np.zeros( (len(iou)) )
+    reward[~improved & landmark] = np.where(iou[~improved & landmark] < MIN_ACCEPTABLE_IOU, -DETECTION_REWARD, DETECTION_REWARD)
+    reward[~improved & ~landmark] = -1.0
+    reward[improved] = np.where(iou[improved] < 0.5, 1.0, 2.0)
+    reward[skip] = -DETECTION_REWARD
+    # No overlap with any object
+    missed = iou <= 0.0
+    reward[missed] = -1.0
+    reward[missed & landmark] = -DETECTION_REWARD
+    reward[missed & skip] = 0.1
+    return reward
+
   def performAction(self, action):
     Task.performAction(self, action)
 
@@ -128,6 +149,18 @@ class BoxSearchTask(Task):
         maxIdx = i
     return (maxIoU, maxIdx)
 
+  def matchBoxesArray(self, boxes):
+    # Best match of each box among the objects not detected yet (IoU -1 if none)
+    iou = -np.ones( (len(boxes)) )
+    idx = np.zeros( (len(boxes)), np.int64 )
+    done = np.asarray(self.control['DONE'], np.bool)
+    if len(self.boxes) > 0 and not done.all():
+      ious = det.iouMatrix(boxes, self.boxes)
+      ious[:,done] = -np.inf
+      idx = np.argmax(ious, axis=1)
+      iou = ious[np.arange(len(boxes)), idx]
+    return (iou, idx)
+
   def coverSample(self, idx):
     self.control['DONE'][idx] = True
     self.cover = self.boxes[idx][:]
@@ -8,16 +8,19 @@ import caffe
 from caffe import wrapperv0
 
 import learn.rl.RLConfig as config
+from ActivationCache import ActivationBackend
 
 LAYER = config.get('convnetLayer')
 MARK_WIDTH = config.getf('markWidth')
 
-class ConvNet():
+class ConvNet(ActivationBackend):
 
   def __init__(self):
     self.net = None
     self.image = ''
     self.id = 0
+    self.batchSize = config.geti('convnetBatchSize', 1)
+    self.initCache()
     self.loadNetwork()
 
   def loadNetwork(self):
@@ -36,10 +39,14 @@ class ConvNet():
     if self.image != '':
       self.net.caffenet.ReleaseImageData()
     self.image = config.get('imageDir') + image + '.jpg'
+    self.imageName = image
     self.net.caffenet.InitializeImage(self.image, self.imgDim, self.imageMean, self.cropSize)
+    self.resetCovers()
 
-  def getActivations(self, box):
-    boxes = [map(int,box)]
+  def forwardRegions(self, boxes):
+    # The network processes batchSize regions at a time: pad with empty boxes
+    n = len(boxes)
+    boxes = [map(int,box) for box in boxes] + [ [0,0,0,0] for i in range(self.batchSize - n) ]
     self.net.caffenet.ForwardRegions(boxes, self.contextPad)
     outputsImg =  self.net.caffenet.blobs
     #if self.stateContextFactor == 5:
@@ -54,14 +61,14 @@ class ConvNet():
     #    c = w/2
     #  self.net.caffenet.ForwardRegionsOnSource(boxes, int(c), 1)
     #outputsStt =  self.net.caffenet.blobs
-    result = {'prob':outputsImg['prob'].data.squeeze(), LAYER:outputsImg[LAYER].data.squeeze()}
+    result = {'prob':outputsImg['prob'].data[0:n,...].reshape([n,-1]), LAYER:outputsImg[LAYER].data[0:n,...].reshape([n,-1])}
     #result = {'prob':outputsImg['prob'].data.squeeze(), LAYER:outputsImg[LAYER].data.squeeze(), LAYER+'_stt':outputsStt[LAYER].data.squeeze()}
     return result
 
   def coverRegion(self, box, otherImg=None):
     if otherImg is not None:
       boxes = [map(int,box)]
-      self.net.caffenet.CoverRegions(boxes, config.get('imageDir') + otherImg + '.jpg', self.id)
+      self.applyCover(boxes, otherImg)
     else:
       # Create two perpendicular boxes
       w = box[2]-box[0]
@@ -69,7 +76,14 @@ class ConvNet():
       b1 = map(int, [box[0] + w*0.5 - w*MARK_WIDTH, box[1], box[0] + w*0.5 + w*MARK_WIDTH, box[3]])
       b2 = map(int, [box[0], box[1] + h*0.5 - h*MARK_WIDTH, box[2], box[1] + h*0.5 + h*MARK_WIDTH])
       boxes = [b1, b2]
+      self.applyCover(boxes)
+    return True
+
+  def applyCover(self, boxes, source=''):
+    if source != '':
+      self.net.caffenet.CoverRegions(boxes, config.get('imageDir') + source + '.jpg', self.id)
+    else:
       self.net.caffenet.CoverRegions(boxes, '', self.id)
+    self.registerCover(boxes, source)
     self.id += 1
-    return True
 
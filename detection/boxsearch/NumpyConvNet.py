@@ -0,0 +1,74 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import zlib
+import numpy as np
+
+import utils.libDetection as det
+import learn.rl.RLConfig as config
+from ActivationCache import ActivationBackend
+
+LAYER = config.get('convnetLayer')
+
+########################################
+## DETERMINISTIC CPU STAND-IN FOR ConvNet
+########################################
+# Produces the same outputs (prob and the configured layer) as ConvNet from
+# a fixed random projection of box geometry, an image code and the regions
+# covered so far. Identical inputs always give identical activations, which
+# makes the RL loop testable and benchmarkable without Caffe or a GPU.
+DESCRIPTOR_DIM = 16
+IMAGE_SCALE = 500.0
+
+class NumpyConvNet(ActivationBackend):
+
+  # Preparing an image only computes its code
+  cheapContexts = True
+
+  def __init__(self, featureDim=4096, numClasses=21, seed=0):
+    self.id = 0
+    self.batchSize = config.geti('convnetBatchSize', 1)
+    self.featureDim = featureDim
+    self.numClasses = numClasses
+    rng = np.random.RandomState(seed)
+    self.projection = rng.randn(DESCRIPTOR_DIM, featureDim).astype(np.float32)
+    self.classifier = (rng.randn(featureDim, numClasses)/np.sqrt(featureDim)).astype(np.float32)
+    self.coverCode = rng.randn(DESCRIPTOR_DIM).astype(np.float32)
+    self.coverBoxes = np.zeros( (0,4) )
+    self.initCache()
+
+  def prepareImage(self, image):
+    self.imageName = image
+    rng = np.random.RandomState(zlib.crc32(image) & 0xffffffff)
+    self.imageCode = rng.randn(DESCRIPTOR_DIM - 8).astype(np.float32)
+    self.coverBoxes = np.zeros( (0,4) )
+    self.resetCovers()
+
+  def describe(self, boxes):
+    b = np.asarray(boxes, np.float64).reshape( (-1,4) ).astype(np.int64).astype(np.float64)
+    w = b[:,2] - b[:,0] + 1
+    h = b[:,3] - b[:,1] + 1
+    geometry = np.hstack( (b/IMAGE_SCALE, (w/IMAGE_SCALE)[:,np.newaxis], (h/IMAGE_SCALE)[:,np.newaxis],
+        np.sqrt(w*h)[:,np.newaxis]/IMAGE_SCALE, (w/np.maximum(h,1))[:,np.newaxis]) )
+    codes = np.tile(self.imageCode, (len(b),1))
+    descriptors = np.hstack( (geometry, codes) ).astype(np.float32)
+    if len(self.coverBoxes) > 0:
+      covered = det.overlapMatrix(b, self.coverBoxes).sum(axis=1).astype(np.float32)
+      descriptors += covered[:,np.newaxis]*self.coverCode
+    return descriptors
+
+  def forwardRegions(self, boxes):
+    features = np.maximum(np.dot(self.describe(boxes), self.projection), 0)
+    scores = np.dot(features, self.classifier)
+    scores = np.exp(scores - scores.max(axis=1)[:,np.newaxis])
+    prob = scores/scores.sum(axis=1)[:,np.newaxis]
+    return {'prob':prob.astype(np.float32), LAYER:features}
+
+  def coverRegion(self, box, otherImg=None):
+    self.applyCover([map(int,box)], otherImg if otherImg is not None else '')
+    return True
+
+  def applyCover(self, boxes, source=''):
+    self.coverBoxes = np.vstack( (self.coverBoxes, boxes) )
+    self.registerCover(boxes, source)
+    self.id += 1
+
@@ -0,0 +1,126 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+from collections import OrderedDict
+import numpy as np
+
+import learn.rl.RLConfig as config
+
+########################################
+## NUMPY STAND-IN FOR THE Q-NETWORK
+########################################
+# NumpyNet mimics the part of the caffe.Net interface used by QNetwork
+# (inputs, params, forward_all, save), so the acting net, the target net and
+# the in-memory weight handoff can run on CPU without Caffe.
+
+class Blob():
+
+  def __init__(self, data):
+    self.data = data
+
+def hiddenLayers():
+  return map(int, config.get('numpyHiddenLayers', default='1024,1024').split(','))
+
+class NumpyNet():
+
+  def __init__(self, weightsFile=None, seed=0):
+    self.inputs = ['data']
+    self.params = OrderedDict()
+    sizes = [config.geti('stateFeatures')] + hiddenLayers() + [config.geti('outputActions')]
+    rng = np.random.RandomState(seed)
+    for i in range(len(sizes)-1):
+      W = (rng.randn(sizes[i+1], sizes[i])*np.sqrt(2.0/sizes[i])).astype(np.float32)
+      b = np.zeros( (sizes[i+1]), np.float32 )
+      self.params['ip'+str(i+1)] = [Blob(W), Blob(b)]
+    if weightsFile is not None:
+      self.load(weightsFile)
+
+  def forwardLayers(self, x):
+    outputs = [x]
+    layers = self.params.keys()
+    for i in range(len(layers)):
+      W,b = [p.data for p in self.params[layers[i]]]
+      x = np.dot(x, W.T) + b
+      if i < len(layers)-1:
+        x = np.maximum(x, 0)
+      outputs.append(x)
+    return outputs
+
+  def forward_all(self, **kwargs):
+    x = kwargs[self.inputs[0]]
+    x = x.reshape( (x.shape[0], -1) ).astype(np.float32)
+    q = self.forwardLayers(x)[-1]
+    return {'qvalues':q.reshape( (q.shape[0], q.shape[1], 1, 1) )}
+
+  def save(self, filename):
+    with open(filename, 'wb') as out:
+      np.savez(out, **dict([ (l+'_'+str(i),self.params[l][i].data) for l in self.params.keys() for i in range(2) ]))
+
+  def load(self, filename):
+    data = np.load(filename)
+    for l in self.params.keys():
+      for i in range(2):
+        self.params[l][i].data[...] = data[l+'_'+str(i)]
+    data.close()
+
+########################################
+## NUMPY STAND-IN FOR THE CAFFE SOLVER
+########################################
+# Labels follow the layout of the Caffe training net: (action, reward,
+# discounted max Q of the next state). Only the value of the chosen action
+# receives gradient: loss = 0.5*w*(Q(s,a) - reward - discountedMaxNextQ)^2,
+# with importance-sampling weights w from prioritized replay (1 otherwise).
+class NumpyMultiLayerPerceptronManagement():
+
+  def __init__(self, workingDir):
+    self.directory = workingDir
+    self.net = NumpyNet()
+    self.iter = 0
+    self.itersPerEpisode = config.geti('trainingIterationsPerBatch')
+    self.batchSize = config.geti('trainingBatchSize')
+    self.lr = config.getf('learningRate')
+    self.baseLR = self.lr
+    self.stepSize = config.geti('stepSize')
+    self.gamma = config.getf('gamma')
+    self.momentum = config.getf('momentum')
+    self.weightDecay = config.getf('weightDecay')
+    self.history = OrderedDict([ (l,[np.zeros_like(p.data) for p in self.net.params[l]]) for l in self.net.params.keys() ])
+    print 'NUMPY SOLVER INITALIZED'
+
+  def trainBatch(self, x, labels, weights):
+    outputs = self.net.forwardLayers(x)
+    q = outputs[-1]
+    actions = labels[:,0].astype(np.int64)
+    rows = np.arange(len(actions))
+    delta = np.zeros_like(q)
+    delta[rows,actions] = weights*(q[rows,actions] - labels[:,1] - labels[:,2])/len(actions)
+    layers = self.net.params.keys()
+    for i in reversed(range(len(layers))):
+      W,b = [p.data for p in self.net.params[layers[i]]]
+      gradW = np.dot(delta.T, outputs[i]) + self.weightDecay*W
+      gradb = delta.sum(axis=0)
+      if i > 0:
+        delta = np.dot(delta, W)*(outputs[i] > 0)
+      for p,g,h in zip([W,b], [gradW,gradb], self.history[layers[i]]):
+        h *= self.momentum
+        h += self.lr*g
+        p -= h
+
+  def doNetworkTraining(self, samples, labels, weights=None):
+    samples = samples.reshape( (samples.shape[0], -1) )
+    labels = labels.reshape( (labels.shape[0], -1) )
+    if weights is None:
+      weights = np.ones( (samples.shape[0]), np.float32 )
+    for i in range(self.itersPerEpisode):
+      s = (i*self.batchSize) % samples.shape[0]
+      self.trainBatch(samples[s:s+self.batchSize], labels[s:s+self.batchSize], weights[s:s+self.batchSize])
+    self.iter += self.itersPerEpisode
+    if self.iter % self.stepSize == 0:
+      self.lr = self.baseLR * ( self.gamma** int(self.iter/self.stepSize) )
+      print 'Changing LR to:',self.lr
+
+  def getWeights(self):
+    return OrderedDict([ (l,[p.data.copy() for p in self.net.params[l]]) for l in self.net.params.keys() ])
+
+  def saveNetwork(self, filename):
+    self.net.save(filename)
+
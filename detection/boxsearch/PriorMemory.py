@@ -23,18 +23,24 @@ class PriorMemory():
         boxes = self.allObjects[key]
         cover = False
       convnet.prepareImage(key)
-      for box in boxes:
-        if cover:
+      if cover:
+        # Each box is computed after covering itself and all previous boxes
+        for box in boxes:
           convnet.coverRegion(box)
-        activations = convnet.getActivations(box)
-        self.N[idx,:] = activations[config.get('convnetLayer')]
-        idx += 1
+          activations = convnet.getActivations(box)
+          self.N[idx,:] = activations[config.get('convnetLayer')]
+          idx += 1
+      else:
+        activations = convnet.getActivationsBatch(boxes)
+        self.N[idx:idx+len(boxes),:] = activations[config.get('convnetLayer')]
+        idx += len(boxes)
     # Populate positive examples
     print '# Processing',positiveSamples,'positive prior samples'
     idx = 0
     for key in self.categoryObjects.keys():
       convnet.prepareImage(key)
-      for box in self.categoryObjects[key]:
-        activations = convnet.getActivations(box)
-        self.P[idx,:] = activations[config.get('convnetLayer')]
+      boxes = self.categoryObjects[key]
+      activations = convnet.getActivationsBatch(boxes)
+      self.P[idx:idx+len(boxes),:] = activations[config.get('convnetLayer')]
+      idx += len(boxes)
 
@@ -4,10 +4,15 @@ import os
 import random
 import numpy as np
 import scipy.io
-import caffe
+try:
+  import caffe
+except ImportError:
+  print 'Error loading caffe, only the numpy Q-network backend is available'
 
 import learn.rl.RLConfig as config
 import BoxSearchState as bs
+import NumpyQNetwork as nqn
+import QNetwork as qn
 from pybrain.rl.learners.valuebased.valuebased import ValueBasedLearner
 
 DETECTION_REWARD = config.getf('detectionReward')
@@ -34,37 +39,41 @@ class QLearning(ValueBasedLearner):
     ValueBasedLearner.__init__(self)
     self.alpha = alpha
     self.gamma = config.getf('gammaDiscountReward')
-    self.netManager = CaffeMultiLayerPerceptronManagement(config.get('networkDir'))
+    if config.get('qnetworkBackend', default='caffe') == 'numpy':
+      self.netManager = nqn.NumpyMultiLayerPerceptronManagement(config.get('networkDir'))
+    else:
+      self.netManager = CaffeMultiLayerPerceptronManagement(config.get('networkDir'))
 
   def learn(self, memory, controller):
-    print '# Identify memory records stored by the agent',memory.O.shape, memory.A.shape,memory.R.shape
-    totalMemorySize = memory.usableRecords
+    print '# Identify memory records stored by the agent',memory.usableRecords, memory.A.shape,memory.R.shape
 
     print '# Select a random sample of records'
-    recordsToPull = [random.randint(0,totalMemorySize-2) for i in range(REPLAY_MEMORY_SIZE)]
-    samples = np.zeros( (REPLAY_MEMORY_SIZE, memory.O.shape[1], 1, 1), np.float32 )
+    recordsToPull, weights = memory.sample(REPLAY_MEMORY_SIZE)
+    samples = memory.observations(recordsToPull).reshape( (REPLAY_MEMORY_SIZE, -1, 1, 1) )
     targets = np.zeros( (REPLAY_MEMORY_SIZE, 3, 1, 1), np.float32 )
-    nextStates = np.zeros( (REPLAY_MEMORY_SIZE, memory.O.shape[1], 1, 1), np.float32 )
-    trainingSet = []
-    terminalStates = []
-    for i in range(len(recordsToPull)):
-      r = recordsToPull[i]
-      # Make sure that next state belongs to the same image
-      if memory.I[r] != memory.I[r+1]:
-        terminalStates.append(i) 
-      samples[i,:,0,0] = memory.O[r,:]
-      nextStates[i,:,0,0] = memory.O[r+1,:]
-      action = memory.A[r,0]
-      reward = memory.R[r,0]
-      targets[i,:,0,0] = np.array([action, reward, 0.0], np.float32)
+    targets[:,0,0,0] = memory.A[recordsToPull,0]
+    targets[:,1,0,0] = memory.R[recordsToPull,0]
+    # Make sure that next state belongs to the same image
+    terminalStates = memory.terminalStates(recordsToPull)
     if controller.net != None:
-      controller.loadNetwork(definition='deploy.maxq.prototxt')
-      discountedMaxNextQ = self.gamma*np.max( controller.getActivations(nextStates), axis=1 )
+      nextStates = memory.observations(memory.nextRecords(recordsToPull)).reshape( (REPLAY_MEMORY_SIZE, -1, 1, 1) )
+      discountedMaxNextQ = self.gamma*np.max( controller.getTargetActivations(nextStates), axis=1 )
       discountedMaxNextQ[terminalStates] = 0.0
       targets[:,2,0,0] = discountedMaxNextQ
+    if weights is not None:
+      memory.updatePriorities(recordsToPull, self.temporalDifferences(samples, targets, controller))
 
     print '# Update network'
-    self.netManager.doNetworkTraining(samples, targets)
+    self.netManager.doNetworkTraining(samples, targets, weights)
+
+  def temporalDifferences(self, samples, targets, controller):
+    # TD errors of the sampled records under the acting network
+    targetValues = targets[:,1,0,0] + targets[:,2,0,0]
+    if controller.net == None:
+      return targetValues
+    actions = targets[:,0,0,0].astype(np.int64)
+    qvalues = controller.getActivations(samples.reshape( (samples.shape[0], -1) ))
+    return targetValues - qvalues[np.arange(len(actions)), actions]
 
   def learnFromPriors(self, priors):
     print '# Prior records given to the agent', priors.N.shape, priors.P.shape
@@ -90,6 +99,12 @@ class QLearning(ValueBasedLearner):
     np.random.shuffle(samples)
     self.netManager.doNetworkTraining(samples, targets)
 
+  def getWeights(self):
+    return self.netManager.getWeights()
+
+  def saveNetwork(self, filename):
+    self.netManager.saveNetwork(filename)
+
 
 class CaffeMultiLayerPerceptronManagement():
 
@@ -104,7 +119,11 @@ class CaffeMultiLayerPerceptronManagement():
     self.gamma = config.getf('gamma')
     print 'CAFFE SOLVER INITALIZED'
 
-  def doNetworkTraining(self, samples, labels):
+  def doNetworkTraining(self, samples, labels, weights=None):
+    if weights is not None:
+      # The training net has no per-sample loss weights: resample the batch instead
+      rows = np.random.choice(samples.shape[0], samples.shape[0], p=weights/weights.sum())
+      samples, labels = samples[rows], labels[rows]
     self.solver.net.set_input_arrays(samples, labels)
     self.solver.solve()
     self.iter += config.geti('trainingIterationsPerBatch')
@@ -113,6 +132,12 @@ class CaffeMultiLayerPerceptronManagement():
       print 'Changing LR to:',newLR
       self.solver.change_lr(newLR)
 
+  def getWeights(self):
+    return qn.getWeights(self.solver.net)
+
+  def saveNetwork(self, filename):
+    self.solver.net.save(filename)
+
   def writeSolverFile(self):
     out = open(self.directory + '/solver.prototxt','w')
     out.write('train_net: "' + self.directory + 'train.prototxt"\n')
@@ -124,7 +149,8 @@ class CaffeMultiLayerPerceptronManagement():
     out.write('max_iter: ' + config.get('trainingIterationsPerBatch') + '\n')
     out.write('momentum: ' + config.get('momentum') + '\n')
     out.write('weight_decay: ' + config.get('weightDecay') + '\n')
-    out.write('snapshot: ' + config.get('trainingIterationsPerBatch') + '\n')
+    # Weights are handed to the QNetwork in memory: checkpoints are written by saveNetwork
+    out.write('snapshot_after_train: false\n')
     out.write('snapshot_prefix: "' + self.directory + 'multilayer_qlearner"\n')
     out.close()
 
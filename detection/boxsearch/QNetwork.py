@@ -1,26 +1,54 @@
 __author__ = "Juan C. Caicedo, caicedo@illinois.edu"
 
 from pybrain.rl.learners.valuebased.interface import ActionValueInterface
-import caffe
+try:
+  import caffe
+except ImportError:
+  print 'Error loading caffe, only the numpy Q-network backend is available'
 import os
 import utils.utils as cu
 import numpy as np
 import random
 
 import learn.rl.RLConfig as config
+import NumpyQNetwork as nqn
 
 EXPLORE = 0
 EXPLOIT = 1
+BACKEND = config.get('qnetworkBackend', default='caffe')
+TARGET_UPDATE_INTERVAL = config.geti('targetUpdateInterval', 1)
 
 def defaultSampler():
   return np.random.random([1, config.geti('outputActions')])
 
+def createNetwork(definition, weightsFile=None):
+  if BACKEND == 'numpy':
+    return nqn.NumpyNet(weightsFile)
+  modelFile = config.get('networkDir') + definition
+  if weightsFile is None:
+    net = caffe.Net(modelFile)
+  else:
+    net = caffe.Net(modelFile, weightsFile)
+  net.set_phase_test()
+  net.set_mode_gpu()
+  return net
+
+def getWeights(net):
+  return dict([ (layer,[blob.data.copy() for blob in net.params[layer]]) for layer in net.params.keys() ])
+
+def setWeights(net, weights):
+  for layer in weights.keys():
+    for i in range(len(weights[layer])):
+      net.params[layer][i].data[...] = weights[layer][i]
+
 class QNetwork(ActionValueInterface):
 
   networkFile = config.get('networkDir') + config.get('snapshotPrefix') + '_iter_' + config.get('trainingIterationsPerBatch') + '.caffemodel'
 
   def __init__(self):
     self.net = None
+    self.targetNet = None
+    self.updates = 0
     print 'QNetwork::Init. Loading ',self.networkFile
     self.loadNetwork()
     self.sampler = defaultSampler
@@ -32,10 +60,7 @@ class QNetwork(ActionValueInterface):
 
   def loadNetwork(self, definition='deploy.prototxt'):
     if os.path.isfile(self.networkFile):
-      modelFile = config.get('networkDir') + definition
-      self.net = caffe.Net(modelFile, self.networkFile)
-      self.net.set_phase_test()
-      self.net.set_mode_gpu()
+      self.net = createNetwork(definition, self.networkFile)
       print 'QNetwork loaded'
     else:
       self.net = None
@@ -51,10 +76,46 @@ class QNetwork(ActionValueInterface):
     else:
       return self.getActivations(state)
 
+  def getActionValuesBatch(self, states, samplers):
+    # One forward pass for all agents; each row explores independently
+    values = np.zeros( (states.shape[0], config.geti('outputActions')) )
+    explore = [self.net == None or self.exploreOrExploit() == EXPLORE for i in range(states.shape[0])]
+    exploit = [i for i in range(states.shape[0]) if not explore[i]]
+    if len(exploit) > 0:
+      values[exploit,:] = self.getActivations(states[exploit,:])
+    for i in range(states.shape[0]):
+      if explore[i]:
+        values[i,:] = samplers[i]()
+    return values
+
   def getActivations(self, state):
     out = self.net.forward_all( **{self.net.inputs[0]: state.reshape( (state.shape[0], state.shape[1], 1, 1) )} )
     return out['qvalues'].squeeze(axis=(2,3))
 
+  def setWeights(self, weights, updateTarget=True):
+    # In-memory handoff of the weights produced by the learner
+    if self.net == None:
+      self.net = createNetwork('deploy.prototxt')
+    setWeights(self.net, weights)
+    # Acting-only copies (actor processes) do not need a target network
+    if not updateTarget:
+      return
+    if self.updates % TARGET_UPDATE_INTERVAL == 0:
+      self.updateTargetNetwork()
+    self.updates += 1
+
+  def updateTargetNetwork(self):
+    if self.targetNet == None:
+      self.targetNet = createNetwork('deploy.maxq.prototxt')
+    setWeights(self.targetNet, getWeights(self.net))
+    print 'QNetwork target updated'
+
+  def getTargetActivations(self, state):
+    if self.targetNet == None:
+      self.updateTargetNetwork()
+    out = self.targetNet.forward_all( **{self.targetNet.inputs[0]: state.reshape( (state.shape[0], state.shape[1], 1, 1) )} )
+    return out['qvalues'].squeeze(axis=(2,3))
+
   def setEpsilonGreedy(self, epsilon, sampler=None):
     if sampler is not None:
       self.sampler = sampler
@@ -0,0 +1,139 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+from collections import OrderedDict
+import numpy as np
+import Image
+
+import utils.imageCache as ic
+import learn.rl.RLConfig as config
+import learn.cnn.RoiPooling as rp
+from ActivationCache import ActivationBackend
+
+LAYER = config.get('convnetLayer')
+MARK_WIDTH = config.getf('markWidth')
+
+########################################
+## SHARED FEATURE MAP BACKEND
+########################################
+# ConvNet warps and forwards every box through the whole network. This backend
+# runs the convolutional trunk once per image (and once more after every
+# cover), and computes the activations of a box by RoI max pooling its
+# projection on the feature map, followed by the fully connected head of the
+# trunk (see learn.cnn.RoiPooling). The image is warped to a square input of
+# roiImageSize pixels. Select it with convnetBackend roipool; roiTrunk chooses
+# the trunk: 'random' (CPU, random weights) or 'caffe'.
+
+class CaffeTrunk():
+  # Two Caffe nets: the convolutional layers (roiTrunkDef, input of
+  # roiImageSize pixels) and the fully connected layers (roiHeadDef, input of
+  # the pooled size), both with the weights of trainedConvNet.
+
+  def __init__(self):
+    import caffe
+    weights = config.get('convnetDir') + config.get('trainedConvNet')
+    self.trunk = caffe.Net(config.get('convnetDir') + config.get('roiTrunkDef'), weights)
+    self.net = caffe.Net(config.get('convnetDir') + config.get('roiHeadDef'), weights)
+    for net in [self.trunk, self.net]:
+      net.set_mode_gpu()
+      net.set_phase_test()
+    self.stride = config.geti('roiTrunkStride', 16)
+    self.featureBlob = config.get('roiTrunkOutput', default='conv5')
+    # Mean pixel of the mean image, in BGR like the network input
+    self.mean = np.load(config.get('meanImage')).reshape( (3,-1) ).mean(axis=1).astype(np.float32)
+
+  def preprocess(self, image):
+    pixels = np.asarray(image.convert('RGB'), np.float32)[:,:,::-1].transpose( (2,0,1) )
+    return np.ascontiguousarray(pixels - self.mean[:,np.newaxis,np.newaxis])
+
+  def featureMap(self, pixels):
+    out = self.trunk.forward_all(blobs=[self.featureBlob], **{self.trunk.inputs[0]: pixels[np.newaxis,...]})
+    return out[self.featureBlob][0].copy()
+
+  def head(self, pooled):
+    n = len(pooled)
+    out = self.net.forward_all(blobs=[LAYER], **{self.net.inputs[0]: pooled})
+    return {'prob':out['prob'][0:n].reshape([n,-1]), LAYER:out[LAYER][0:n].reshape([n,-1])}
+
+def loadTrunk(pooledSize):
+  if config.get('roiTrunk', default='random') == 'caffe':
+    return CaffeTrunk()
+  else:
+    return rp.RandomTrunk(pooledSize=pooledSize, featureDim=config.geti('roiFeatureDim', 4096), layer=LAYER)
+
+class RoiPoolingConvNet(ActivationBackend):
+
+  # Covers are replayed on the pixels only when a feature map is missing
+  cheapContexts = True
+
+  def __init__(self, trunk=None):
+    self.id = 0
+    self.batchSize = config.geti('roiBatchSize', 256)
+    self.pooledSize = config.geti('roiPooledSize', 6)
+    self.imageSize = config.geti('roiImageSize', 512)
+    self.trunk = trunk if trunk is not None else loadTrunk(self.pooledSize)
+    # Feature maps of the last contexts (image and covers), so switching
+    # between images (VectorizedBoxSearchEnvironment) does not recompute them
+    self.maps = OrderedDict()
+    self.mapsSize = config.geti('roiFeatureMaps', 8)
+    # Decoded images are kept for later covers and epochs
+    ic.cache.maxBytes = config.geti('imageCacheMB', 512)*1024*1024
+    self.initCache()
+
+  def loadPixels(self, image):
+    # The JPEG is decoded at the smallest resolution that covers the input
+    img = ic.loadImage(config.get('imageDir') + image + '.jpg', (self.imageSize,self.imageSize))
+    return self.trunk.preprocess(Image.fromarray(img).resize( (self.imageSize,self.imageSize), Image.BILINEAR ))
+
+  def prepareImage(self, image):
+    self.imageName = image
+    width, height = ic.imageSize(config.get('imageDir') + image + '.jpg')
+    # Image coordinates to input pixels
+    self.scale = np.asarray([self.imageSize/float(width), self.imageSize/float(height)])
+    self.resetCovers()
+
+  def coveredPixels(self):
+    # Preprocessed pixels are mean subtracted: plain covers write zeros
+    pixels = self.loadPixels(self.imageName)
+    for boxes,source in self.coverLog:
+      if source != '':
+        sourcePixels = self.loadPixels(source)
+      for box in boxes:
+        x1, y1, x2, y2 = np.clip(np.round(np.asarray(box, np.float64)*self.scale[[0,1,0,1]]).astype(np.int64), 0, self.imageSize)
+        if source != '':
+          pixels[:, y1:y2+1, x1:x2+1] = sourcePixels[:, y1:y2+1, x1:x2+1]
+        else:
+          pixels[:, y1:y2+1, x1:x2+1] = 0
+    return pixels
+
+  def featureMap(self):
+    # Computed on demand, so several covers in a row cost one forward pass
+    key = (self.imageName, self.covers)
+    try:
+      features = self.maps.pop(key)
+    except KeyError:
+      features = self.trunk.featureMap(self.coveredPixels())
+      if len(self.maps) >= self.mapsSize:
+        self.maps.popitem(last=False)
+    self.maps[key] = features
+    return features
+
+  def forwardRegions(self, boxes):
+    pooled = rp.roiMaxPool(self.featureMap(), boxes, self.scale/self.trunk.stride, self.pooledSize, self.pooledSize)
+    return self.trunk.head(pooled)
+
+  def coverRegion(self, box, otherImg=None):
+    if otherImg is not None:
+      self.applyCover([map(int,box)], otherImg)
+    else:
+      # Create two perpendicular boxes
+      w = box[2]-box[0]
+      h = box[3]-box[1]
+      b1 = map(int, [box[0] + w*0.5 - w*MARK_WIDTH, box[1], box[0] + w*0.5 + w*MARK_WIDTH, box[3]])
+      b2 = map(int, [box[0], box[1] + h*0.5 - h*MARK_WIDTH, box[2], box[1] + h*0.5 + h*MARK_WIDTH])
+      self.applyCover([b1, b2])
+    return True
+
+  def applyCover(self, boxes, source=''):
+    # Covers are drawn on the pixels when the next feature map is computed
+    self.registerCover(boxes, source)
+    self.id += 1
@@ -0,0 +1,191 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import random
+import numpy as np
+
+import BoxSearchState as bs
+import BoxSearchEnvironment as bse
+from BoxSearchTask import BoxSearchTask
+
+import utils.utils as cu
+import utils.episodeLog as el
+import learn.rl.RLConfig as config
+
+TEST_TIME_OUT = config.geti('testTimeOut')
+EXTRA_STEPS = 5
+
+########################################
+## LOCKSTEP ENVIRONMENTS
+########################################
+# Runs one episode per slot and advances all slots together: the boxes of
+# every slot are sent to the feature backend in one request, and finished
+# slots are refilled with the next image of the list. Each slot keeps its
+# own BoxSearchState, its own reward bookkeeping (a BoxSearchTask) and the
+# backend context of its image, so episodes end independently.
+# Slots switch the backend context at every step, so the backend must do it
+# cheaply (cheapContexts): ConvNet would initialize the image in Caffe and
+# replay its covers every time, and is slower here than one episode at a time.
+class VectorizedBoxSearchEnvironment():
+
+  def __init__(self, imageList, mode, groundTruthFile, slots, cnn=None):
+    self.mode = mode
+    self.cnn = cnn if cnn is not None else bse.loadConvNet()
+    if slots > 1 and not self.cnn.cheapContexts:
+      raise ValueError('parallelEpisodes > 1 needs a backend with cheap context switches (convnetBackend numpy or roipool), not ' + self.cnn.__class__.__name__)
+    self.imageList = [x.strip() for x in open(imageList)]
+    self.groundTruth = cu.loadBoxIndexFile(groundTruthFile)
+    allImgs = set([x.strip() for x in open(config.get('allImagesList'))])
+    self.negativeSamples = list(allImgs.difference(set(self.groundTruth.keys())))
+    self.negativeProbability = 0.0
+    if self.mode == 'train':
+      self.negativeProbability = config.getf('negativeEpisodeProb')
+      random.shuffle(self.imageList)
+    self.idx = -1
+    self.slots = slots
+    self.states = [None for i in range(slots)]
+    self.contexts = [None for i in range(slots)]
+    self.images = ['' for i in range(slots)]
+    self.testRecords = [None for i in range(slots)]
+    self.testLog = el.openTestMemory(config.get('testMemory'), mode, bse.TEST_MEMORY_FORMAT)
+    self.scores = [[] for i in range(slots)]
+    self.tasks = []
+    for i in range(slots):
+      task = BoxSearchTask()
+      task.groundTruth = self.groundTruth
+      self.tasks.append(task)
+    self.negative = np.zeros( (slots), np.bool )
+    self.active = np.zeros( (slots), np.bool )
+    self.episodeDone = np.zeros( (slots), np.bool )
+    self.extraSteps = np.zeros( (slots), np.int32 )
+    self.steps = np.zeros( (slots), np.int32 )
+    self.boxes = np.zeros( (slots, 4) )
+
+  def nextImage(self):
+    self.idx += 1
+    if self.idx >= len(self.imageList):
+      if self.mode == 'train':
+        random.shuffle(self.imageList)
+        self.idx = 0
+      else:
+        return None
+    return self.imageList[self.idx]
+
+  def loadEpisode(self, i):
+    self.negative[i] = self.mode == 'train' and random.random() < self.negativeProbability
+    if self.negative[i]:
+      image = self.negativeSamples[ random.randint(0,len(self.negativeSamples)-1) ]
+      boxReset = 'Random'
+    else:
+      image = self.nextImage()
+      if image is None:
+        print 'No more images available'
+        return False
+      boxReset = {'train':'Random','test':'Full'}[self.mode]
+    self.cnn.prepareImage(image)
+    self.contexts[i] = self.cnn.getContext()
+    self.states[i] = bs.BoxSearchState(image, groundTruth=self.groundTruth, boxReset=boxReset)
+    self.tasks[i].loadGroundTruth(image)
+    self.images[i] = image
+    self.active[i] = True
+    self.episodeDone[i] = False
+    self.extraSteps[i] = EXTRA_STEPS
+    self.steps[i] = 0
+    self.boxes[i,:] = self.states[i].box
+    if self.mode == 'test':
+      self.testRecords[i] = {'boxes':[], 'actions':[], 'values':[], 'rewards':[], 'scores':[]}
+    print 'VectorizedEnvironment::LoadEpisode => Slot',i,'Image',image,'('+str(self.states[i].imageSize[0])+','+str(self.states[i].imageSize[1])+')'
+    return True
+
+  def finishEpisode(self, i):
+    # Save actions performed during this episode
+    if self.mode == 'test' and self.testRecords[i] is not None:
+      el.saveTestRecord(config.get('testMemory'), self.testLog, self.images[i], self.testRecords[i])
+      self.testRecords[i] = None
+    self.tasks[i].displayEpisodePerformance()
+    self.tasks[i].image = ''
+    self.active[i] = False
+
+  def restart(self):
+    self.idx = -1
+    self.active[:] = False
+    self.testRecords = [None for i in range(self.slots)]
+    self.testLog = el.openTestMemory(config.get('testMemory'), self.mode, bse.TEST_MEMORY_FORMAT)
+
+  def flushTestMemory(self):
+    if self.testLog is not None:
+      self.testLog.flush()
+
+  def getSensors(self):
+    slots = np.where(self.active)[0]
+    observations = [None for i in range(self.slots)]
+    if len(slots) == 0:
+      return observations
+    # Features of the visible region of all active slots in one request
+    activations = self.cnn.getActivationsMulti([self.contexts[i] for i in slots], self.boxes[slots,:])
+    layer = activations[config.get('convnetLayer')]
+    for j in range(len(slots)):
+      i = slots[j]
+      state = np.hstack( (layer[j], self.states[i].actionHistory.flat()) )
+      self.scores[i] = activations['prob'][j,0:21].tolist()
+      observations[i] = {'image':self.images[i], 'state':state, 'negEpisode':self.negative[i]}
+    return observations
+
+  def performActions(self, actions):
+    # actions is a dictionary slot -> (action, value) for the active slots
+    slots = sorted(actions.keys())
+    rewards = {}
+    for i in slots:
+      state = self.states[i]
+      state.performAction(actions[i])
+      task = self.tasks[i]
+      reward = task.computeObjectReward(state.box, state.actionChosen)
+      allDone = reduce(lambda x,y: x and y, task.control['DONE'], True)
+      self.updatePostReward(i, reward, allDone, task.cover)
+      self.boxes[i,:] = state.box
+      self.steps[i] += 1
+      rewards[i] = reward
+    return rewards
+
+  def updatePostReward(self, i, reward, allDone, cover):
+    state = self.states[i]
+    if self.mode == 'test':
+      record = self.testRecords[i]
+      record['boxes'].append( state.box )
+      record['actions'].append( state.actionChosen )
+      record['values'].append( state.actionValue )
+      record['rewards'].append( reward )
+      record['scores'].append( self.scores[i][:] )
+      if state.actionChosen == bs.PLACE_LANDMARK:
+        self.coverRegion(i, state.box)
+        state.reset()
+      if state.stepsWithoutLandmark > TEST_TIME_OUT:
+        state.reset('Quadrants')
+    elif self.mode == 'train':
+      # We do not cover false landmarks during training
+      if state.actionChosen == bs.PLACE_LANDMARK and len(cover) > 0:
+        self.coverRegion(i, cover)
+        state.reset('Random')
+      if allDone:
+        self.extraSteps[i] -= 1
+        if self.extraSteps[i] <= 0:
+          self.episodeDone[i] = True
+
+  def coverRegion(self, i, box):
+    self.cnn.setContext(self.contexts[i])
+    self.cnn.coverRegion(box)
+    self.contexts[i] = self.cnn.getContext()
+
+  def sampler(self, i):
+    return self.states[i].sampleNextAction
+
+  def flushStats(self):
+    summary = self.tasks[0]
+    for task in self.tasks[1:]:
+      summary.epochRecall += task.epochRecall
+      summary.epochMaxIoU += task.epochMaxIoU
+      summary.epochLandmarks += task.epochLandmarks
+      task.epochRecall = []
+      task.epochMaxIoU = []
+      task.epochLandmarks = []
+    summary.flushStats()
+
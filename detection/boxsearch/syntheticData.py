@@ -0,0 +1,86 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import os
+import atexit
+import shutil
+import tempfile
+import numpy as np
+import Image
+
+import learn.rl.RLConfig as config
+
+########################################
+## SYNTHETIC DATASET FOR THE TESTS
+########################################
+# Box-search modules read the configuration when they are imported, so tests
+# call load() first: it writes random images, image lists, ground truth, a
+# numpy Q-network and a configuration file to a temporary directory, and
+# reads the configuration like BoxSearchRunner does. All test modules share
+# the same values. The feature backend and the Q-network are the numpy
+# stand-ins, so nothing needs Caffe.
+
+NUM_IMAGES = 8
+TRAIN_IMAGES = 6
+FEATURES = 4096
+HISTORY_LENGTH = 4
+NUM_ACTIONS = 10
+TEMPORAL_WINDOW = 3
+
+CONFIG = [
+  ('convnetLayer', 'fc6'), ('convnetBackend', 'numpy'), ('qnetworkBackend', 'numpy'),
+  ('numpyHiddenLayers', '16'), ('snapshotPrefix', 'multilayer_qlearner'),
+  ('outputActions', str(NUM_ACTIONS)), ('actionHistoryLength', str(HISTORY_LENGTH)),
+  ('temporalWindow', str(TEMPORAL_WINDOW)), ('stateFeatures', str(TEMPORAL_WINDOW*(FEATURES + NUM_ACTIONS*HISTORY_LENGTH))),
+  ('historyFactor', '2'), ('negativeEpisodeProb', '0.25'), ('markWidth', '0.1'), ('boxResizeStep', '0.2'),
+  ('testTimeOut', '10'), ('minAcceptableIoU', '0.5'), ('detectionReward', '3.0'),
+  ('trainingIterationsPerBatch', '2'), ('trainingBatchSize', '8'), ('learningRate', '0.0001'), ('stepSize', '10000'),
+  ('gamma', '0.1'), ('momentum', '0.9'), ('weightDecay', '0.0005'), ('gammaDiscountReward', '0.9'),
+  ('trainInteractions', '6'), ('testInteractions', '10'), ('explorationEpochs', '1'), ('epsilonGreedyEpochs', '1'),
+  ('exploitLearningEpochs', '0'), ('minTrainingEpsilon', '0.1'), ('testEpsilon', '0.0'), ('validationEpochs', '100'),
+  ('evaluationIndexType', 'pascal'), ('category', 'aeroplane') ]
+
+directory = None
+
+def writeDataset(root, seed=0):
+  rng = np.random.RandomState(seed)
+  os.makedirs(root + '/images/')
+  names, boxes = [], []
+  for i in range(NUM_IMAGES):
+    name = 'im%02d' % i
+    w, h = rng.randint(120, 240), rng.randint(120, 240)
+    Image.fromarray( (rng.rand(h, w, 3)*255).astype(np.uint8) ).save(root + '/images/' + name + '.jpg')
+    x, y = rng.randint(0, w/2), rng.randint(0, h/2)
+    boxes.append('%s %d %d %d %d' % (name, x, y, x + rng.randint(20, w/2), y + rng.randint(20, h/2)))
+    names.append(name)
+  lines = lambda x: '\n'.join(x) + '\n'
+  open(root + '/train.txt', 'w').write(lines(names[:TRAIN_IMAGES]))
+  open(root + '/test.txt', 'w').write(lines(names[TRAIN_IMAGES:]))
+  open(root + '/all.txt', 'w').write(lines(names))
+  open(root + '/train_gt.txt', 'w').write(lines(boxes[:TRAIN_IMAGES]))
+  open(root + '/test_gt.txt', 'w').write(lines(boxes[TRAIN_IMAGES:]))
+
+def writeConfiguration(filename, root, extra=[]):
+  values = CONFIG + [('imageDir', root + '/images/'), ('networkDir', root + '/network/'), ('testMemory', root + '/memory/'),
+    ('trainDatabase', root + '/train.txt'), ('trainGroundTruth', root + '/train_gt.txt'),
+    ('testDatabase', root + '/test.txt'), ('testGroundTruth', root + '/test_gt.txt'),
+    ('allImagesList', root + '/all.txt')] + list(extra)
+  with open(filename, 'w') as out:
+    for key,value in values:
+      out.write(key + ' ' + value + '\n')
+
+def load():
+  # Returns the directory of the dataset, created on the first call
+  global directory
+  if directory is not None:
+    return directory
+  directory = tempfile.mkdtemp(prefix='boxsearch')
+  atexit.register(shutil.rmtree, directory, True)
+  writeDataset(directory)
+  writeConfiguration(directory + '/rl.config', directory)
+  config.readConfiguration(directory + '/rl.config')
+  os.makedirs(directory + '/network/')
+  os.makedirs(directory + '/memory/')
+  import NumpyQNetwork as nqn
+  networkFile = config.get('networkDir') + config.get('snapshotPrefix') + '_iter_' + config.get('trainingIterationsPerBatch') + '.caffemodel'
+  nqn.NumpyNet(seed=1).save(networkFile)
+  return directory
@@ -0,0 +1,94 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import unittest
+import numpy as np
+
+import syntheticData as sd
+sd.load()
+import ActivationCache as ac
+from NumpyConvNet import NumpyConvNet, LAYER
+
+########################################
+## BATCHED ACTIVATIONS AGAINST ONE BOX AT A TIME
+########################################
+# The numpy stand-in backend computes the activations of each box on its
+# own, so batches, the cache and context switches must give the activations
+# of forwardRegions on one box.
+
+def randomBoxes(n, seed=0):
+  rng = np.random.RandomState(seed)
+  x1, y1 = rng.randint(0, 100, n), rng.randint(0, 100, n)
+  return np.vstack( (x1, y1, x1 + rng.randint(10, 100, n), y1 + rng.randint(10, 100, n)) ).T.tolist()
+
+def oneByOne(cnn, boxes):
+  return np.vstack( [cnn.forwardRegions([b])[LAYER] for b in boxes] )
+
+class ActivationBatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cnn = NumpyConvNet()
+    self.cnn.batchSize = 4
+    self.cnn.prepareImage('im00')
+
+  def testBatch(self):
+    boxes = randomBoxes(25)
+    self.assertTrue(np.allclose(self.cnn.getActivationsBatch(boxes)[LAYER], oneByOne(self.cnn, boxes), atol=1e-5))
+    self.assertTrue(np.allclose(self.cnn.getActivations(boxes[3])[LAYER], oneByOne(self.cnn, boxes[3:4])[0], atol=1e-5))
+
+  def testCache(self):
+    boxes = randomBoxes(10)
+    first = self.cnn.getActivationsBatch(boxes + boxes[:3])
+    # Repeated boxes of a batch are computed once
+    self.assertEqual( (self.cnn.cache.hits, self.cnn.cache.misses), (0, 13) )
+    self.assertEqual(len(self.cnn.cache.entries), 10)
+    second = self.cnn.getActivationsBatch(boxes)
+    self.assertEqual(self.cnn.cache.hits, 10)
+    self.assertTrue(np.array_equal(first[LAYER][:10], second[LAYER]))
+    self.assertAlmostEqual(self.cnn.cache.hitRate(), 10/23.0)
+
+  def testCovers(self):
+    # Covering a region changes the activations, cached values are not used
+    boxes = randomBoxes(5)
+    before = self.cnn.getActivationsBatch(boxes)[LAYER]
+    self.cnn.coverRegion([0, 0, 150, 150])
+    after = self.cnn.getActivationsBatch(boxes)[LAYER]
+    self.assertEqual(self.cnn.cache.hits, 0)
+    self.assertFalse(np.allclose(before, after))
+    self.assertTrue(np.allclose(after, oneByOne(self.cnn, boxes), atol=1e-5))
+
+  def testContexts(self):
+    # Boxes of two images, one covered, in one request
+    boxes = randomBoxes(6)
+    plain = self.cnn.getContext()
+    expected = oneByOne(self.cnn, boxes[:3])
+    self.cnn.prepareImage('im01')
+    self.cnn.coverRegion([10, 10, 60, 60])
+    covered = self.cnn.getContext()
+    expected = np.vstack( (expected, oneByOne(self.cnn, boxes[3:])) )
+    self.cnn.prepareImage('im02')
+    result = self.cnn.getActivationsMulti([plain]*3 + [covered]*3, boxes)[LAYER]
+    self.assertTrue(np.allclose(result, expected, atol=1e-5))
+
+class ActivationCacheTest(unittest.TestCase):
+
+  def testLeastRecentlyUsed(self):
+    cache = ac.ActivationCache(size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    self.assertEqual(cache.get('b'), None)
+    self.assertEqual( (cache.get('a'), cache.get('c')), (1, 3) )
+
+  def testQuantum(self):
+    cache = ac.ActivationCache(quantum=4)
+    self.assertEqual(cache.key('im', (), [1, 2, 41, 43]), cache.key('im', (), [3, 0, 40, 42]))
+    self.assertNotEqual(cache.key('im', (), [1, 2, 41, 43]), cache.key('im', (), [4, 2, 41, 43]))
+
+  def testDisabled(self):
+    cache = ac.ActivationCache(size=0)
+    cache.put('a', 1)
+    self.assertEqual(cache.get('a'), None)
+
+if __name__ == "__main__":
+  unittest.main()
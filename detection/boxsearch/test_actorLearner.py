@@ -0,0 +1,104 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import os
+import unittest
+import numpy as np
+
+import syntheticData as sd
+sd.load()
+import learn.rl.RLConfig as config
+import BoxSearchAgent as bsa
+import ActorLearner as al
+
+########################################
+## SHARED MEMORY SAMPLING
+########################################
+# The learner samples all segments of the shared memory, except the most
+# recent record of each segment, which has no successor yet.
+
+def addRecords(memory, actor, n):
+  memory.attach(actor)
+  obs = np.zeros( (bsa.TEMPORAL_WINDOW*bsa.STATE_FEATURES), np.float32 )
+  for k in range(n):
+    memory.add('im' + str(k/3), k, 0, obs, float(k))
+
+class SharedReplayMemoryTest(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.memory = bsa.SharedReplayMemory(2, 5, 3)
+
+  def testSampleable(self):
+    self.assertEqual(self.memory.sampleable(), 0)
+    addRecords(self.memory, 0, 1)
+    addRecords(self.memory, 2, 1)
+    self.assertEqual(self.memory.sync(), 2)
+    self.assertEqual(self.memory.sampleable(), 0)
+    addRecords(self.memory, 2, 1)
+    self.assertEqual(self.memory.sampleable(), 1)
+    records = self.memory.sample(100)[0]
+    self.assertTrue(np.all(records == 2*self.memory.segment))
+
+  def testNewestRecordsNotSampled(self):
+    # Segment 1 wraps around, segment 2 stays empty
+    addRecords(self.memory, 0, 4)
+    addRecords(self.memory, 1, self.memory.segment + 7)
+    newest = [a*self.memory.segment + self.memory.pointers[a] for a in range(2)]
+    records = self.memory.sample(20000)[0]
+    self.assertFalse(np.in1d(records, newest).any())
+    self.assertFalse(np.any(records/self.memory.segment == 2))
+    # Uniform over the sampleable records
+    counts = np.bincount(records, minlength=self.memory.size)
+    sampled = counts[counts > 0]
+    self.assertEqual(len(sampled), self.memory.sampleable())
+    self.assertLess(np.abs(sampled/20000.0 - 1.0/len(sampled)).max(), 0.01)
+    # Successors stay in the segment of the record
+    self.assertTrue(np.all(self.memory.nextRecords(records)/self.memory.segment == records/self.memory.segment))
+
+########################################
+## ACTOR AND LEARNER PROCESSES
+########################################
+
+class Task():
+
+  def __init__(self):
+    self.epochRecall = []
+    self.epochMaxIoU = []
+    self.epochLandmarks = []
+
+class ActorLearnerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.numImages = sd.TRAIN_IMAGES
+    self.networkFile = sd.load() + '/network/saved.caffemodel'
+
+  def testEpochAndSave(self):
+    actorLearner = al.ActorLearner(self.numImages, config.geti('trainInteractions'), 2)
+    try:
+      task = Task()
+      actorLearner.runEpoch(1.0, config.geti('trainInteractions'), self.numImages, task)
+      self.assertGreater(len(task.epochMaxIoU), 0)
+      self.assertGreater(actorLearner.memory.sync(), 0)
+      actorLearner.startLearner()
+      actorLearner.saveNetwork(self.networkFile)
+      self.assertTrue(os.path.isfile(self.networkFile))
+    finally:
+      actorLearner.stop()
+
+  def testDeadLearner(self):
+    # saveNetwork raises instead of waiting for a learner that died
+    pollTime = al.LEARNER_POLL_TIME
+    al.LEARNER_POLL_TIME = 0.2
+    actorLearner = al.ActorLearner(self.numImages, config.geti('trainInteractions'), 1)
+    try:
+      actorLearner.startLearner()
+      actorLearner.learner.terminate()
+      actorLearner.learner.join()
+      self.assertRaises(RuntimeError, actorLearner.saveNetwork, self.networkFile)
+    finally:
+      al.LEARNER_POLL_TIME = pollTime
+      for p in actorLearner.processes:
+        p.terminate()
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,213 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import random
+import unittest
+import numpy as np
+
+import syntheticData as sd
+sd.load()
+import BoxSearchAgent as bsa
+import BoxSearchState as bss
+
+########################################
+## REPLAY MEMORIES AGAINST ReplayMemory
+########################################
+# The same stream of steps is given to agents that only differ in their
+# replay memory; records sampled from the other memories must read as the
+# records of the dense ReplayMemory.
+
+class Controller():
+  # Actions come from the stream, the agents never ask for values
+  pass
+
+def values(action):
+  v = np.zeros( (1, sd.NUM_ACTIONS), np.float32 )
+  v[0,action] = 1.0
+  return v
+
+def steps(episodes, seed=0):
+  # Short episodes, some negative, some ending with a landmark
+  rng = np.random.RandomState(seed)
+  for e in range(episodes):
+    negative = rng.rand() < 0.3
+    for t in range(rng.randint(1, 5)):
+      state = rng.rand(bsa.STATE_FEATURES).astype(np.float32)
+      action = bss.PLACE_LANDMARK if rng.rand() < 0.2 else rng.randint(0, sd.NUM_ACTIONS)
+      yield 'im%02d' % (e % 3), negative, t == 0, state, action, rng.randn()
+
+def fill(memories, episodes, seed=0, check=None):
+  # One agent per memory, all given the same steps. Some records are added
+  # without frame ids, every frame of their window is new
+  agents = [bsa.BoxSearchAgent(Controller()) for m in memories]
+  for agent,memory in zip(agents, memories):
+    agent.replayMemory = memory
+  rng = np.random.RandomState(seed + 1)
+  for k,(image, negative, first, state, action, reward) in enumerate(steps(episodes, seed)):
+    for agent in agents:
+      if first and agent.observation is not None:
+        agent.reset()
+      agent.integrateObservation({'image':image, 'negEpisode':negative, 'state':state})
+      agent.setActionValues(values(action))
+      random.seed(k)
+      agent.giveReward(reward)
+    if rng.rand() < 0.1:
+      window = rng.rand(bsa.TEMPORAL_WINDOW*bsa.STATE_FEATURES).astype(np.float32)
+      for memory in memories:
+        memory.add(image, 0, action, window, reward)
+    if check is not None:
+      check(*memories)
+  return memories
+
+class FrameReplayMemoryTest(unittest.TestCase):
+
+  def compare(self, frames, dense, atol=0.0):
+    if dense.usableRecords < 2:
+      return
+    records = frames.sample(20)[0]
+    nextRecords = frames.nextRecords(records)
+    for r in [records, nextRecords]:
+      self.assertLessEqual(np.abs(frames.observations(r) - dense.observations(r)).max(), atol)
+    self.assertTrue(np.array_equal(frames.terminalStates(records), dense.terminalStates(records)))
+    self.overwritten += not frames.liveRecords().all()
+
+  def testShortEpisodes(self):
+    # Records add more frames than the ring holds per record: sampled
+    # windows never read frames overwritten by the ring
+    self.overwritten = 0
+    fill([bsa.FrameReplayMemory(3, 4), bsa.ReplayMemory(3, 4)], 300, check=self.compare)
+    self.assertGreater(self.overwritten, 0)
+
+  def testWithoutOverwrites(self):
+    frames, dense = fill([bsa.FrameReplayMemory(40, 40), bsa.ReplayMemory(40, 40)], 100)
+    self.assertLessEqual(frames.framesWritten, frames.F.shape[0])
+    records = np.arange(dense.usableRecords)
+    self.assertTrue(np.array_equal(frames.observations(records), dense.observations(records)))
+
+  def testHalfPrecision(self):
+    self.overwritten = 0
+    check = lambda frames, dense: self.compare(frames, dense, atol=1e-3)
+    fill([bsa.FrameReplayMemory(3, 4, np.float16), bsa.ReplayMemory(3, 4)], 100, check=check)
+
+########################################
+## PRIORITIZED SAMPLING
+########################################
+# The sum-tree maps a value in [0, total) to the record whose cumulative
+# priority interval contains it, so uniform values sample records in
+# proportion to their priorities.
+
+class SumTreeTest(unittest.TestCase):
+
+  def setUp(self):
+    # Not a power of two: the last leaves stay empty
+    self.priorities = np.random.RandomState(0).rand(37)
+    self.tree = bsa.SumTree(len(self.priorities))
+    self.tree.update(np.arange(len(self.priorities)), self.priorities)
+
+  def testSums(self):
+    self.assertAlmostEqual(self.tree.total(), self.priorities.sum())
+    self.assertTrue(np.allclose(self.tree.get(np.arange(len(self.priorities))), self.priorities))
+    self.tree.update([3, 30], [0.0, 2.0])
+    self.priorities[[3, 30]] = [0.0, 2.0]
+    self.assertAlmostEqual(self.tree.total(), self.priorities.sum())
+
+  def testIntervals(self):
+    # The middle of every interval gives its record, records of priority 0
+    # are never returned
+    self.tree.update([5], [0.0])
+    self.priorities[5] = 0.0
+    ends = np.cumsum(self.priorities)
+    middles = ends - self.priorities/2
+    nonzero = self.priorities > 0
+    self.assertTrue(np.array_equal(self.tree.sample(middles[nonzero]), np.where(nonzero)[0]))
+    self.assertTrue(np.array_equal(self.tree.sample(ends[:-1][nonzero[1:]] + 1e-9), np.where(nonzero)[0][1:]))
+
+  def testDistribution(self):
+    n = 200000
+    records = self.tree.sample(np.random.RandomState(1).rand(n)*self.tree.total())
+    frequencies = np.bincount(records, minlength=len(self.priorities))/float(n)
+    self.assertLess(np.abs(frequencies - self.priorities/self.priorities.sum()).max(), 0.005)
+
+class PrioritizedReplayMemoryTest(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.memory = bsa.PrioritizedReplayMemory(5, 4)
+    obs = np.zeros( (bsa.TEMPORAL_WINDOW*bsa.STATE_FEATURES), np.float32 )
+    for k in range(self.memory.size):
+      if k % 5 == 4:
+        self.memory.addDetection('im' + str(k/5), k, bss.PLACE_LANDMARK, obs, 3.0)
+      else:
+        self.memory.add('im' + str(k/5), k, 0, obs, 0.0)
+    records = np.arange(self.memory.size)
+    self.errors = np.random.RandomState(2).randn(self.memory.size)
+    self.memory.updatePriorities(records, self.errors)
+
+  def expected(self):
+    priorities = (np.abs(self.errors) + bsa.PRIORITY_EPSILON)**bsa.PRIORITY_ALPHA
+    priorities[4::5] *= 1.0 + bsa.HISTORY_FACTOR
+    return priorities/priorities.sum()
+
+  def testDetections(self):
+    # One record per detection, terminal and boosted
+    self.assertEqual(self.memory.usableRecords, self.memory.size)
+    self.assertTrue(self.memory.T[4::5].all())
+    self.assertFalse(self.memory.T[0::5].any())
+    self.assertTrue(np.all(self.memory.boost[4::5] == 1.0 + bsa.HISTORY_FACTOR))
+
+  def testDistribution(self):
+    n = 200000
+    records, weights = self.memory.sample(n)
+    frequencies = np.bincount(records, minlength=self.memory.size)/float(n)
+    self.assertLess(np.abs(frequencies - self.expected()).max(), 0.005)
+
+  def testImportanceWeights(self):
+    records, weights = self.memory.sample(1000)
+    expected = (self.memory.usableRecords*self.expected()[records])**(-bsa.PRIORITY_BETA)
+    self.assertTrue(np.allclose(weights, expected/expected.max(), rtol=1e-4))
+    self.assertEqual(weights.max(), 1.0)
+
+  def testNewRecords(self):
+    # New records enter with the largest priority seen so far
+    obs = np.zeros( (bsa.TEMPORAL_WINDOW*bsa.STATE_FEATURES), np.float32 )
+    self.memory.add('new', 0, 0, obs, 0.0)
+    self.assertAlmostEqual(self.memory.tree.get([self.memory.pointer])[0], self.memory.maxPriority)
+    self.assertAlmostEqual(self.memory.maxPriority, ((np.abs(self.errors) + bsa.PRIORITY_EPSILON)**bsa.PRIORITY_ALPHA).max())
+
+########################################
+## SHARED MEMORY
+########################################
+
+class CopyToTest(unittest.TestCase):
+
+  def compare(self, Memory):
+    # An actor writes the steps into the shared memory; copied to Memory
+    # they must give the memory filled with the same steps directly
+    shared, direct = fill([bsa.SharedReplayMemory(40, 40, 1), Memory(40, 40)], 100)
+    copied = Memory(40, 40)
+    shared.copyTo(copied)
+    n = direct.usableRecords
+    records = np.arange(n)
+    self.assertEqual(copied.usableRecords, n)
+    self.assertTrue(np.array_equal(copied.observations(records), direct.observations(records)))
+    self.assertTrue(np.array_equal(copied.A[:n], direct.A[:n]))
+    self.assertTrue(np.array_equal(copied.R[:n], direct.R[:n]))
+    self.assertTrue(np.array_equal(copied.terminalStates(records[:-1]), direct.terminalStates(records[:-1])))
+    return copied, direct
+
+  def testReplayMemory(self):
+    self.compare(bsa.ReplayMemory)
+
+  def testFrameReplayMemory(self):
+    copied, direct = self.compare(bsa.FrameReplayMemory)
+    # Frames shared by consecutive windows are still stored once
+    self.assertEqual(copied.framesWritten, direct.framesWritten)
+    self.assertTrue(np.array_equal(copied.FI, direct.FI))
+
+  def testPrioritizedReplayMemory(self):
+    copied, direct = self.compare(bsa.PrioritizedReplayMemory)
+    self.assertTrue(np.array_equal(copied.T, direct.T))
+    self.assertTrue(np.array_equal(copied.boost, direct.boost))
+    self.assertTrue(np.allclose(copied.tree.tree, direct.tree.tree))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,70 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import os
+import sys
+import json
+import subprocess
+import unittest
+import numpy as np
+
+import syntheticData as sd
+sd.load()
+import learn.rl.RLConfig as config
+import ActivationCache as ac
+from VectorizedBoxSearchEnvironment import VectorizedBoxSearchEnvironment
+
+########################################
+## LOCKSTEP SLOTS AGAINST ONE EPISODE AT A TIME
+########################################
+# BoxSearchRunner runs the test images from the command line, as in
+# production, once serially and once in parallel slots, with the numpy
+# feature backend and Q-network. The runner reads the configuration file
+# itself, and both runs must write the same test memory.
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BoxSearchRunner.py')
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def runTest(name, extra):
+  # Runs the runner in test mode on the training images, returns its output
+  # and the test memory of every image
+  root = sd.load()
+  memory = root + '/' + name + '/'
+  os.makedirs(memory)
+  configFile = root + '/' + name + '.config'
+  sd.writeConfiguration(configFile, root, [('testMemory', memory), ('testDatabase', root + '/train.txt'),
+    ('testGroundTruth', root + '/train_gt.txt')] + extra)
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join([ROOT, os.path.join(ROOT, 'utils')] + [p for p in sys.path if p != ''])
+  process = subprocess.Popen([sys.executable, RUNNER, configFile, 'test'], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  output = process.communicate()[0]
+  if process.returncode != 0:
+    raise RuntimeError(output)
+  records = dict( [(f[:-4], json.load(open(memory + f))) for f in os.listdir(memory) if f.endswith('.txt')] )
+  return output, records
+
+class Backend(ac.ActivationBackend):
+  # Switching contexts prepares the image again
+  pass
+
+class VectorizedEnvironmentTest(unittest.TestCase):
+
+  def testSameTestMemory(self):
+    serialOutput, serial = runTest('serial', [])
+    parallelOutput, parallel = runTest('parallel', [('parallelEpisodes', '3')])
+    self.assertTrue('in 3 parallel slots' in parallelOutput)
+    self.assertFalse('parallel slots' in serialOutput)
+    self.assertEqual(sorted(serial.keys()), sorted([x.strip() for x in open(config.get('trainDatabase'))]))
+    self.assertEqual(sorted(parallel.keys()), sorted(serial.keys()))
+    for image in serial.keys():
+      for field in ['boxes', 'actions', 'rewards']:
+        self.assertEqual(parallel[image][field], serial[image][field])
+      for field in ['values', 'scores']:
+        self.assertTrue(np.allclose(parallel[image][field], serial[image][field], atol=1e-5))
+
+  def testCostlyContexts(self):
+    args = (config.get('trainDatabase'), 'train', config.get('trainGroundTruth'))
+    self.assertRaises(ValueError, VectorizedBoxSearchEnvironment, *(args + (3, Backend())))
+    self.assertEqual(VectorizedBoxSearchEnvironment(*(args + (1, Backend()))).slots, 1)
+
+if __name__ == "__main__":
+  unittest.main()
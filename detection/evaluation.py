@@ -1,15 +1,9 @@
 import os,sys
 import re
+import numpy as np
 import utils.utils as cu
 import utils.libDetection as ldet
 
-#Functions
-def cumsum(a):
-  b = [0.0 for x in range(0,len(a))]
-  for i in range(0,len(a)):
-    b[i] = b[i-1]+a[i]
-  return b
-
 intersect = lambda x,y: [max(x[0],y[0]),max(x[1],y[1]),min(x[2],y[2]),min(x[3],y[3])]
 
 area = lambda x: (x[2]-x[0]+1)*(x[3]-x[1]+1)
@@ -60,45 +54,62 @@ def loadMaxDetectionsPerImage(detectionsData,maxDetections):
   return detections
 
 
+def pairwiseOverlaps(boxes,gtBoxes,overlapMeasure=ldet.IoU):
+  if overlapMeasure == ldet.IoU:
+    return ldet.iouMatrix(boxes,gtBoxes)
+  elif overlapMeasure == ldet.overlap:
+    return ldet.overlapMatrix(boxes,gtBoxes)
+  O = np.zeros( (len(boxes),len(gtBoxes)) )
+  for i in range(len(boxes)):
+    for j in range(len(gtBoxes)):
+      O[i,j] = overlapMeasure(boxes[i],gtBoxes[j])
+  return O
+
+def groupDetectionsByImage(detections):
+  images = {}
+  for i in range(len(detections)):
+    try:
+      images[detections[i][0]].append(i)
+    except:
+      images[detections[i][0]] = [i]
+  return images
+
 def evaluateDetections(groundTruth,detections,minOverlap,outFile=None,overlapMeasure=ldet.IoU,allowDuplicates=False):
   print 'Minimum overlap:',minOverlap
+  # Assign detections to ground truth objects, one image at a time
+  tp = np.zeros( (len(detections)), np.int )
+  maxOverlaps = [-1 for x in range(0,len(detections))]
+  byImage = groupDetectionsByImage(detections)
+  for img in byImage.keys():
+    if not img in groundTruth or len(groundTruth[img]) == 0:
+      continue
+    gt = groundTruth[img]
+    idx = np.asarray(byImage[img])
+    O = pairwiseOverlaps([detections[i][2:6] for i in idx], [bbox[0:4] for bbox in gt], overlapMeasure)
+    best = np.argmax(O, axis=1)
+    ov = O[np.arange(len(idx)),best]
+    assigned = np.asarray([bbox[4] for bbox in gt], np.bool)
+    hits = np.nonzero( (ov >= minOverlap) & ~assigned[best] )[0]
+    if not allowDuplicates:
+      # Only the most confident detection of each object is a true positive
+      objects,first = np.unique(best[hits], return_index=True)
+      hits = hits[first]
+      for j in objects:
+        gt[j][4] = True
+    tp[idx[hits]] = 1
+    for k in range(len(idx)):
+      maxOverlaps[idx[k]] = float(ov[k]) if ov[k] > 0 else 0
+  fp = 1 - tp
+
   if outFile != None:
-    log   = open(outFile+'.log','w')
-    paste = lambda x,y:str(x)+" "+str(y)
-    mix   = lambda det: reduce(paste, map(int,det[2:]))
-    logW  = lambda det,maxOverlap,label: log.write(det[0]+' '+mix(det)+' '+str(maxOverlap)+' '+label+'\n')
-  else:
-    logW = lambda x,y,z: x
+    log = open(outFile+'.log','w')
   logData = []
-  # Assign detections to ground truth objects
-  tp = [0 for x in range(0,len(detections))]
-  fp = [0 for x in range(0,len(detections))]
   for i in range(0,len(detections)):
     det = detections[i]
-    maxOverlap = -1
-    index = -1
-    label = "0"
-    if det[0] in groundTruth.keys():
-      for j in range(0,len(groundTruth[det[0]])):
-        bbox = groundTruth[det[0]][j]
-        overlap = overlapMeasure(det[2:6],bbox[0:4])
-        if overlap > maxOverlap:
-          maxOverlap = overlap
-          index = j
-      if maxOverlap >= minOverlap:
-        if not groundTruth[det[0]][index][4]: # Has not been assigned
-          tp[i] = 1 # True Positive
-          if not allowDuplicates:
-            groundTruth[det[0]][index][4] = True
-          label = "1"
-        else:
-          fp[i] = 1 # False Positive
-      else:
-        fp[i] = 1 # False Positive
-    else:
-      fp[i] = 1 # False Positive
-    logW(det,maxOverlap,label)
-    logData.append( [det[0]]+map(int,det[2:])+[maxOverlap,label] )
+    label = "1" if tp[i] == 1 else "0"
+    if outFile != None:
+      log.write(det[0]+' '+' '.join(map(str,map(int,det[2:])))+' '+str(maxOverlaps[i])+' '+label+'\n')
+    logData.append( [det[0]]+map(int,det[2:])+[maxOverlaps[i],label] )
 
   if outFile != None:
     missedF = open(outFile+'.missed','w')
@@ -108,26 +119,51 @@ def evaluateDetections(groundTruth,detections,minOverlap,outFile=None,overlapMea
           missedF.write(k+' {:} {:} {:} {:}\n'.format(det[0],det[1],det[2],det[3]))
     missedF.close()
     log.close()
-  return {'log':logData,'fp':fp,'tp':tp}
+  return {'log':logData,'fp':fp.tolist(),'tp':tp.tolist()}
 
 def computePrecisionRecall(numPositives,tp,fp,outFile=None):
   # Compute Precision/Recall
-  numTP = sum(tp)
-  numFP = sum(fp)
+  tp = np.cumsum(np.asarray(tp, np.float64))
+  fp = np.cumsum(np.asarray(fp, np.float64))
+  numTP = int(tp[-1]) if len(tp) > 0 else 0
+  numFP = int(fp[-1]) if len(fp) > 0 else 0
   print "True Positives:",numTP,"False Positives:",numFP
   if numTP > numPositives:
     totalPositives = numTP
   else:
     totalPositives = numPositives
-  tp = cumsum(tp)
-  fp = cumsum(fp)
-  recall = map(lambda x:x/float(totalPositives), tp)
-  precision = [tp[i]/(tp[i]+fp[i]) for i in range(0,len(tp))]
+  recall = tp/float(totalPositives)
+  precision = tp/(tp+fp)
   if outFile != None:
     output = open(outFile,"w")
-    for i in range(0,len(recall)):
-      output.write(str(recall[i])+" "+str(precision[i])+"\n")
-  
+    output.write(''.join([str(r)+" "+str(p)+"\n" for r,p in zip(recall.tolist(),precision.tolist())]))
+
+  AP2007,AP2012 = computeAveragePrecision(recall,precision)
+  if len(recall) > 0:
+    maxRecall = float(recall[-1])
+  else:
+    maxRecall = 0.0
+  print 'AP2012:',AP2012
+  print 'AP2007:',AP2007
+  print 'MAX RECALL:',maxRecall
+  if outFile != None:
+    output.write('AP='+str(AP2007))
+    output.close()
+  return AP2007, maxRecall
+
+def computePrecAt(tp,K):
+  print 'Prec@K',
+  tp = np.cumsum(tp)
+  for k in K:
+    hits = tp[min(k,len(tp))-1] if len(tp) > 0 else 0
+    print '(',str(k),':',hits/float(k),')',
+  print ''
+
+def computeAveragePrecision(recall,precision):
+  recall = np.asarray(recall, np.float64)
+  precision = np.asarray(precision, np.float64)
+  # Interpolated precision: maximum precision at any recall greater or equal
+  envelope = np.maximum.accumulate(precision[::-1])[::-1]
   '''
   PASCAL VOC 2012 devkit
   mrec=[0 ; rec ; 1];
@@ -138,15 +174,13 @@ def computePrecisionRecall(numPositives,tp,fp,outFile=None):
   i=find(mrec(2:end)~=mrec(1:end-1))+1;
   ap=sum((mrec(i)-mrec(i-1)).*mpre(i));
   '''
-  mrec = [0.0] + recall + [1.0]
-  mpre = [0.0] + precision + [0.0]
-  for i in range(len(mpre)-2, -1,-1):
-    mpre[i] = max(mpre[i],mpre[i+1])
-  idx = [i+1 for i in range(0,len(mrec)-1) if mrec[i+1] != mrec[i]]
+  mrec = np.concatenate( ([0.0], recall, [1.0]) )
+  mpre = np.concatenate( ([0.0], envelope, [0.0]) )
+  idx = np.searchsorted(mrec, mrec[1:], side='left')
+  idx = np.unique(idx[idx > 0])
   AP2012 = 0.0
-  for i in idx:
-    AP2012 +=( mrec[i]-mrec[i-1])*mpre[i]
-
+  for d in (mrec[idx]-mrec[idx-1])*mpre[idx]:
+    AP2012 += d
   '''
   PASCAL VOC 2007 devkit
   ap=0;
@@ -158,62 +192,96 @@ def computePrecisionRecall(numPositives,tp,fp,outFile=None):
       ap=ap+p/11;
   end
   '''
+  # Recall is non decreasing: max(prec(rec>=t)) is the envelope at the first rec >= t
+  first = np.searchsorted(recall, np.arange(0,11)/10.0, side='left')
+  p = np.append(envelope, 0.0)[first]
   AP2007 = 0.0
   for t in range(0,11,1):
-    idx = [i for i in range(0,len(recall)) if recall[i] >= float(t)/10.0]
-    if len(idx) != 0:
-      p = max( [precision[i] for i in idx] )
-    else:
-      p = 0.0
-    AP2007 += p/11
+    AP2007 += p[t]/11
+  return float(AP2007), float(AP2012)
 
-  if len(recall) > 0:
-    maxRecall = max(recall)
-  else:
-    maxRecall = 0.0
-  print 'AP2012:',AP2012
-  print 'AP2007:',AP2007
-  print 'MAX RECALL:',maxRecall
-  if outFile != None:
-    output.write('AP='+str(AP2007))
-    output.close()
-  return AP2007, maxRecall
+########################################
+## EVALUATION SWEEPS
+########################################
+# Evaluates a grid of overlap thresholds and top-K (per image) cutoffs computing
+# the detections vs ground truth overlaps only once.
+# Returns a list of rows [topk, overlap, recall, precision, AP2007]
+def evaluationSweep(detectionsData, indexData, overlaps, topks, overlapMeasure=ldet.IoU):
+  numPositives = float( len(indexData) )
+  groundTruth = loadGroundTruthAnnotations(indexData)
+  detections = loadMaxDetectionsPerImage(detectionsData, max(topks))
+  n = len(detections)
+  rank = np.zeros( (n), np.int )
+  maxOverlaps = -np.ones( (n) )
+  target = -np.ones( (n), np.int )
+  byImage = groupDetectionsByImage(detections)
+  objects = 0
+  for img in byImage.keys():
+    idx = np.asarray(byImage[img])
+    rank[idx] = np.arange(len(idx))
+    if not img in groundTruth or len(groundTruth[img]) == 0:
+      continue
+    gt = groundTruth[img]
+    O = pairwiseOverlaps([detections[i][2:6] for i in idx], [bbox[0:4] for bbox in gt], overlapMeasure)
+    best = np.argmax(O, axis=1)
+    maxOverlaps[idx] = O[np.arange(len(idx)),best]
+    target[idx] = objects + best
+    objects += len(gt)
 
-def computePrecAt(tp,K):
-  import numpy as np
-  print 'Prec@K',
-  for k in K:
-    print '(',str(k),':',np.sum(tp[0:k])/float(k),')',
-  print ''
+  results = []
+  for ov in overlaps:
+    # The most confident detection reaching the threshold on each object is a true positive
+    qualified = np.nonzero(maxOverlaps >= ov)[0]
+    first = np.unique(target[qualified], return_index=True)[1]
+    tp = np.zeros( (n), np.int )
+    tp[ qualified[first] ] = 1
+    for topk in topks:
+      tpK = tp[rank < topk]
+      numTP = tpK.sum()
+      recall = numTP/numPositives
+      precision = numTP/float(len(tpK)) if len(tpK) > 0 else 0.0
+      cumTP = np.cumsum(tpK)
+      recallCurve = cumTP/max(float(numTP),numPositives)
+      precisionCurve = cumTP/np.arange(1.0,len(tpK)+1.0)
+      AP2007,AP2012 = computeAveragePrecision(recallCurve, precisionCurve)
+      results.append( [topk, ov, float(recall), float(precision), AP2007] )
+  return results
+
+def writeDetectionLog(detectionsData, indexData, minOverlap, topK, output):
+  # .log and .missed files of one point of a sweep, as evaluateDetections writes them
+  groundTruth = loadGroundTruthAnnotations(indexData)
+  detections = loadMaxDetectionsPerImage(detectionsData, topK)
+  evaluateDetections(groundTruth, detections, minOverlap, output, overlapMeasure=ldet.overlap)
 
 def evaluateTopKDetectionsVsRecall(detectionsData, indexData, minOverlap, output, topks):
-  numPositives = float( len(indexData) )
-  topkRecall = []
-  for topk in topks:
-    groundTruth = loadGroundTruthAnnotations(indexData)
-    detections = loadMaxDetectionsPerImage(detectionsData, topk)
-    results = evaluateDetections(groundTruth, detections, minOverlap, output, overlapMeasure=ldet.overlap)
-    recall = sum(results['tp']) / numPositives
-    print topk, recall
-    topkRecall.append([topk,recall])
+  results = evaluationSweep(detectionsData, indexData, [minOverlap], topks, overlapMeasure=ldet.overlap)
   out = open(output,'w')
-  for r in topkRecall:
-    out.write(str(r[0]) + ' ' + str(r[1]) + '\n')
+  for r in results:
+    print r[0], r[2]
+    out.write(str(r[0]) + ' ' + str(r[2]) + '\n')
+  out.close()
+  # Log and missed objects of the last cutoff
+  writeDetectionLog(detectionsData, indexData, minOverlap, topks[-1], output)
   return
 
 def evaluateOverlapVsRecall(detectionsData, indexData, topK, output, overlaps):
-  numPositives = float( len(indexData) )
-  overlapRecall = []
-  for ov in overlaps:
-    groundTruth = loadGroundTruthAnnotations(indexData)
-    detections = loadMaxDetectionsPerImage(detectionsData, topK)
-    results = evaluateDetections(groundTruth, detections, ov, output, overlapMeasure=ldet.overlap)
-    recall = sum(results['tp']) / numPositives
-    print ov, recall
-    overlapRecall.append([ov,recall])
+  results = evaluationSweep(detectionsData, indexData, overlaps, [topK], overlapMeasure=ldet.overlap)
+  out = open(output,'w')
+  for r in results:
+    print r[1], r[2]
+    out.write(str(r[1]) + ' ' + str(r[2]) + '\n')
+  out.close()
+  # Log and missed objects of the last threshold
+  writeDetectionLog(detectionsData, indexData, overlaps[-1], topK, output)
+  return
+
+def evaluateSweep(detectionsData, indexData, output, overlaps, topks):
+  results = evaluationSweep(detectionsData, indexData, overlaps, topks)
   out = open(output,'w')
-  for r in overlapRecall:
-    out.write(str(r[0]) + ' ' + str(r[1]) + '\n')
+  for r in results:
+    print ' '.join(map(str,r))
+    out.write(' '.join(map(str,r)) + '\n')
+  out.close()
   return
 
 # Main Program
@@ -235,6 +303,9 @@ if __name__ == "__main__":
     topK = int(params['overlap'].replace('ROV',''))
     evaluateOverlapVsRecall(detectionsData, indexData, topK, params['output'], [x/20.0 for x in range(1,21)])
     sys.exit()
+  elif params['overlap'].startswith('SWEEP'):
+    evaluateSweep(detectionsData, indexData, params['output'], [x/100.0 for x in range(50,100,5)], [1]+range(5,101,5))
+    sys.exit()
   elif params['overlap'].startswith('OV'):
     overlapMeasure = ldet.overlap
     minOverlap = float(params['overlap'].replace('OV',''))
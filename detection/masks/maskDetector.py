@@ -129,13 +129,11 @@ def selectProposalsByArea(proposals,minArea,maxArea):
     return proposals
 
 def scoreProposals(scoringAreas,imgProp):
-    propScores = []
-    for box in imgProp:
-        boxScore = 0.0
-        for sarea in scoringAreas:
-            boxScore += det.IoU(box[1:], sarea[0:4])*sarea[4]
-        propScores.append(boxScore)
-    return propScores
+    if len(imgProp) == 0 or len(scoringAreas) == 0:
+        return [0.0 for box in imgProp]
+    scoringAreas = np.asarray(scoringAreas, dtype=np.float64)
+    ious = det.iouMatrix([box[1:] for box in imgProp], scoringAreas[:,0:4])
+    return ious.dot(scoringAreas[:,4]).tolist()
 
 class PredictionsToImagePlane():
     def __init__(self,proposals,convLayer,minArea,maxArea,nmsThreshold):
@@ -1,8 +1,8 @@
 import os,sys
-import Image
 import masks as mk
 from skimage import io
 import libDetection as det
+import imageCache as ic
 import numpy as np
 
 def binaryMask(width,height,boxes):
@@ -58,16 +58,16 @@ def makeWindowsFile(imgsDir, objects, windowSize, stride, outputFile, outputFigs
     out = open(outputFile,'w')
     imgIdx = 0
     for name in objects.keys():
-        img = Image.open(imgsDir+'/'+name+'.jpg')
-        negative = createNegativeWindows(img.size[0],img.size[1], objects[name], windowSize, stride)
-        positive = createPositiveWindows(img.size[0],img.size[1], objects[name], windowSize, stride)
+        size = ic.imageSize(imgsDir+'/'+name+'.jpg')
+        negative = createNegativeWindows(size[0],size[1], objects[name], windowSize, stride)
+        positive = createPositiveWindows(size[0],size[1], objects[name], windowSize, stride)
         regions = positive + negative
         
         out.write('# ' + str(imgIdx) + '\n') #     # image_index 
         out.write(imgsDir+'/'+name+'.jpg\n') #     img_path
         out.write('3\n')                     #     channels 
-        out.write(str(img.size[0])+'\n')     #     height 
-        out.write(str(img.size[1])+'\n')     #     width
+        out.write(str(size[0])+'\n')     #     height 
+        out.write(str(size[1])+'\n')     #     width
         out.write(str(len(regions))+'\n')    #     num_windows
         #     class_index overlap x1 y1 x2 y2
         for r in regions:
@@ -119,32 +119,28 @@ def projectCoordsToReceptiveField(arch,fromLayer):
 def intersectWithGroundTruth(A,gt):
   s = len(A)
   R = np.zeros((s,s))
-  for i in range(s):
-    for j in range(s):
-      maxIou,maxOv,maxCov = 0.,0.,[0.,[]]
-      for k in gt:
-        iou = det.IoU( A[i][j], k )
-        ov = det.overlap( k,A[i][j] )
-        cov = det.overlap( A[i][j], k )
-        if iou > maxIou: maxIou = iou
-        if ov > maxOv: maxOv = ov
-        if cov > maxCov[0]: maxCov = [cov,k]
-      #R[i,j] = maxOv
-      #continue
-      if maxIou >= 0.7: # Relative size is roughly the same
-        R[i,j] = 1.
-      #elif maxOv >= 0.7: # The object covers this area almost completely
-      #  R[i,j] = 1.
-      elif maxCov[0] >= 0.7: # The object is covered by the area
-        ox = maxCov[1][0] + (maxCov[1][2]-maxCov[1][0])/2.
-        oy = maxCov[1][1] + (maxCov[1][3]-maxCov[1][1])/2.
-        aw = A[i][j][2] - A[i][j][0]
-        ah = A[i][j][3] - A[i][j][1]
-        ax = A[i][j][0] + aw/2.
-        ay = A[i][j][1] + ah/2.
-        r = 0.2
-        if (ax-r*aw <= ox and ox <= ax+r*aw) and (ay-r*ah <= oy and oy <= ay+r*ah):
-          R[i,j] = 1.
+  if len(gt) == 0:
+    return R
+  areas = det.boxArray([A[i][j] for i in range(s) for j in range(s)])
+  gt = det.boxArray(gt)
+  maxIou = det.iouMatrix(areas,gt).max(axis=1)
+  cov = det.overlapMatrix(areas,gt)
+  best = np.argmax(cov,axis=1)
+  maxCov = cov[np.arange(areas.shape[0]),best]
+  # Relative size is roughly the same
+  match = maxIou >= 0.7
+  # The object is covered by the area and centered in it
+  k = gt[best]
+  ox = k[:,0] + (k[:,2]-k[:,0])/2.
+  oy = k[:,1] + (k[:,3]-k[:,1])/2.
+  aw = areas[:,2] - areas[:,0]
+  ah = areas[:,3] - areas[:,1]
+  ax = areas[:,0] + aw/2.
+  ay = areas[:,1] + ah/2.
+  r = 0.2
+  centered = (ax-r*aw <= ox) & (ox <= ax+r*aw) & (ay-r*ah <= oy) & (oy <= ay+r*ah)
+  match |= (maxCov >= 0.7) & centered
+  R[match.reshape((s,s))] = 1.
   return R
 
 def projectScoresBackToImagePlane(S,A):
@@ -6,8 +6,8 @@ from pybrain.rl.environments.environment import Environment
 from SingleObjectLocalizer import SingleObjectLocalizer
 
 import random
-import Image
 import utils as cu
+import imageCache as ic
 
 import RLConfig as config
 
@@ -73,8 +73,7 @@ class ObjectLocalizerEnvironment(Environment, Named):
       print 'All episodes done'
       return
 
-    self.visibleImage = Image.open(self.imageDir + '/' + self.imgName + '.jpg')
-    size = self.visibleImage.size
+    size = ic.imageSize(self.imageDir + '/' + self.imgName + '.jpg')
     self.state = [ SingleObjectLocalizer(size, box[0:4], box[4]) for box in self.state ]
     if config.geti('maxCandidatesPerImage') != 0 and self.mode == "Training":
       random.shuffle(self.state)
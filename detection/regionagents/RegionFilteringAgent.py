@@ -5,6 +5,7 @@ import RLConfig as config
 import numpy as np
 import scipy.io
 import MemoryUsage
+import ringBuffer as rb
 
 import RLConfig as config
 
@@ -30,14 +31,13 @@ class RegionFilteringAgent():
   def integrateObservation(self, obs):
     if obs['image'] != self.image:
       self.actionsH = [0 for i in range(NUM_ACTIONS)]
-      self.observation = np.zeros( (2,obs['state'].shape[0]), np.float32 )
+      self.observation = rb.RingBuffer(2, obs['state'].shape, np.float32)
       self.image = obs['image']
       self.timer = 0
       self.avgReward = 0.0
       if self.replayMemory != None:
         self.replayMemory.clear(self.image)
-    self.observation[1,:] = self.observation[0,:]
-    self.observation[0,:] = obs['state']
+    self.observation.push(obs['state'])
     self.action = None
     self.reward = None
 
@@ -47,7 +47,7 @@ class RegionFilteringAgent():
     assert self.reward == None
 
     self.timer += 1
-    obs = self.observation.reshape( (1,self.observation.shape[0]*self.observation.shape[1]) )
+    obs = self.observation.flat().reshape( (1,-1) )
     values = self.controller.getActionValues(obs)
     self.action = np.argmax(values, 1)[0]
     v = values[0,self.action]
@@ -61,7 +61,7 @@ class RegionFilteringAgent():
     self.reward = r
     self.avgReward = (self.avgReward*self.timer + r)/(self.timer + 1)
     if self.replayMemory != None:
-      obs = self.observation.reshape( (self.observation.shape[0]*self.observation.shape[1]))
+      obs = self.observation.flat()
       self.replayMemory.add(self.image, self.timer, self.action, obs, self.reward)
     self.actionsH[self.action] += 1
     print 'Agent::MemoryRecord => image:',self.image,'time:',self.timer,'action:',self.action,'reward',self.reward,'avgReward:',self.avgReward
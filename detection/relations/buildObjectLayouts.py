@@ -86,31 +86,32 @@ class ObjectLayout():
 
 def findBigMatches(img, big, tight):
   layouts = []
-  idealMatch = [0.25, 1.0]
-  for i in range(len(big)):
-    b = big[i]
-    for j in range(len(tight)):
-      t = tight[j]
-      r = [ det.IoU(b[1:], t[1:]), det.overlap(b[1:], t[1:])]
-      if 0.8 >= r[0] and r[1] >= 0.8:
-        s = b[0] + t[0]
-        ol = ObjectLayout(img)
-        ol.addRootAndContext(t,b,r)
-        layouts.append(ol)
+  if len(big) == 0 or len(tight) == 0:
+    return layouts
+  iou = det.iouMatrix([b[1:] for b in big], [t[1:] for t in tight])
+  ov = det.overlapMatrix([b[1:] for b in big], [t[1:] for t in tight])
+  matches = (0.8 >= iou) & (ov >= 0.8)
+  for i,j in zip(*np.nonzero(matches)):
+    ol = ObjectLayout(img)
+    ol.addRootAndContext(tight[j],big[i],[iou[i,j],ov[i,j]])
+    layouts.append(ol)
   layouts.sort(key=lambda x: x.getScore(), reverse=True)
   return layouts
 
 def findInsideMatches(inside, layouts):
   idealMatch = [0.25, 1.0]
+  if len(inside) == 0:
+    return layouts
+  insideBoxes = [n[1:] for n in inside]
   for i in range(len(layouts)):
     t = layouts[i].root
+    iou = det.iouMatrix(insideBoxes, t[1:])[:,0]
+    ov = det.overlapMatrix(t[1:], insideBoxes)[0,:]
     candidates = []
-    for j in range(len(inside)):
-      n = inside[j]
-      r = [ det.IoU(n[1:], t[1:]), det.overlap(t[1:], n[1:]) ]
-      if 0.8 >= r[0] and r[1] >= 0.8:
-        s = np.exp( -dist(idealMatch, r) )
-        candidates.append( [j,s,n[0],r] )
+    for j in np.nonzero( (0.8 >= iou) & (ov >= 0.8) )[0]:
+      r = [ iou[j], ov[j] ]
+      s = np.exp( -dist(idealMatch, r) )
+      candidates.append( [j,s,inside[j][0],r] )
     if len(candidates) > 0:
       candidates.sort(key=lambda x:x[1]+x[2],reverse=True)
       for k in range( min(MAX_NUMBER_OF_PARTS,len(candidates)) ):
@@ -50,17 +50,15 @@ if __name__ == "__main__":
     except:
       groundTruths = []
     for gt in groundTruths:
-      for i in range(mat['boxes'].shape[0]):
-        box = mat['boxes'][i,:].tolist()
-        iou = det.IoU(box, gt[1:])
-        if iou > mat['overlap'][i, categories[gt[0]]]:
-          mat['overlap'][i, categories[gt[0]]] = iou
-        if iou == 1:
-          mat['gt'][i] = 1.0
-          if mat['class'][i] == 0 or mat['class'][i] == categories[gt[0]]+1:
-            mat['class'][i] = categories[gt[0]]+1
-          else:
-            duplicate.append( {'row':i, 'class':categories[gt[0]]+1} )
+      ious = det.iouMatrix(mat['boxes'], gt[1:])[:,0]
+      c = categories[gt[0]]
+      mat['overlap'][:,c] = np.maximum(mat['overlap'][:,c], ious)
+      for i in np.nonzero(ious == 1)[0]:
+        mat['gt'][i] = 1.0
+        if mat['class'][i] == 0 or mat['class'][i] == categories[gt[0]]+1:
+          mat['class'][i] = categories[gt[0]]+1
+        else:
+          duplicate.append( {'row':i, 'class':categories[gt[0]]+1} )
     shift = 0
     for d in duplicate:
       for key in ['feat','gt','boxes','overlap','class']:
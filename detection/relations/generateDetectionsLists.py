@@ -48,11 +48,17 @@ counter = 0
 for i in imgs.keys():
   counter += 1
   print counter,i,
-  for j in selectedCategories:
+  n = len(imgs[i]['boxes'])
+  scores = imgs[i]['scores'].reshape( (n,-1) )[:,selectedCategories]
+  boxes = np.tile(det.boxArray(imgs[i]['boxes']), (len(selectedCategories),1))
+  classIds = np.repeat(np.arange(len(selectedCategories)), n)
+  keep = det.batchedNMS(boxes, scores.T.reshape(-1), classIds, 0.3)
+  for c in range(len(selectedCategories)):
+    j = selectedCategories[c]
     print categories[j],
-    fb, fs = det.nonMaximumSuppression(imgs[i]['boxes'], imgs[i]['scores'][:,j], 0.3)
-    for k in range(len(fb)):
-      out[categories[j]].write(i + ' {:.8f} {:.0f} {:.0f} {:.0f} {:.0f} {:.0f}\n'.format(fs[k],fb[k][0],fb[k][1],fb[k][2],fb[k][3],0))
+    for k in keep[ classIds[keep] == c ]:
+      b = boxes[k]
+      out[categories[j]].write(i + ' {:.8f} {:.0f} {:.0f} {:.0f} {:.0f} {:.0f}\n'.format(scores[k % n, c],b[0],b[1],b[2],b[3],0))
   print ''
   imgs[i] = []
 
@@ -5,28 +5,30 @@ import numpy as np
 from dataProcessor import processData
 import Image
 
+# Operators receive boxes (Nx4) and ground truths (Mx4) and return an NxM match matrix
+
 # Windows that contain a ground truth box
-def big(box, gt, a=0.9, b=0.3, c=0.2):
-  ov = det.overlap(box,gt)
-  iou = det.IoU(box,gt)
-  return ov >= a and iou <= b and iou >= c
+def big(boxes, gts, a=0.9, b=0.3, c=0.2):
+  ov = det.overlapMatrix(boxes,gts)
+  iou = det.iouMatrix(boxes,gts)
+  return (ov >= a) & (iou <= b) & (iou >= c)
 
 # Windows that pass the PASCAL criteria
-def tight(box, gt, a=0.9):
-  iou = det.IoU(box,gt)
+def tight(boxes, gts, a=0.9):
+  iou = det.iouMatrix(boxes,gts)
   return iou >= a
 
 # Windows inside a bounding box
-def inside(box, gt, a=1.0, b=0.3, c=0.2):
-  ov = det.overlap(gt,box)
-  iou = det.IoU(box,gt)
-  return ov >= a and iou <= b and iou >= c
+def inside(boxes, gts, a=1.0, b=0.3, c=0.2):
+  ov = det.overlapMatrix(gts,boxes).T
+  iou = det.iouMatrix(boxes,gts)
+  return (ov >= a) & (iou <= b) & (iou >= c)
 
 # Background windows
-def background(box,gt):
-  ov = det.overlap(box,gt)
-  iou = det.IoU(box,gt)
-  return ov < 0.3 and iou < 0.3
+def background(boxes,gts):
+  ov = det.overlapMatrix(boxes,gts)
+  iou = det.iouMatrix(boxes,gts)
+  return (ov < 0.3) & (iou < 0.3)
 
 class RegionSelector():
   def __init__(self,groundTruths,operator):
@@ -34,23 +36,11 @@ class RegionSelector():
     self.operator = operator
 
   def run(self,img,features,bboxes):
-    if not img in self.groundTruths.keys():
+    if not img in self.groundTruths:
       return 0
-    candidates = []
-    index = []
-    for b in bboxes:
-      box = map(float,b[1:])
-      match = False
-      for gt in self.groundTruths[img]:
-        match = self.operator(box,gt) 
-        if match:
-          break
-      if match:
-        candidates.append(True)
-        index.append( [img] + box )
-      else:
-        candidates.append(False)
-    candidates = np.asarray(candidates)
+    boxes = [map(float,b[1:]) for b in bboxes]
+    candidates = self.operator(boxes, self.groundTruths[img]).any(axis=1)
+    index = [ [img] + boxes[i] for i in range(len(boxes)) if candidates[i] ]
     return (features[candidates],index)
 
 def selectRegions(imageList, featuresDir, groundTruths, outputDir, featExt, category, operator):
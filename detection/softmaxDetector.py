@@ -1,4 +1,5 @@
 import os,sys
+import numpy as np
 import utils as cu
 import libDetection as det
 import BoxSearchEvaluation as bse
@@ -15,10 +16,15 @@ class SoftmaxDetector():
     s = cu.tic()
     result = {}
     boxSet = [ map(float, b[1:]) for b in boxes ]
-    for i in self.catIndex:
-      scores = features[:,i]
-      fb,fs = det.nonMaximumSuppression(boxSet, scores, self.maxOverlap)
-      result[i] = (image, fb, fs)
+    # Suppress all categories in one call
+    n = len(boxSet)
+    allBoxes = np.tile(det.boxArray(boxSet), (len(self.catIndex),1))
+    allScores = features[:,self.catIndex].T.reshape(-1)
+    classIds = np.repeat(np.arange(len(self.catIndex)), n)
+    keep = det.batchedNMS(allBoxes, allScores, classIds, self.maxOverlap)
+    for k in range(len(self.catIndex)):
+      kept = keep[ classIds[keep] == k ]
+      result[self.catIndex[k]] = (image, [boxSet[j % n] for j in kept], [allScores[j] for j in kept])
     s = cu.toc(image, s)
     return result
 
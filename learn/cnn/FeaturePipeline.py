@@ -0,0 +1,573 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import os, sys
+import time
+import Queue
+import threading
+from collections import OrderedDict
+from multiprocessing import Process, Lock, Value, Queue as ProcQueue
+import numpy as np
+
+from utils import tic, toc
+import dataProcessor as dp
+import imageCache as ic
+import batchWarp as bw
+import featureStore as fs
+
+CROP_SIZE = 227
+CONTEXT = 0.10
+CHUNK_SIZE = 64
+# Items waiting per worker before the previous stage blocks
+QUEUE_FACTOR = 2
+# Batches waiting for the forward stage and for the writer
+BATCH_QUEUE = 3
+# Seconds between checks of the other stages while waiting for windows
+POLL_SECONDS = 1.0
+# BGR mean pixel of ImageNet, for the NumPy backend
+MEAN_PIXEL = [104.0, 117.0, 123.0]
+
+########################################
+## STREAMING FEATURE EXTRACTION
+########################################
+# One pipeline for the extraction scripts in this directory. Each image goes
+# through these stages, connected by bounded queues:
+#   decode    (process pool)  read the JPEG into an RGB array
+#   crop      (process pool)  crop chunks of regions with context and warp them
+#                             to 3 x cropSize x cropSize BGR windows (batchWarp)
+#   assemble  (thread)        subtract the mean and fill fixed-size batches
+#   forward   (caller)        run the backend on every batch
+#   write     (thread)        gather the rows of each image and save them
+# Pools are started once and serve every run, so the network is never waiting
+# for processes to start. Bounded queues keep a few batches ready without
+# holding the whole dataset in memory. Every stage counts its items and busy
+# time; a stage with low utilization is waiting for the previous one.
+#
+# Region sources are ordered dictionaries {image: [[x1,y1,x2,y2], ...]}.
+# Backends implement mean (3 x cropSize x cropSize, BGR), batchSize and
+# forward(batch) -> {layer: (rows x dim)}. Outputs implement done(image),
+# write(image, boxes, features) and close(); NpzOutput and ConcatOutput
+# index the rows with the original lines of the boxes file. A failure in any
+# stage stops the run and is raised by run(); the pipeline cannot be used
+# after that.
+# extractCNNFeatures, extractCNNFeaturesPerImage and
+# extractCNNFeaturesFullImage are thin wrappers over this module.
+
+########################################
+## STAGE COUNTERS
+########################################
+class StageCounter():
+  # Shared by all the processes of a stage
+
+  def __init__(self, name, workers=1):
+    self.name = name
+    self.workers = workers
+    self.lock = Lock()
+    self.items = Value('l', 0, lock=False)
+    self.busy = Value('d', 0.0, lock=False)
+
+  def add(self, items, seconds):
+    with self.lock:
+      self.items.value += items
+      self.busy.value += seconds
+
+  def reset(self):
+    with self.lock:
+      self.items.value = 0
+      self.busy.value = 0.0
+
+  def report(self, elapsed):
+    rate = self.items.value/self.busy.value if self.busy.value > 0 else 0.0
+    use = 100*self.busy.value/(elapsed*self.workers) if elapsed > 0 else 0.0
+    print '{:10s} {:9d} items {:9.1f} items/s per worker {:6.1f}% busy'.format(self.name, self.items.value, rate, use)
+
+########################################
+## REGION SOURCES
+########################################
+def boxesFile(filename, oneBased=False, lines=None):
+  # Lines 'image x1 y1 x2 y2 ...', grouped by image in order of appearance.
+  # RCNN proposals are 1-based (Matlab). The original lines of every image,
+  # extra columns included, are kept in the lines dictionary if given
+  images = OrderedDict()
+  for line in open(filename):
+    r = line.split()
+    box = map(int, r[1:5])
+    if oneBased:
+      box = [x-1 for x in box]
+    images.setdefault(r[0], []).append(box)
+    if lines is not None:
+      lines.setdefault(r[0], []).append(line.rstrip('\n') + '\n')
+  return images
+
+def fullImages(imageList, imgsDir):
+  # One region with the whole image
+  images = OrderedDict()
+  for img in imageList:
+    width, height = ic.imageSize(imgsDir + '/' + img + '.jpg')
+    images[img] = [ [0, 0, width-1, height-1] ]
+  return images
+
+########################################
+## DECODE AND CROP
+########################################
+def draftScale(boxes, width, height, cropSize=CROP_SIZE, context=CONTEXT):
+  # Largest JPEG reduction (8, 4 or 2) that keeps every window at least
+  # cropSize pixels wide and high, 1 if windows would be upsampled
+  windows = bw.getWindows(boxes, width, height, context)
+  side = np.minimum(windows[:,2] - windows[:,0], windows[:,3] - windows[:,1]).min()
+  for k in [8, 4, 2]:
+    if side >= k*cropSize:
+      return k
+  return 1
+
+def loadImage(filename, boxes, cropSize=CROP_SIZE, context=CONTEXT, reduced=False):
+  # RGB array and the boxes in its coordinates. When reduced is set, JPEG
+  # images are decoded at a lower resolution if all windows allow it
+  if not reduced:
+    return ic.loadImage(filename), boxes
+  width, height = ic.imageSize(filename)
+  k = draftScale(boxes, width, height, cropSize, context)
+  if k == 1:
+    return ic.loadImage(filename), boxes
+  img = ic.loadImage(filename, (width/k, height/k))
+  scale = np.asarray([img.shape[1]/float(width), img.shape[0]/float(height)])[[0,1,0,1]]
+  return img, np.round(boxes*scale).astype(np.int64)
+
+def decodeWorker(tasks, chunks, imgsDir, chunkSize, cropSize, context, reduced, counter):
+  # Every image is decoded once per run: decoders do not keep images
+  ic.cache.maxBytes = 0
+  for name, boxes in iter(tasks.get, 'stop'):
+    start = time.time()
+    try:
+      img, cropBoxes = loadImage(imgsDir + '/' + name + '.jpg', boxes, cropSize, context, reduced)
+    except IOError:
+      print 'FeaturePipeline: cannot read image',name
+      img, cropBoxes = None, None
+    counter.add(1, time.time() - start)
+    if img is None:
+      chunks.put( (name, len(boxes), 0, boxes, None, None) )
+      continue
+    for s in range(0, len(boxes), chunkSize):
+      chunks.put( (name, len(boxes), s, boxes[s:s+chunkSize], img, cropBoxes[s:s+chunkSize]) )
+
+def cropWorker(chunks, windows, cropSize, context, method, counter):
+  for name, n, s, boxes, img, cropBoxes in iter(chunks.get, 'stop'):
+    if img is None:
+      windows.put( (name, n, s, boxes, None) )
+      continue
+    start = time.time()
+    # Windows are exact 8 bit values: they travel as uint8 through
+    # memory-mapped files instead of pickles
+    result = bw.warpBatch(img, cropBoxes, cropSize, context, method=method).astype(np.uint8)
+    counter.add(len(boxes), time.time() - start)
+    windows.put( (name, n, s, boxes, dp.shareArrays(result)) )
+
+########################################
+## FORWARD BACKENDS
+########################################
+def centerMean(mean, cropSize=CROP_SIZE):
+  # Center crop of a mean image as 3 x cropSize x cropSize. The mean files
+  # of Caffe (ilsvrc_2012_mean.npy, caffe.imagenet) are height x width x 3
+  if mean.shape[0] != 3:
+    mean = mean.swapaxes(1, 2).swapaxes(0, 1)
+  offset = (mean.shape[1] - cropSize)/2
+  return np.ascontiguousarray(mean[:, offset:offset+cropSize, offset:offset+cropSize]).astype(np.float32)
+
+class CaffeBackend():
+  # Nets of caffe.wrapperv0. Layers are {name: {'dim', 'idx'}} (parseLayers)
+  # and are read by blob name. outputDim is the size of the last layer of the
+  # net: 1000 for ImageNet, 21 for nets finetuned on PASCAL
+
+  def __init__(self, modelFile, pretrained, meanImage, layers, batchSize=200, outputDim=1000, cropSize=CROP_SIZE):
+    from caffe import wrapperv0
+    self.net = wrapperv0.ImageNetClassifier(modelFile, pretrained, IMAGE_DIM=256, CROPPED_DIM=cropSize, MEAN_IMAGE=meanImage)
+    self.setup(layers, batchSize, outputDim, cropSize, np.load(meanImage))
+
+  def setup(self, layers, batchSize, outputDim, cropSize, mean):
+    self.net.caffenet.set_phase_test()
+    self.net.caffenet.set_mode_gpu()
+    self.layers = layers
+    self.batchSize = batchSize
+    self.cropSize = cropSize
+    self.outputBlobs = [np.empty( (batchSize, outputDim, 1, 1), dtype=np.float32 )]
+    # BGR like the windows
+    self.mean = centerMean(mean, cropSize)
+
+  def outputs(self):
+    return self.net.caffenet.blobs
+
+  def blob(self, outputs, layer):
+    return outputs[layer]
+
+  def forward(self, batch):
+    # The network processes batchSize regions at a time: pad the last batch
+    n = len(batch)
+    inputBlobs = np.zeros( (self.batchSize, 3, self.cropSize, self.cropSize), dtype=np.float32 )
+    inputBlobs[0:n] = batch
+    self.net.caffenet.Forward([inputBlobs], self.outputBlobs)
+    outputs = self.outputs()
+    return dict([ (l, self.blob(outputs, l).data[0:n].reshape([n,-1]).copy()) for l in self.layers ])
+
+class ImagenetBackend(CaffeBackend):
+  # Nets of caffe.imagenet, used by the older extraction scripts: blobs() is a
+  # list and layers are read by their index. The mean is the one of the module
+
+  def __init__(self, modelFile, pretrained, layers, batchSize=200, outputDim=1000, cropSize=CROP_SIZE):
+    from caffe import imagenet
+    self.net = imagenet.ImageNetClassifier(modelFile, pretrained)
+    self.setup(layers, batchSize, outputDim, cropSize, imagenet.IMAGENET_MEAN)
+
+  def outputs(self):
+    return self.net.caffenet.blobs()
+
+  def blob(self, outputs, layer):
+    return outputs[self.layers[layer]['idx']]
+
+class NumpyBackend():
+  # Deterministic CPU stand-in: a random ReLU projection of a subsampled
+  # window for every layer, to run the pipeline without Caffe
+
+  def __init__(self, layers, batchSize=200, cropSize=CROP_SIZE, step=28, seed=0):
+    self.batchSize = batchSize
+    self.step = step
+    self.mean = np.tile(np.asarray(MEAN_PIXEL, np.float32)[:,np.newaxis,np.newaxis], (1,cropSize,cropSize))
+    inputs = 3*len(range(0,cropSize,step))**2
+    rng = np.random.RandomState(seed)
+    self.projections = OrderedDict([ (l,(rng.randn(inputs, layers[l]['dim'])/np.sqrt(inputs)).astype(np.float32)) for l in layers.keys() ])
+
+  def forward(self, batch):
+    x = batch[:, :, ::self.step, ::self.step].reshape( (len(batch),-1) )/255.0
+    return dict([ (l, np.maximum(np.dot(x, W), 0)) for l,W in self.projections.items() ])
+
+########################################
+## OUTPUTS
+########################################
+def indexLines(image, boxes, lines):
+  # The boxes file lines of the rows, as the extraction scripts wrote them,
+  # or 'image x1 y1 x2 y2' for regions without lines (fullImages)
+  if lines is not None:
+    return ''.join(lines[image])
+  return ''.join([image + ' ' + ' '.join(map(str,b)) + '\n' for b in boxes.tolist()])
+
+class NpzOutput():
+  # One compressed matrix per image and layer (outputDir/image.layer) and the
+  # boxes of its rows (outputDir/image.idx), as the extraction scripts did
+
+  def __init__(self, outputDir, layers, lines=None):
+    self.directory = outputDir
+    self.layers = layers
+    self.lines = lines
+    if not os.path.isdir(outputDir):
+      os.makedirs(outputDir)
+
+  def done(self, image):
+    return all([os.path.isfile(self.directory + '/' + image + '.' + l) for l in self.layers])
+
+  def write(self, image, boxes, features):
+    for l in self.layers:
+      with open(self.directory + '/' + image + '.' + l, 'w') as outf:
+        np.savez_compressed(outf, features[l])
+    with open(self.directory + '/' + image + '.idx', 'w') as idx:
+      idx.write(indexLines(image, boxes, self.lines))
+
+  def close(self):
+    pass
+
+class ConcatOutput():
+  # The rows of all images in one matrix per layer, saved every fileRecords
+  # rows as outFile + chunk + '.' + layer, and the boxes of the rows in
+  # outFile.idx, as extractCNNFeatures did
+
+  def __init__(self, outFile, layers, fileRecords=50000, lines=None):
+    self.outFile = outFile
+    self.layers = layers
+    self.lines = lines
+    self.fileRecords = fileRecords
+    self.index = open(outFile + '.idx', 'w')
+    self.rows = dict([ (l,[]) for l in layers ])
+    self.records = 0
+    self.chunk = 0
+
+  def done(self, image):
+    return False
+
+  def write(self, image, boxes, features):
+    self.index.write(indexLines(image, boxes, self.lines))
+    for l in self.layers:
+      self.rows[l].append(features[l])
+    self.records += len(boxes)
+    if self.records > self.fileRecords:
+      self.save()
+
+  def save(self):
+    for l in self.layers:
+      with open(self.outFile + str(self.chunk) + '.' + l, 'w') as outf:
+        np.savez_compressed(outf, np.vstack(self.rows[l]))
+      self.rows[l] = []
+    print 'Chunk',self.chunk,'saved with',self.records,'rows'
+    self.records = 0
+    self.chunk += 1
+
+  def close(self):
+    if self.records > 0:
+      self.save()
+    self.index.close()
+
+class StoreOutput():
+  # All images in one feature store (utils/featureStore.py), created when the
+  # first rows arrive and the dimension of every layer is known
+
+  def __init__(self, directory, regions, dtype=np.float32):
+    self.directory = directory
+    self.dtype = dtype
+    self.index = [ [img] + box for img in regions.keys() for box in regions[img] ]
+    self.first = {}
+    offset = 0
+    for img in regions.keys():
+      self.first[img] = offset
+      offset += len(regions[img])
+    self.store = None
+
+  def done(self, image):
+    return False
+
+  def write(self, image, boxes, features):
+    if self.store is None:
+      self.store, self.rowOf = fs.createFeatureStore(self.directory, self.index, dict([ (l,f.shape[1]) for l,f in features.items() ]), self.dtype)
+    rows = self.rowOf[self.first[image]:self.first[image] + len(boxes)]
+    for l in features.keys():
+      self.store.setFeatures(l, rows, features[l])
+
+  def close(self):
+    if self.store is not None:
+      self.store.flush()
+
+########################################
+## PIPELINE
+########################################
+class FeaturePipeline():
+
+  def __init__(self, imgsDir, decoders=2, croppers=4, chunkSize=CHUNK_SIZE, cropSize=CROP_SIZE, context=CONTEXT, method='bicubic', reduced=False):
+    # Create the pipeline before loading the network: workers are forked here.
+    # reduced decodes JPEG images at 1/2, 1/4 or 1/8 of their resolution
+    # when all their windows are still larger than cropSize
+    self.cropSize = cropSize
+    self.errors = []
+    self.counters = OrderedDict([ ('decode',StageCounter('decode', decoders)), ('crop',StageCounter('crop', croppers)),
+        ('assemble',StageCounter('assemble')), ('forward',StageCounter('forward')), ('write',StageCounter('write')) ])
+    self.tasks = ProcQueue(QUEUE_FACTOR*decoders)
+    self.chunks = ProcQueue(QUEUE_FACTOR*croppers)
+    self.windows = ProcQueue(QUEUE_FACTOR*croppers)
+    self.decoders = []
+    for i in range(decoders):
+      p = Process(target=decodeWorker, args=(self.tasks, self.chunks, imgsDir, chunkSize, cropSize, context, reduced, self.counters['decode']))
+      p.daemon = True
+      p.start()
+      self.decoders.append(p)
+    self.croppers = []
+    for i in range(croppers):
+      p = Process(target=cropWorker, args=(self.chunks, self.windows, cropSize, context, method, self.counters['crop']))
+      p.daemon = True
+      p.start()
+      self.croppers.append(p)
+
+  def feed(self, regions):
+    for img in regions.keys():
+      self.tasks.put( (img, np.asarray(regions[img], np.int64).reshape( (-1,4) )) )
+
+  def nextWindows(self):
+    # Waits for the croppers, but not for a stage that is gone
+    while True:
+      try:
+        return self.windows.get(timeout=POLL_SECONDS)
+      except Queue.Empty:
+        if len(self.errors) > 0:
+          raise RuntimeError('FeaturePipeline: images are not fed anymore')
+        if not all([p.is_alive() for p in self.decoders + self.croppers]):
+          raise RuntimeError('FeaturePipeline: a decode or crop worker died')
+
+  def assemble(self, rows, backend, batches):
+    counter = self.counters['assemble']
+    batchSize = backend.batchSize
+    batch = np.empty( (batchSize, 3, self.cropSize, self.cropSize), np.float32 )
+    tags = []
+    while rows > 0:
+      name, n, s, boxes, windows = self.nextWindows()
+      rows -= len(boxes)
+      if windows is None:
+        continue
+      start = time.time()
+      windows = dp.restoreArrays(windows)
+      i = 0
+      while i < len(windows):
+        k = min(len(windows) - i, batchSize - len(tags))
+        np.subtract(windows[i:i+k], backend.mean, out=batch[len(tags):len(tags)+k])
+        tags += [ (name, n, s+i+j, boxes[i+j]) for j in range(k) ]
+        i += k
+        if len(tags) == batchSize:
+          counter.add(batchSize, time.time() - start)
+          batches.put( (batch, tags) )
+          start = time.time()
+          batch = np.empty( (batchSize, 3, self.cropSize, self.cropSize), np.float32 )
+          tags = []
+      counter.add(0, time.time() - start)
+    if len(tags) > 0:
+      counter.add(len(tags), 0)
+      batches.put( (batch[0:len(tags)], tags) )
+    batches.put('stop')
+
+  def write(self, results, output):
+    counter = self.counters['write']
+    pending = {}
+    for outputs, tags in iter(results.get, 'stop'):
+      start = time.time()
+      images = 0
+      for r in range(len(tags)):
+        name, n, j, box = tags[r]
+        try:
+          image = pending[name]
+        except KeyError:
+          image = pending[name] = {'rows':0, 'boxes':np.zeros( (n,4), np.int64 ),
+                                   'features':dict([ (l,np.zeros( (n,outputs[l].shape[1]), np.float32 )) for l in outputs.keys() ])}
+        image['boxes'][j] = box
+        for l in outputs.keys():
+          image['features'][l][j] = outputs[l][r]
+        image['rows'] += 1
+        if image['rows'] == n:
+          output.write(name, image['boxes'], image['features'])
+          del pending[name]
+          images += 1
+      counter.add(images, time.time() - start)
+    output.close()
+
+  def stage(self, target, args, stopQueue=None, drainQueue=None):
+    # Body of the stage threads. A failure is kept for run(), and the stages
+    # around are released: the next one gets 'stop' and the previous one is
+    # read until its 'stop', so the forward loop never waits forever
+    try:
+      target(*args)
+    except Exception:
+      self.errors.append(sys.exc_info())
+      if stopQueue is not None:
+        stopQueue.put('stop')
+      if drainQueue is not None:
+        for item in iter(drainQueue.get, 'stop'):
+          pass
+
+  def run(self, regions, backend, output):
+    startTime = tic()
+    for counter in self.counters.values():
+      counter.reset()
+    regions = OrderedDict([ (img,boxes) for img,boxes in regions.items() if len(boxes) > 0 and not output.done(img) ])
+    rows = sum([len(boxes) for boxes in regions.values()])
+    print 'Extracting features for',rows,'regions in',len(regions),'images'
+    batches = Queue.Queue(BATCH_QUEUE)
+    results = Queue.Queue(BATCH_QUEUE)
+    self.errors = []
+    threads = [threading.Thread(target=self.stage, args=(self.feed, (regions,))),
+               threading.Thread(target=self.stage, args=(self.assemble, (rows, backend, batches), batches)),
+               threading.Thread(target=self.stage, args=(self.write, (results, output), None, results))]
+    for t in threads:
+      t.daemon = True
+      t.start()
+    counter = self.counters['forward']
+    try:
+      for batch, tags in iter(batches.get, 'stop'):
+        if len(self.errors) > 0:
+          break
+        start = time.time()
+        outputs = backend.forward(batch)
+        counter.add(len(tags), time.time() - start)
+        results.put( (outputs, tags) )
+    except Exception:
+      self.errors.append(sys.exc_info())
+    results.put('stop')
+    threads[2].join()
+    if len(self.errors) > 0:
+      # Workers and the feeder may be blocked on queues that nobody reads
+      self.terminate()
+      error = self.errors[0]
+      raise error[0], error[1], error[2]
+    for t in threads:
+      t.join()
+    elapsed = time.time() - startTime
+    for counter in self.counters.values():
+      counter.report(elapsed)
+    toc('Total processing time:', startTime)
+
+  def terminate(self):
+    for p in self.decoders + self.croppers:
+      p.terminate()
+    self.decoders = []
+    self.croppers = []
+
+  def stop(self):
+    for p in self.decoders:
+      self.tasks.put('stop')
+    for p in self.decoders:
+      p.join()
+    for p in self.croppers:
+      self.chunks.put('stop')
+    for p in self.croppers:
+      p.join()
+
+def parseLayers(layers):
+  # 'fc6:4096,prob:21' or 'fc6_neuron_cudanet_out:4096:15'. The dimension is
+  # only used by the NumPy backend, the index only by the imagenet backend
+  parsed = OrderedDict()
+  for l in layers.split(','):
+    name = l.split(':')
+    parsed[name[0]] = {'dim':int(name[1]) if len(name) > 1 else 4096, 'idx':int(name[2]) if len(name) > 2 else None}
+  return parsed
+
+# Options of the command line (name=value) and their defaults. reduced=1
+# decodes JPEG images at 1/2, 1/4 or 1/8 of their resolution when all their
+# windows allow it: faster, but windows are not exactly the full decode ones
+OPTIONS = {'decoders':2, 'croppers':4, 'chunkSize':CHUNK_SIZE, 'method':'bicubic', 'batchSize':200, 'outputDim':1000, 'reduced':0}
+
+def parseOptions(args, **defaults):
+  options = dict(OPTIONS)
+  options.update(defaults)
+  for a in args:
+    name, value = a.split('=', 1)
+    if name not in options:
+      raise ValueError('Unknown option ' + name + ', use one of ' + ' '.join(sorted(options.keys())))
+    options[name] = type(options[name])(value)
+  return options
+
+def createPipeline(imgsDir, options):
+  return FeaturePipeline(imgsDir, options['decoders'], options['croppers'], options['chunkSize'], method=options['method'], reduced=bool(options['reduced']))
+
+if __name__ == "__main__":
+  args = [a for a in sys.argv[1:] if '=' not in a]
+  if len(args) < 6:
+    print 'Use: FeaturePipeline.py regions imgsDir outputDir format layers backend [modelFile pretrained [meanImage]] [option=value ...]'
+    print '  regions: boxes:file, rcnn:file (1-based boxes) or full:imageList'
+    print '  format: npz, concat or store; layers: name[:dim[:index]],...'
+    print '  backend: caffe (wrapperv0, blobs by name), imagenet (caffe.imagenet, blobs by index) or numpy'
+    print '  options:',' '.join([k + '=' + str(v) for k,v in sorted(OPTIONS.items())])
+    sys.exit()
+  options = parseOptions([a for a in sys.argv[1:] if '=' in a])
+  source, filename = args[0].split(':', 1)
+  imgsDir, outputDir, outputFormat = args[1], args[2], args[3]
+  layers = parseLayers(args[4])
+  lines = None
+  if source == 'full':
+    regions = fullImages([x.strip() for x in open(filename)], imgsDir)
+  else:
+    lines = {}
+    regions = boxesFile(filename, oneBased=(source == 'rcnn'), lines=lines)
+  pipeline = createPipeline(imgsDir, options)
+  if args[5] == 'caffe':
+    backend = CaffeBackend(args[6], args[7], args[8], layers, options['batchSize'], options['outputDim'])
+  elif args[5] == 'imagenet':
+    backend = ImagenetBackend(args[6], args[7], layers, options['batchSize'], options['outputDim'])
+  else:
+    backend = NumpyBackend(layers, options['batchSize'])
+  if outputFormat == 'store':
+    output = StoreOutput(outputDir, regions)
+  elif outputFormat == 'concat':
+    output = ConcatOutput(outputDir, layers.keys(), lines=lines)
+  else:
+    output = NpzOutput(outputDir, layers.keys(), lines=lines)
+  pipeline.run(regions, backend, output)
+  pipeline.stop()
@@ -0,0 +1,107 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import numpy as np
+
+########################################
+## ROI MAX POOLING
+########################################
+# Reference implementation of the RoI pooling layer of Fast R-CNN, with the
+# same rounding as the Caffe layer. Boxes (x1,y1,x2,y2) in image coordinates
+# are projected on a (channels x height x width) feature map by spatialScale
+# (a number, or (scaleX,scaleY) when the image was warped), split in a grid of
+# pooledH x pooledW bins, and every bin keeps the max of its cells. Bins that
+# fall outside the map are 0. The max over a bin is taken over its rows first
+# and then over its columns, so a box costs pooledH + pooledW slice reductions.
+
+def binEdges(start, size, bins, limit):
+  binSize = size/float(bins)
+  b = np.arange(bins)
+  first = np.clip(np.floor(b*binSize).astype(np.int64) + start, 0, limit)
+  last = np.clip(np.ceil((b+1)*binSize).astype(np.int64) + start, 0, limit)
+  return first, last
+
+def projectBoxes(boxes, spatialScale):
+  scaleX, scaleY = (spatialScale, spatialScale) if np.isscalar(spatialScale) else spatialScale
+  scale = np.asarray([scaleX, scaleY, scaleX, scaleY], np.float64)
+  # Halves are rounded away from zero, like round() in the Caffe layer
+  x = np.asarray(boxes, np.float64).reshape( (-1,4) )*scale
+  return (np.sign(x)*np.floor(np.abs(x) + 0.5)).astype(np.int64)
+
+def roiMaxPool(featureMap, boxes, spatialScale, pooledH, pooledW):
+  channels, height, width = featureMap.shape
+  rois = projectBoxes(boxes, spatialScale)
+  pooled = np.zeros( (len(rois), channels, pooledH, pooledW), featureMap.dtype )
+  for i in range(len(rois)):
+    x1, y1, x2, y2 = rois[i]
+    rowStart, rowEnd = binEdges(y1, max(y2 - y1 + 1, 1), pooledH, height)
+    colStart, colEnd = binEdges(x1, max(x2 - x1 + 1, 1), pooledW, width)
+    left, right = colStart.min(), colEnd.max()
+    if right <= left:
+      continue
+    rows = np.zeros( (channels, pooledH, right - left), featureMap.dtype )
+    for ph in range(pooledH):
+      if rowEnd[ph] > rowStart[ph]:
+        rows[:,ph,:] = featureMap[:, rowStart[ph]:rowEnd[ph], left:right].max(axis=1)
+    for pw in range(pooledW):
+      if colEnd[pw] > colStart[pw]:
+        pooled[i,:,:,pw] = rows[:, :, colStart[pw]-left:colEnd[pw]-left].max(axis=2)
+  return pooled
+
+########################################
+## TRUNK NETWORKS
+########################################
+# A trunk turns an image into a feature map and pooled regions into
+# activations. It exposes:
+#   stride                    pixels of the input per cell of the feature map
+#   preprocess(image)         PIL image -> (3 x H x W) float32 network input
+#   featureMap(pixels)        network input -> (channels x h x w) feature map
+#   head(pooled)              (boxes x channels x pH x pW) -> {layer: (boxes x dim)}
+# The input of the trunk is in preprocessed pixels, so covering a region of
+# the image means writing the mean (zero) or pixels of another image there.
+
+def convolve(x, W, b, stride):
+  # x: (channels x height x width), W: (filters x channels x k x k), 'same' padding
+  k = W.shape[2]
+  pad = k/2
+  x = np.pad(x, ( (0,0), (pad,pad), (pad,pad) ), 'constant')
+  c, h, w = x.shape
+  outH = (h - k)/stride + 1
+  outW = (w - k)/stride + 1
+  s = x.strides
+  patches = np.lib.stride_tricks.as_strided(x, shape=(c, k, k, outH, outW), strides=(s[0], s[1], s[2], s[1]*stride, s[2]*stride))
+  y = np.tensordot(W, patches, axes=([1,2,3],[0,1,2])) + b[:,np.newaxis,np.newaxis]
+  return y.astype(np.float32)
+
+class RandomTrunk():
+  # Small random-weight network for CPU tests: strided 3x3 convolutions with
+  # ReLU, a fully connected layer and a softmax classifier on pooled regions.
+
+  def __init__(self, channels=(16,32,64), pooledSize=6, featureDim=4096, numClasses=21, layer='fc6', seed=0):
+    rng = np.random.RandomState(seed)
+    self.layer = layer
+    self.stride = 2**len(channels)
+    self.convolutions = []
+    inputs = 3
+    for c in channels:
+      W = (rng.randn(c, inputs, 3, 3)*np.sqrt(2.0/(inputs*9))).astype(np.float32)
+      self.convolutions.append( (W, np.zeros( (c), np.float32 )) )
+      inputs = c
+    inputs = inputs*pooledSize*pooledSize
+    self.fc = (rng.randn(inputs, featureDim)*np.sqrt(2.0/inputs)).astype(np.float32)
+    self.classifier = (rng.randn(featureDim, numClasses)/np.sqrt(featureDim)).astype(np.float32)
+
+  def preprocess(self, image):
+    pixels = np.asarray(image.convert('RGB'), np.float32)/255.0 - 0.5
+    return np.ascontiguousarray(pixels.transpose( (2,0,1) ))
+
+  def featureMap(self, pixels):
+    x = pixels
+    for W,b in self.convolutions:
+      x = np.maximum(convolve(x, W, b, 2), 0)
+    return x
+
+  def head(self, pooled):
+    features = np.maximum(np.dot(pooled.reshape( (len(pooled), -1) ), self.fc), 0)
+    scores = np.dot(features, self.classifier)
+    scores = np.exp(scores - scores.max(axis=1)[:,np.newaxis])
+    return {'prob':(scores/scores.sum(axis=1)[:,np.newaxis]).astype(np.float32), self.layer:features}
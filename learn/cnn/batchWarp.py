@@ -0,0 +1,144 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import numpy as np
+import scipy.sparse as sparse
+import Image
+from multiprocessing.pool import ThreadPool
+
+CROP_SIZE = 227
+CONTEXT = 0.10
+CHUNK_SIZE = 32
+
+########################################
+## BATCH CROP AND WARP
+########################################
+# Vectorized version of the getWindow + PIL resize loop of the extraction
+# scripts. Every box is enlarged by context on each side and clipped to the
+# image (getWindow), then resampled to cropSize x cropSize with the filters
+# of PIL resize: the sampling grid of each window is turned into two sparse
+# weight matrices (columns and rows), so warping a window is two sparse
+# matrix products over the few taps of every output pixel.
+# As in PIL, columns are resampled first and each pass is rounded to 8 bits.
+# The batch is (boxes x 3 x cropSize x cropSize) float32 in BGR, with the
+# mean (3 x cropSize x cropSize, BGR) subtracted when given.
+# The windows are those of warpRegions, the reference PIL path, up to the
+# fixed point coefficients of PIL: a few pixels differ by one gray level
+# (two with bicubic), see test_batchWarp. Boxes with a negative end (x2 or
+# y2 after the context) give black windows, where getWindow's slice wraps
+# around the image. Use method='bilinear' to match Image.BILINEAR (prepareImg
+# of extractCNNFeaturesPerImage).
+
+def getWindow(img, box, context=CONTEXT):
+  dx = int( float(box[2]-box[0])*context )
+  dy = int( float(box[3]-box[1])*context )
+  x1 = max(box[0]-dx,0)
+  x2 = min(box[2]+dx,img.shape[1])
+  y1 = max(box[1]-dy,0)
+  y2 = min(box[3]+dy,img.shape[0])
+  return img[ y1:y2, x1:x2, : ]
+
+def warpRegions(img, boxes, cropSize=CROP_SIZE, context=CONTEXT, resample=Image.BICUBIC):
+  # One box at a time with PIL: (boxes x cropSize x cropSize x 3) BGR windows
+  windows = np.zeros( (len(boxes), cropSize, cropSize, 3), np.uint8 )
+  for j in range(len(boxes)):
+    window = getWindow(img, boxes[j], context)
+    if window.shape[0] > 0 and window.shape[1] > 0:
+      # Resize and convert to BGR
+      windows[j] = np.asarray(Image.fromarray(window).resize( (cropSize,cropSize), resample ))[:, :, ::-1]
+  return windows
+
+def bilinear(x):
+  return np.maximum(1.0 - np.abs(x), 0)
+
+def bicubic(x, a=-0.5):
+  x = np.abs(x)
+  return np.where(x < 1.0, ((a + 2.0)*x - (a + 3.0))*x*x + 1,
+         np.where(x < 2.0, (((x - 5.0)*x + 8.0)*x - 4.0)*a, 0.0))
+
+# Filter and support of each resampling method
+FILTERS = {'bilinear':(bilinear, 1.0), 'bicubic':(bicubic, 2.0)}
+
+def getWindows(boxes, width, height, context=CONTEXT):
+  # getWindow for all boxes: (x1, y1, x2, y2) slice limits of every window
+  boxes = np.asarray(boxes).reshape( (-1,4) )[:,0:4].astype(np.int64)
+  dx = ( (boxes[:,2] - boxes[:,0])*context ).astype(np.int64)
+  dy = ( (boxes[:,3] - boxes[:,1])*context ).astype(np.int64)
+  x1 = np.maximum(boxes[:,0] - dx, 0)
+  x2 = np.minimum(boxes[:,2] + dx, width)
+  y1 = np.maximum(boxes[:,1] - dy, 0)
+  y2 = np.minimum(boxes[:,3] + dy, height)
+  return np.vstack( (x1, y1, x2, y2) ).T
+
+def samplingMatrices(sizes, outSize, method='bicubic'):
+  # One sparse (outSize x size) matrix for every input size with the weights
+  # of the input pixels of each output pixel, with the grid and support of
+  # PIL's resampling. The kernel is evaluated only on the taps of each output
+  # pixel, for all sizes at once
+  kernel, support = FILTERS[method]
+  sizes = np.asarray(sizes, np.float64)
+  if len(sizes) == 0:
+    return []
+  scale = sizes/outSize
+  filterScale = np.maximum(scale, 1.0)[:,np.newaxis]
+  support = support*filterScale
+  center = (np.arange(outSize) + 0.5)*scale[:,np.newaxis]
+  first = np.maximum(np.floor(center - support + 0.5), 0).astype(np.int64)
+  last = np.minimum(np.floor(center + support + 0.5), sizes[:,np.newaxis]).astype(np.int64)
+  taps = int(np.ceil(2*support.max())) + 2
+  x = first[:,:,np.newaxis] + np.arange(taps)
+  valid = x < last[:,:,np.newaxis]
+  weights = kernel( (x - center[:,:,np.newaxis] + 0.5)/filterScale[:,:,np.newaxis] )*valid
+  total = weights.sum(axis=2)
+  total[total == 0] = 1.0
+  weights = (weights/total[:,:,np.newaxis]).astype(np.float32)
+  pointers = np.hstack( (np.zeros( (len(sizes),1), np.int64 ), np.cumsum(valid.sum(axis=2), axis=1)) )
+  return [sparse.csr_matrix( (weights[n][valid[n]], x[n][valid[n]], pointers[n]), shape=(outSize, max(int(sizes[n]), 1)) )
+          for n in range(len(sizes))]
+
+def round8(x):
+  # Rounding and clipping of PIL for 8 bit images
+  np.add(x, 0.5, out=x)
+  return np.clip(x, 0, 255, out=x).astype(np.uint8)
+
+def warpChunk(imgT, windows, out, cropSize, method, mean):
+  widths = windows[:,2] - windows[:,0]
+  heights = windows[:,3] - windows[:,1]
+  columns = samplingMatrices(widths, cropSize, method)
+  rows = samplingMatrices(heights, cropSize, method)
+  for j in range(len(windows)):
+    x1, y1, x2, y2 = windows[j]
+    w, h = widths[j], heights[j]
+    if w <= 0 or h <= 0:
+      # Empty windows are black, like the windows of warpRegions
+      out[j] = 0
+    else:
+      # Columns of the (w x h*3) window first, then rows of the (h x cropSize*3) result
+      window = imgT[x1:x2, y1:y2, :].reshape( (w, h*3) )
+      window = round8(columns[j].dot(window)).reshape( (cropSize, h, 3) ).transpose( (1,0,2) ).reshape( (h, cropSize*3) )
+      window = round8(rows[j].dot(window)).reshape( (cropSize, cropSize, 3) )
+      # RGB (rows x columns x 3) -> BGR (3 x rows x columns)
+      out[j] = window[:, :, ::-1].transpose( (2,0,1) )
+    if mean is not None:
+      out[j] -= mean
+
+def warpBatch(img, boxes, cropSize=CROP_SIZE, context=CONTEXT, mean=None, method='bicubic', threads=1, out=None):
+  # img is the decoded (height x width x 3) RGB image, boxes a (N x 4) array
+  if img.ndim == 2:
+    img = np.tile(img[:, :, np.newaxis], (1, 1, 3))
+  elif img.shape[2] == 4:
+    img = img[:, :, :3]
+  windows = getWindows(boxes, img.shape[1], img.shape[0], context)
+  # Columns first: windows of the transposed image are (w x h*3) without copies
+  imgT = np.ascontiguousarray(img.transpose( (1,0,2) ))
+  if out is None:
+    out = np.empty( (len(windows), 3, cropSize, cropSize), np.float32 )
+  chunks = [ (s, min(s + CHUNK_SIZE, len(windows))) for s in range(0, len(windows), CHUNK_SIZE) ]
+  # Matrix products release the GIL: chunks can be warped by several threads
+  task = lambda c: warpChunk(imgT, windows[c[0]:c[1]], out[c[0]:c[1]], cropSize, method, mean)
+  if threads > 1 and len(chunks) > 1:
+    pool = ThreadPool(threads)
+    pool.map(task, chunks)
+    pool.close()
+  else:
+    map(task, chunks)
+  return out
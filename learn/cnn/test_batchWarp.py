@@ -0,0 +1,90 @@
+__author__ = "Juan C. Caicedo, caicedo@illinois.edu"
+
+import unittest
+import numpy as np
+import Image
+
+import learn.cnn.batchWarp as bw
+
+########################################
+## EQUIVALENCE WITH THE PIL PATH
+########################################
+# warpBatch against warpRegions (PIL resize, one box at a time) on a smooth
+# random image. The sparse float weights differ from the fixed point weights
+# of PIL by a rounding step in a few pixels: differences are bounded by
+# MAX_DIFF gray levels and their mean by MEAN_DIFF.
+
+WIDTH, HEIGHT = 500, 375
+MAX_DIFF = {'bicubic':2, 'bilinear':1}
+MEAN_DIFF = 0.001
+RESAMPLE = {'bicubic':Image.BICUBIC, 'bilinear':Image.BILINEAR}
+
+def smoothImage(seed=0):
+  # Noise at 1/8 resolution, upsampled: textured without being all edges
+  rng = np.random.RandomState(seed)
+  small = (rng.rand(HEIGHT/8, WIDTH/8, 3)*255).astype(np.uint8)
+  return np.asarray(Image.fromarray(small).resize( (WIDTH, HEIGHT), Image.BILINEAR ))
+
+def randomBoxes(n, seed=0):
+  rng = np.random.RandomState(seed)
+  boxes = []
+  for k in range(n):
+    x1, y1 = rng.randint(0, WIDTH-2), rng.randint(0, HEIGHT-2)
+    boxes.append( [x1, y1, rng.randint(x1+1, WIDTH), rng.randint(y1+1, HEIGHT)] )
+  return np.asarray(boxes)
+
+# Full image, one pixel boxes, thin boxes, boxes out of the image and empty
+# windows (x2 == x1 and x2 < x1)
+EDGE_BOXES = np.asarray([ [0,0,WIDTH,HEIGHT], [0,0,WIDTH-1,HEIGHT-1], [0,0,1,1], [WIDTH-2,HEIGHT-2,WIDTH-1,HEIGHT-1],
+  [0,10,WIDTH,11], [10,0,11,HEIGHT], [-20,-20,WIDTH+50,HEIGHT+50], [WIDTH-1,0,WIDTH,HEIGHT], [10,10,10,50], [5,5,4,20] ])
+
+class BatchWarpTest(unittest.TestCase):
+
+  def setUp(self):
+    self.img = smoothImage()
+
+  def compare(self, boxes, method):
+    reference = bw.warpRegions(self.img, boxes, resample=RESAMPLE[method]).transpose( (0,3,1,2) ).astype(np.int64)
+    windows = bw.warpBatch(self.img, boxes, method=method)
+    self.assertEqual(windows.shape, (len(boxes), 3, bw.CROP_SIZE, bw.CROP_SIZE))
+    diff = np.abs(windows.astype(np.int64) - reference)
+    self.assertLessEqual(diff.max(), MAX_DIFF[method])
+    self.assertLess(diff.mean(), MEAN_DIFF)
+
+  def testRandomBoxesBicubic(self):
+    self.compare(randomBoxes(300), 'bicubic')
+
+  def testRandomBoxesBilinear(self):
+    self.compare(randomBoxes(300), 'bilinear')
+
+  def testEdgeBoxes(self):
+    for method in ['bicubic', 'bilinear']:
+      self.compare(EDGE_BOXES, method)
+
+  def testEmptyWindows(self):
+    windows = bw.warpBatch(self.img, EDGE_BOXES[-2:])
+    self.assertEqual(np.abs(windows).max(), 0)
+
+  def testNegativeEnd(self):
+    # getWindow slices img[0:-5]: a negative end wraps around the image.
+    # getWindows keeps it, the width is negative and the window is black
+    box = np.asarray([ [-5,-5,-5,20] ])
+    self.assertEqual(tuple(bw.getWindows(box, WIDTH, HEIGHT)[0]), (0, 0, -5, 22))
+    self.assertEqual(np.abs(bw.warpBatch(self.img, box)).max(), 0)
+
+  def testMean(self):
+    boxes = randomBoxes(20)
+    mean = np.random.RandomState(1).rand(3, bw.CROP_SIZE, bw.CROP_SIZE).astype(np.float32)*255
+    self.assertTrue(np.allclose(bw.warpBatch(self.img, boxes, mean=mean), bw.warpBatch(self.img, boxes) - mean))
+
+  def testThreads(self):
+    boxes = randomBoxes(100)
+    self.assertTrue(np.array_equal(bw.warpBatch(self.img, boxes, threads=3), bw.warpBatch(self.img, boxes)))
+
+  def testGrayImage(self):
+    boxes = randomBoxes(20)
+    gray = self.img[:,:,0]
+    self.assertTrue(np.array_equal(bw.warpBatch(gray, boxes), bw.warpBatch(np.dstack([gray]*3), boxes)))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -2,10 +2,10 @@ __author__ = "Juan C. Caicedo, caicedo@illinois.edu"
 
 import os
 import random
-import Image
 import CaffeConvNetManagement as cnm
 import SingleObjectLocalizer as sol
 import RLConfig as config
+import imageCache as ic
 import numpy as np
 
 from pybrain.rl.learners.valuebased.valuebased import ValueBasedLearner
@@ -88,7 +88,7 @@ class DeepQLearning(ValueBasedLearner):
     if controller.net == None:
       return records
     for img in records.keys():
-      imSize = Image.open(img).size
+      imSize = ic.imageSize(img)
       states = []
       imName = img.split('/')[-1].replace('.jpg','') # Extract image name only from the full image path
       for i in range(len(records[img])):
@@ -7,18 +7,19 @@ def readConfiguration(inputFile):
   for d in data:
     configValues[d[0]] = d[1]
 
-def get(key, type=lambda x:x):
+def get(key, type=lambda x:x, default=None):
   try: 
     val = type(configValues[key])
   except: 
-    val = None
-    print 'Configuration variable:',key,'does not exist'
+    val = default
+    if default is None:
+      print 'Configuration variable:',key,'does not exist'
   return val
 
-def geti(key):
-  return get(key,int)
+def geti(key, default=None):
+  return get(key,int,default)
 
-def getf(key):
-  return get(key,float)
+def getf(key, default=None):
+  return get(key,float,default)
 
 
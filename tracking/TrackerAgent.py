@@ -5,6 +5,7 @@ import RLConfig as config
 import numpy as np
 import scipy.io
 import MemoryUsage
+import ringBuffer as rb
 
 import RLConfig as config
 import BoxSearchState as bss
@@ -36,14 +37,14 @@ class BoxSearchAgent():
   def integrateObservation(self, obs):
     if obs['image'] != self.image:
       self.actionsH = [0 for i in range(NUM_ACTIONS)]
-      self.observation = np.zeros( (TEMPORAL_WINDOW, STATE_FEATURES), np.float32 )
+      # The last TEMPORAL_WINDOW states, newest first. The shift loop used
+      # before repeated the previous state in all older rows (utils/test_ringBuffer)
+      self.observation = rb.RingBuffer(TEMPORAL_WINDOW, (STATE_FEATURES,), np.float32)
       self.image = obs['image']
       self.negative = obs['negEpisode']
       self.timer = 0
       self.avgReward = 0.0
-    for t in range(TEMPORAL_WINDOW-1):
-      self.observation[t+1,:] = self.observation[t,:]
-    self.observation[0,:] = obs['state']
+    self.observation.push(obs['state'])
     self.action = None
     self.reward = None
 
@@ -53,7 +54,7 @@ class BoxSearchAgent():
     assert self.reward == None
 
     self.timer += 1
-    obs = self.observation.reshape( (1, TEMPORAL_WINDOW*STATE_FEATURES) )
+    obs = self.observation.window().reshape( (1, TEMPORAL_WINDOW*STATE_FEATURES) )
     values = self.controller.getActionValues(obs)
     self.action = np.argmax(values, 1)[0]
     v = values[0,self.action]
@@ -66,7 +67,7 @@ class BoxSearchAgent():
 
     self.reward = r
     self.avgReward = (self.avgReward*(self.timer-1) + r)/(self.timer)
-    obs = self.observation.reshape((TEMPORAL_WINDOW*STATE_FEATURES))
+    obs = self.observation.flat()
     if self.replayMemory != None:
       if not self.negative:
         self.replayMemory.add(self.image, self.timer, self.action, obs, self.reward)
@@ -80,7 +81,7 @@ class BoxSearchAgent():
           self.replayMemory.add(self.image, self.timer, bss.PLACE_LANDMARK, obs, -2.0)
     if self.action == bss.PLACE_LANDMARK:
       # Clean history of observations
-      self.observation = np.zeros( (TEMPORAL_WINDOW, STATE_FEATURES), np.float32 )
+      self.observation.clear()
     self.actionsH[self.action] += 1
     print 'Agent::MemoryRecord => image:',self.image,'time:',self.timer,'action:',self.action,'reward',self.reward,'avgReward:',self.avgReward
 
@@ -8,10 +8,10 @@ import ConvNet as cn
 
 import random
 import numpy as np
-import json
 
 import utils as cu
 import libDetection as det
+import episodeLog as el
 import RLConfig as config
 
 def sigmoid(x, a=1.0, b=0.0):
@@ -21,6 +21,7 @@ def tanh(x, a=5, b=0.5, c=2.0):
   return c*np.tanh(a*x + b)
 
 TEST_TIME_OUT = config.geti('testTimeOut')
+TEST_MEMORY_FORMAT = config.get('testMemoryFormat', default='json')
 
 class BoxSearchEnvironment(Environment, Named):
 
@@ -28,6 +29,7 @@ class BoxSearchEnvironment(Environment, Named):
     self.mode = mode
     self.cnn = cn.ConvNet()
     self.testRecord = None
+    self.testLog = el.openTestMemory(config.get('testMemory'), mode, TEST_MEMORY_FORMAT)
     self.idx = -1
     self.imageList = [x.strip() for x in open(imageList)]
     self.groundTruth = cu.loadBoxIndexFile(groundTruthFile)
@@ -50,8 +52,7 @@ class BoxSearchEnvironment(Environment, Named):
     if self.selectNegativeSample(): return
     # Save actions performed during this episode
     if self.mode == 'test' and self.testRecord != None:
-      with open(config.get('testMemory') + self.imageList[self.idx] + '.txt', 'w') as outfile:
-        json.dump(self.testRecord, outfile)
+      el.saveTestRecord(config.get('testMemory'), self.testLog, self.imageList[self.idx], self.testRecord)
     # Load a new episode
     self.idx += 1
     if self.idx < len(self.imageList):
@@ -63,7 +64,7 @@ class BoxSearchEnvironment(Environment, Named):
       self.startingActivations = self.cnn.getActivations( self.groundTruth[previousImageName][0])
       self.cnn.prepareImage(self.imageList[self.idx])
       self.state = bs.BoxSearchState(self.imageList[self.idx], groundTruth=self.groundTruth)
-      print 'Environment::LoadNextEpisode => Image',self.idx,self.imageList[self.idx],'('+str(self.state.visibleImage.size[0])+','+str(self.state.visibleImage.size[1])+')'
+      print 'Environment::LoadNextEpisode => Image',self.idx,self.imageList[self.idx],'('+str(self.state.imageSize[0])+','+str(self.state.imageSize[1])+')'
     else:
       if self.mode == 'train':
         random.shuffle(self.imageList)
@@ -75,6 +76,10 @@ class BoxSearchEnvironment(Environment, Named):
     if self.mode == 'test':
       self.testRecord = {'boxes':[], 'actions':[], 'values':[], 'rewards':[], 'scores':[]}
 
+  def flushTestMemory(self):
+    if self.testLog is not None:
+      self.testLog.flush()
+
   def selectNegativeSample(self):
     if self.mode == 'train' and random.random() < self.negativeProbability:
       idx = random.randint(0,len(self.negativeSamples)-1)
@@ -1,6 +1,7 @@
 import os,sys
 import utils as cu
 import libDetection as det
+import episodeLog as el
 import evaluation as eval
 
 import json
@@ -36,6 +37,8 @@ def getRelationCategories():
   return categories, catIndex
 
 def loadScores(memDir, catI):
+  if el.isEpisodeLog(memDir):
+    return loadLogScores(el.logFile(memDir), catI)
   totalNumberOfBoxes = 0
   sumOfPercentBoxesUsed = 0
   totalImages = 0
@@ -70,6 +73,21 @@ def loadScores(memDir, catI):
   print 'Average boxes per image: {:5.1f}'.format(totalNumberOfBoxes/float(totalImages))
   return scoredDetections
 
+def loadLogScores(logFile, catI):
+  # Same output of loadScores, read from a binary episode log
+  log = el.EpisodeLog(logFile)
+  totalNumberOfBoxes = 0
+  scoredDetections = {}
+  for imageName in log.images():
+    rows = log.episode(imageName)
+    landmarks = np.where(rows['action'] == 8, rows['value'], float('-inf'))
+    scoredDetections[imageName] = {'boxes':rows['box'].tolist(), 'scores':rows['scores'][:,catI].tolist() if catI > 0 else [0 for i in range(len(rows))],
+                                   'values':rows['value'].tolist(), 'landmarks':landmarks.tolist()}
+    totalNumberOfBoxes += len(rows)
+    print imageName,'detections:',len(rows)
+  print 'Average boxes per image: {:5.1f}'.format(totalNumberOfBoxes/float(len(scoredDetections)))
+  return scoredDetections
+
 def evaluateCategory(scoredDetections, ranking, groundTruthFile, output=None):
   performance = []
   detections = []
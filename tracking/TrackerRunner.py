@@ -90,6 +90,7 @@ class BoxSearchRunner():
     interactions = config.geti('testInteractions')
     self.controller.setEpsilonGreedy(config.getf('testEpsilon'))
     self.runEpoch(interactions, len(self.environment.imageList))
+    self.environment.flushTestMemory()
 
   def doValidation(self, epoch):
     if epoch % config.geti('validationEpochs') != 0:
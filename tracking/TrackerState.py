@@ -4,8 +4,8 @@ import time
 import utils as cu
 import libDetection as det
 import numpy as np
-import Image
 import random
+import imageCache as ic
 
 import BoxSearchTask as bst
 import RLConfig as config
@@ -39,7 +39,7 @@ class BoxSearchState():
 
   def __init__(self, imageName, groundTruth=None):
     self.imageName = imageName
-    self.visibleImage = Image.open(config.get('imageDir') + '/' + self.imageName + '.jpg')
+    self.imageSize = ic.imageSize(config.get('imageDir') + '/' + self.imageName + '.jpg')
     self.box = [0,0,0,0]
     self.landmarkIndex = {}
     self.actionChosen = 2
@@ -79,24 +79,24 @@ class BoxSearchState():
     newBox = self.box[:]
     step = STEP_FACTOR*self.boxW
     # This action preserves box width and height
-    if self.box[0] + step + self.boxW < self.visibleImage.size[0]:
+    if self.box[0] + step + self.boxW < self.imageSize[0]:
       newBox[0] += step
       newBox[2] += step
     else:
-      newBox[0] = self.visibleImage.size[0] - self.boxW - 1
-      newBox[2] = self.visibleImage.size[0] - 1
+      newBox[0] = self.imageSize[0] - self.boxW - 1
+      newBox[2] = self.imageSize[0] - 1
     return self.adjustAndClip(newBox)
 
   def yCoordUp(self):
     newBox = self.box[:]
     step = STEP_FACTOR*self.boxH
     # This action preserves box width and height
-    if self.box[1] + step + self.boxH < self.visibleImage.size[1]:
+    if self.box[1] + step + self.boxH < self.imageSize[1]:
       newBox[1] += step
       newBox[3] += step
     else:
-      newBox[1] = self.visibleImage.size[1] - self.boxH - 1
-      newBox[3] = self.visibleImage.size[1] - 1
+      newBox[1] = self.imageSize[1] - self.boxH - 1
+      newBox[3] = self.imageSize[1] - 1
     return self.adjustAndClip(newBox)
 
   def scaleUp(self):
@@ -104,15 +104,15 @@ class BoxSearchState():
     # This action preserves aspect ratio
     widthChange = DELTA_SIZE*self.boxW
     heightChange = DELTA_SIZE*self.boxH
-    if self.boxW + widthChange < self.visibleImage.size[0]:
-      if self.boxH + heightChange < self.visibleImage.size[1]:
+    if self.boxW + widthChange < self.imageSize[0]:
+      if self.boxH + heightChange < self.imageSize[1]:
         newDelta = DELTA_SIZE
       else:
-        newDelta = self.visibleImage.size[1]/self.boxH - 1
+        newDelta = self.imageSize[1]/self.boxH - 1
     else:
-      newDelta = self.visibleImage.size[0]/self.boxW - 1
-      if self.boxH + newDelta*self.boxH >= self.visibleImage.size[1]:
-        newDelta = self.visibleImage.size[1]/self.boxH - 1
+      newDelta = self.imageSize[0]/self.boxW - 1
+      if self.boxH + newDelta*self.boxH >= self.imageSize[1]:
+        newDelta = self.imageSize[1]/self.boxH - 1
     widthChange = newDelta*self.boxW/2.0
     heightChange = newDelta*self.boxH/2.0
     newBox[0] -= widthChange
@@ -125,14 +125,14 @@ class BoxSearchState():
     newBox = self.box[:]
     # This action preserves width
     heightChange = DELTA_SIZE*self.boxH
-    if self.boxH + heightChange < self.visibleImage.size[1]:
+    if self.boxH + heightChange < self.imageSize[1]:
       ar = (self.boxH + heightChange)/self.boxW
       if ar < MAX_ASPECT_RATIO:
         newDelta = DELTA_SIZE
       else:
         newDelta = 0.0
     else:
-      newDelta = self.visibleImage.size[1]/self.boxH - 1
+      newDelta = self.imageSize[1]/self.boxH - 1
       ar = (self.boxH + newDelta*self.boxH)/self.boxW
       if ar > MAX_ASPECT_RATIO:
         newDelta =  0.0
@@ -191,14 +191,14 @@ class BoxSearchState():
     newBox = self.box[:]
     # This action preserves height
     widthChange = DELTA_SIZE*self.boxW
-    if self.boxW + widthChange < self.visibleImage.size[0]:
+    if self.boxW + widthChange < self.imageSize[0]:
       ar = self.boxH/(self.boxW + widthChange)
       if ar >= MIN_ASPECT_RATIO:
         newDelta = DELTA_SIZE
       else:
         newDelta = 0.0
     else:
-      newDelta = self.visibleImage.size[0]/self.boxW - 1
+      newDelta = self.imageSize[0]/self.boxW - 1
       ar = self.boxH/(self.boxW + newDelta*self.boxW)
       if ar < MIN_ASPECT_RATIO:
         newDelta =  0.0
@@ -212,39 +212,39 @@ class BoxSearchState():
     if box[0] < 0:
       # Can we move it to the right?
       step = -box[0]
-      if box[2] + step < self.visibleImage.size[0]:
+      if box[2] + step < self.imageSize[0]:
         box[0] += step
         box[2] += step
       else:
         box[0] = 0
-        box[2] = self.visibleImage.size[0] - 1
+        box[2] = self.imageSize[0] - 1
     if box[1] < 0:
       step = -box[1]
       # Can we move it down?
-      if box[3] + step < self.visibleImage.size[1]:
+      if box[3] + step < self.imageSize[1]:
         box[1] += step
         box[3] += step
       else:
         box[1] = 0
-        box[3] = self.visibleImage.size[1] - 1
-    if box[2] >= self.visibleImage.size[0]:
-      step = box[2] - self.visibleImage.size[0]
+        box[3] = self.imageSize[1] - 1
+    if box[2] >= self.imageSize[0]:
+      step = box[2] - self.imageSize[0]
       # Can we move it to the left?
       if box[0] - step >= 0:
         box[0] -= step
         box[2] -= step
       else:
         box[0] = 0
-        box[2] = self.visibleImage.size[0] - 1
-    if box[3] >= self.visibleImage.size[1]:
-      step = box[3] - self.visibleImage.size[1]
+        box[2] = self.imageSize[0] - 1
+    if box[3] >= self.imageSize[1]:
+      step = box[3] - self.imageSize[1]
       # Can we move it up?
       if box[1] - step >= 0:
         box[1] -= step
         box[3] -= step
       else:
         box[1] = 0
-        box[3] = self.visibleImage.size[1] - 1
+        box[3] = self.imageSize[1] - 1
     return box
 
   def placeLandmark(self):
@@ -258,7 +258,7 @@ class BoxSearchState():
   def reset(self):
     oldBox = self.box[:]
     self.stepsWithoutLandmark = 0
-    #self.box = map(float, [0,0,self.visibleImage.size[0]-1,self.visibleImage.size[1]-1])
+    #self.box = map(float, [0,0,self.imageSize[0]-1,self.imageSize[1]-1])
     self.box = self.groundTruth[str(int(self.imageName)-1)][0]
     self.boxW = self.box[2]-self.box[0]
     self.boxH = self.box[3]-self.box[1]
@@ -267,7 +267,7 @@ class BoxSearchState():
 
   def updateStatus(self, newBox):
     self.boxChanged = reduce(lambda x,y: x and y, [ newBox[i] == self.box[i] for i in range(4) ])
-    self.touchEdges = [newBox[0] < 1, newBox[1] < 1, newBox[2] >= self.visibleImage.size[0]-2, newBox[3] >= self.visibleImage.size[1]-2]
+    self.touchEdges = [newBox[0] < 1, newBox[1] < 1, newBox[2] >= self.imageSize[0]-2, newBox[3] >= self.imageSize[1]-2]
 
   def sampleNextAction(self):
     if self.groundTruth is None:
@@ -1,25 +1,30 @@
 import os,sys
 import numpy as np
-from multiprocessing import Process, JoinableQueue, Queue
-from StringIO import StringIO
+from multiprocessing import Process, Queue, cpu_count
+from threading import Thread
+import tempfile
 import re
 from utils import floatType,tic,toc
+import featureStore as fs
 
-def loadFeaturesAndIndex(img,content,index):
-  try:
-    data = np.load(StringIO(content))
-    m = data['arr_0']
-    l = [x.split() for x in index.split('\n') if x != '']
-    data.close()
-  except:
-    print 'Error with',img
+# Tasks waiting per worker before the producer blocks
+QUEUE_FACTOR = 2
+# Arrays larger than this are returned through memory-mapped temporary files
+MIN_SHARED_BYTES = 1024*1024
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def loadFeaturesAndIndex(img,filename,idxFile):
+  data = np.load(filename)
+  m = data['arr_0']
+  l = [x.split() for x in open(idxFile)]
+  data.close()
   return (m.astype(floatType),l)
 
-def loadFilteredFeaturesAndIndex(img,content,index):
+def loadFilteredFeaturesAndIndex(img,filename,idxFile):
   import libDetection as det
   import numpy as np
   MAX_BOXES = 1000
-  m,l = loadFeaturesAndIndex(img,content,index)
+  m,l = loadFeaturesAndIndex(img,filename,idxFile)
   if len(l) > MAX_BOXES:
     limit = max(len(l)-MAX_BOXES,0)
     areas = [ det.area(map(float,b[1:])) for b in l]
@@ -30,58 +35,102 @@ def loadFilteredFeaturesAndIndex(img,content,index):
   else:
     return m,l
 
-def worker(inQueue, outQueue, task):
-  for data in iter(inQueue.get,'stop'):
-    #s = tic()
-    img,content,index = data
-    #img,con,ind = data
-    #conFile = open(con)
-    #idxFile = open(ind)
-    #content = conFile.read()
-    #index = idxFile.read()
-    features,bboxes = loadFeaturesAndIndex(img,content,index)
+def loadImageFeatures(img,featuresDir,featuresExt,store=None):
+  if store is not None:
+    features,boxes = store.imageFeatures(img,featuresExt)
+    return (features.astype(floatType),store.imageIndex(img))
+  filename = featuresDir+'/'+img+'.'+featuresExt
+  idxFile = re.sub(r'\..+$',r'.idx',filename)
+  return loadFeaturesAndIndex(img,filename,idxFile)
+
+########################################
+## SHARED RESULTS
+########################################
+class SharedArray():
+  def __init__(self,array):
+    fd,self.filename = tempfile.mkstemp(suffix='.npy',dir=SHARED_DIR)
+    os.close(fd)
+    np.save(self.filename,array)
+
+  def load(self):
+    # Copy-on-write mapping: the file can be removed right away
+    array = np.load(self.filename,mmap_mode='c')
+    os.remove(self.filename)
+    return array
+
+def shareArrays(data):
+  if isinstance(data,np.ndarray) and data.nbytes >= MIN_SHARED_BYTES:
+    return SharedArray(data)
+  elif isinstance(data,tuple):
+    return tuple([shareArrays(d) for d in data])
+  elif isinstance(data,list):
+    return [shareArrays(d) for d in data]
+  elif isinstance(data,dict):
+    return dict([(k,shareArrays(v)) for k,v in data.items()])
+  return data
+
+def restoreArrays(data):
+  if isinstance(data,SharedArray):
+    return data.load()
+  elif isinstance(data,tuple):
+    return tuple([restoreArrays(d) for d in data])
+  elif isinstance(data,list):
+    return [restoreArrays(d) for d in data]
+  elif isinstance(data,dict):
+    return dict([(k,restoreArrays(v)) for k,v in data.items()])
+  return data
+
+########################################
+## WORKERS
+########################################
+def worker(inQueue, outQueue, task, featuresDir, featuresExt):
+  store = fs.FeatureStore(featuresDir) if fs.isFeatureStore(featuresDir) else None
+  for img in iter(inQueue.get,'stop'):
+    try:
+      features,bboxes = loadImageFeatures(img,featuresDir,featuresExt,store)
+    except:
+      print 'Error with',img
+      outQueue.put('Ignore')
+      continue
     result = task.run(img,features,bboxes)
-    if result != None:
-      outQueue.put(result)
-    else: 
+    if result is not None:
+      outQueue.put( shareArrays(result) )
+    else:
       outQueue.put('Ignore')
-      #print img,'did not produce any result.'
-    inQueue.task_done()
-    #idxFile.close()
-    #conFile.close()
-    #toc(img,s)
-  inQueue.task_done()
   return True
 
-def processData(imageList,featuresDir,featuresExt,task):
-  numProcs = 8
-  taskQueue = JoinableQueue()
+def feeder(taskQueue, imageList, numProcs):
+  for img in imageList:
+    taskQueue.put(img)
+  for i in range(numProcs):
+    taskQueue.put('stop')
+
+def processData(imageList,featuresDir,featuresExt,task,numProcs=None):
+  if numProcs is None:
+    numProcs = cpu_count()
+  taskQueue = Queue(QUEUE_FACTOR*numProcs)
   resultQueue = Queue()
   processes = []
   for i in range(numProcs):
-    t = Process(target=worker, args=(taskQueue, resultQueue, task))
+    t = Process(target=worker, args=(taskQueue, resultQueue, task, featuresDir, featuresExt))
     t.daemon = True
     t.start()
     processes.append(t)
 
-  for img in imageList:
-    filename = featuresDir+'/'+img+'.'+featuresExt
-    idxFile = re.sub(r'\..+$',r'.idx',filename)
-    content = open(filename)
-    index = open(idxFile)
-    taskQueue.put( (img,content.read(),index.read()) )
-    #taskQueue.put( (img,filename,idxFile) )
-    index.close()
-    content.close()
-  for i in range(len(processes)):
-    taskQueue.put('stop')
+  # Workers only receive image names; the bounded queue throttles the producer
+  producer = Thread(target=feeder, args=(taskQueue, imageList, numProcs))
+  producer.daemon = True
+  producer.start()
 
   results = []
   retrieved = 0
   while retrieved < len(imageList):
     data = resultQueue.get()
     retrieved += 1
-    if data != 'Ignore':
-      results.append(data)
+    if not isinstance(data,str) or data != 'Ignore':
+      results.append( restoreArrays(data) )
+  producer.join()
+  for t in processes:
+    t.join()
   return results
 
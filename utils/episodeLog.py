@@ -0,0 +1,153 @@
+import os,sys
+import json
+import numpy as np
+
+########################################
+## COLUMNAR EPISODE LOG
+########################################
+# Test memory of a whole run in one append-only file instead of one JSON file
+# per image. The file has a header and fixed-size rows, one per step:
+#   header  magic, version, number of scores (int32 x 4)
+#   rows    image id, step (int32), box (float32 x 4), action (int32),
+#           value, reward (float32), scores (float32 x numScores)
+# Rows of an episode are contiguous. Two side files complete the log:
+#   <log>.images  image names, the line number is the image id
+#   <log>.index   image id, first row, number of rows of every episode (int64)
+# An image logged twice keeps its last episode, like the JSON files did.
+
+LOG_FILE = 'episodes.log'
+MAGIC = 0x45504c47
+VERSION = 1
+HEADER_SIZE = 16
+BUFFER_ROWS = 4096
+
+def rowType(numScores):
+  return np.dtype([('image',np.int32), ('step',np.int32), ('box',np.float32,(4,)), ('action',np.int32),
+                   ('value',np.float32), ('reward',np.float32), ('scores',np.float32,(numScores,))])
+
+def logFile(memDir):
+  return memDir + '/' + LOG_FILE
+
+def isEpisodeLog(memDir):
+  return os.path.isfile(logFile(memDir))
+
+def removeLog(filename):
+  for f in [filename, filename + '.images', filename + '.index']:
+    if os.path.isfile(f):
+      os.remove(f)
+
+class EpisodeLogWriter():
+
+  def __init__(self, filename):
+    # A new run starts a new log
+    self.filename = filename
+    removeLog(filename)
+    self.numScores = None
+    self.rows = 0
+    self.images = 0
+    self.buffer = []
+    self.bufferIndex = []
+    self.bufferNames = []
+
+  # record is a dictionary of lists as in the JSON test memory
+  def addEpisode(self, image, record):
+    steps = len(record['boxes'])
+    if self.numScores is None and steps > 0:
+      self.numScores = len(record['scores'][0])
+    rows = np.zeros( (steps), rowType(self.numScores or 0) )
+    rows['image'] = self.images
+    rows['step'] = np.arange(steps)
+    if steps > 0:
+      rows['box'] = record['boxes']
+      rows['action'] = record['actions']
+      rows['value'] = record['values']
+      rows['reward'] = record['rewards']
+      rows['scores'] = record['scores']
+    self.buffer.append(rows)
+    self.bufferIndex.append( [self.images, self.rows, steps] )
+    self.bufferNames.append(image)
+    self.images += 1
+    self.rows += steps
+    if sum([len(b) for b in self.buffer]) >= BUFFER_ROWS:
+      self.flush()
+
+  def flush(self):
+    if len(self.bufferNames) == 0:
+      return
+    if not os.path.isfile(self.filename):
+      with open(self.filename, 'wb') as out:
+        np.asarray([MAGIC, VERSION, self.numScores or 0, 0], np.int32).tofile(out)
+    with open(self.filename, 'ab') as out:
+      for rows in self.buffer:
+        rows.tofile(out)
+    with open(self.filename + '.index', 'ab') as out:
+      np.asarray(self.bufferIndex, np.int64).tofile(out)
+    with open(self.filename + '.images', 'a') as out:
+      out.write(''.join([name + '\n' for name in self.bufferNames]))
+    self.buffer = []
+    self.bufferIndex = []
+    self.bufferNames = []
+
+class EpisodeLog():
+
+  def __init__(self, filename):
+    header = np.fromfile(filename, np.int32, 4)
+    assert header[0] == MAGIC, 'Not an episode log: ' + filename
+    self.rows = np.memmap(filename, rowType(header[2]), mode='r', offset=HEADER_SIZE)
+    self.imageNames = [x.strip() for x in open(filename + '.images')]
+    index = np.fromfile(filename + '.index', np.int64).reshape( (-1,3) )
+    self.episodes = dict( [(self.imageNames[i],(first,first+steps)) for i,first,steps in index.tolist()] )
+
+  def images(self):
+    return self.episodes.keys()
+
+  def episode(self, image):
+    start,end = self.episodes[image]
+    return self.rows[start:end]
+
+  def record(self, image):
+    # The episode in the format of the JSON test memory
+    rows = self.episode(image)
+    return {'boxes':rows['box'].tolist(), 'actions':rows['action'].tolist(), 'values':rows['value'].tolist(),
+            'rewards':rows['reward'].tolist(), 'scores':rows['scores'].tolist()}
+
+########################################
+## TEST MEMORY OF THE ENVIRONMENTS
+########################################
+# Shared by the box search and tracker environments. memoryFormat is the
+# testMemoryFormat option: 'binary' logs all test episodes of a run in one
+# file, 'json' writes memDir + image + '.txt' per episode.
+
+def openTestMemory(memDir, mode, memoryFormat):
+  # Returns the writer of the log, None for JSON files or other modes
+  if mode == 'test' and memoryFormat == 'binary':
+    return EpisodeLogWriter(logFile(memDir))
+  elif mode == 'test':
+    # A log of a previous run would hide the JSON files of this one
+    removeLog(logFile(memDir))
+  return None
+
+def saveTestRecord(memDir, testLog, image, record):
+  if testLog is not None:
+    testLog.addEpisode(image, record)
+  else:
+    with open(memDir + image + '.txt', 'w') as outfile:
+      json.dump(record, outfile)
+
+########################################
+## CONVERTER FROM JSON TEST MEMORY
+########################################
+def convertJsonDir(memDir, filename=None):
+  writer = EpisodeLogWriter(filename if filename is not None else logFile(memDir))
+  for f in sorted(os.listdir(memDir)):
+    if not f.endswith('.txt'): continue
+    writer.addEpisode(f.replace('.txt',''), json.load( open(memDir + '/' + f, 'r') ))
+  writer.flush()
+  return writer
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print 'Use: episodeLog.py testMemDir [logFile]'
+    sys.exit()
+  writer = convertJsonDir(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+  print 'Converted',writer.images,'episodes with',writer.rows,'steps'
@@ -0,0 +1,218 @@
+import os,sys
+import re
+import numpy as np
+
+########################################
+## MEMORY-MAPPED FEATURE STORE
+########################################
+# A store is a directory with one .npy data file per layer (float32 or float16)
+# and a binary index shared by all layers:
+#   index.images.npy   image ids (numImages)
+#   index.offsets.npy  first row of each image (numImages+1)
+#   index.boxes.npy    int32 boxes of every row (numRows x 4)
+# Rows of the same image are contiguous, so any image is read without decompression.
+
+INDEX_PREFIX = 'index'
+
+def isFeatureStore(directory):
+  return os.path.isfile(directory + '/' + INDEX_PREFIX + '.offsets.npy')
+
+class FeatureStore():
+
+  def __init__(self, directory, mode='r'):
+    self.directory = directory
+    self.mode = mode
+    self.images = np.load(self.indexFile('images'))
+    self.offsets = np.load(self.indexFile('offsets'))
+    self.boxes = np.load(self.indexFile('boxes'), mmap_mode='r')
+    self.imageIdx = dict( [(self.images[i],i) for i in range(len(self.images))] )
+    self.boxIdx = {}
+    self.data = {}
+
+  def indexFile(self, name):
+    return self.directory + '/' + INDEX_PREFIX + '.' + name + '.npy'
+
+  def layerFile(self, layer):
+    return self.directory + '/' + layer + '.npy'
+
+  def layers(self):
+    return [f.replace('.npy','') for f in os.listdir(self.directory) if f.endswith('.npy') and not f.startswith(INDEX_PREFIX + '.')]
+
+  def layerData(self, layer):
+    try:
+      return self.data[layer]
+    except:
+      self.data[layer] = np.load(self.layerFile(layer), mmap_mode=self.mode)
+      return self.data[layer]
+
+  def hasImage(self, img):
+    return img in self.imageIdx
+
+  def rowsForImage(self, img):
+    i = self.imageIdx[img]
+    return slice(self.offsets[i], self.offsets[i+1])
+
+  def rowsForBoxes(self, img, boxes):
+    # Absolute rows of the requested boxes of one image (boxes not found are skipped)
+    try:
+      index = self.boxIdx[img]
+    except:
+      rows = self.rowsForImage(img)
+      index = dict( [(tuple(b),rows.start+j) for j,b in reversed(list(enumerate(self.boxes[rows].tolist())))] )
+      self.boxIdx[img] = index
+    rows = [index.get(tuple(map(int,b)),-1) for b in boxes]
+    return np.asarray([r for r in rows if r >= 0], np.int64)
+
+  def getFeatures(self, layer, rows):
+    return self.layerData(layer)[rows]
+
+  def getBoxes(self, rows):
+    return np.asarray(self.boxes[rows])
+
+  def imageFeatures(self, img, layer):
+    rows = self.rowsForImage(img)
+    return self.getFeatures(layer, rows), self.getBoxes(rows)
+
+  def imageIndex(self, img):
+    # Box index in the same format of .idx files
+    return [ [img] + map(str,b) for b in self.getBoxes(self.rowsForImage(img)).tolist() ]
+
+  def setFeatures(self, layer, rows, features):
+    self.layerData(layer)[rows] = features
+
+  def flush(self):
+    for layer in self.data.keys():
+      if hasattr(self.data[layer], 'flush'):
+        self.data[layer].flush()
+
+########################################
+## STORE CREATION
+########################################
+# index is a list of [image, x1, y1, x2, y2] records. Returns the store opened
+# for writing and the row assigned to each record (rows are grouped by image).
+def createFeatureStore(directory, index, layers, dtype=np.float32):
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  images, first = [], {}
+  for r in index:
+    if not r[0] in first:
+      first[r[0]] = len(images)
+      images.append(r[0])
+  imageOf = np.asarray([first[r[0]] for r in index], np.int64)
+  order = np.argsort(imageOf, kind='mergesort')
+  counts = np.bincount(imageOf, minlength=len(images)) if len(index) > 0 else np.zeros( (0), np.int64 )
+  offsets = np.concatenate( ([0], np.cumsum(counts)) ).astype(np.int64)
+  boxes = np.asarray([map(float,r[1:5]) for r in index], np.float64).reshape( (-1,4) )
+  np.save(directory + '/' + INDEX_PREFIX + '.images.npy', np.asarray(images, dtype=np.str_))
+  np.save(directory + '/' + INDEX_PREFIX + '.offsets.npy', offsets)
+  np.save(directory + '/' + INDEX_PREFIX + '.boxes.npy', boxes[order].astype(np.int32))
+  for layer,dim in layers.items():
+    m = np.lib.format.open_memmap(directory + '/' + layer + '.npy', mode='w+', dtype=dtype, shape=(len(index),dim))
+    del m
+  rowOf = np.zeros( (len(index)), np.int64 )
+  rowOf[order] = np.arange(len(index))
+  return FeatureStore(directory, mode='r+'), rowOf
+
+########################################
+## MATRIX FILES READ FROM STORES
+########################################
+# The readers of npz matrices (utils.loadMatrix, utils.loadMatrixAndIndex)
+# take the rows from a store when there is one for the file:
+#   featuresDir/image.layer  the rows of image in the store featuresDir
+#                            (convertFeaturesDir)
+#   name.layer               all the rows of the store name (convertMatrixAndIndex)
+# Stores are opened once per process.
+
+openStores = {}
+
+def openStore(directory):
+  try:
+    return openStores[directory]
+  except KeyError:
+    if not isFeatureStore(directory):
+      return None
+    openStores[directory] = FeatureStore(directory)
+    return openStores[directory]
+
+def storedMatrix(filename):
+  # (features, index) of filename from a store, None if no store has them.
+  # The index has the format of .idx files
+  directory, name = os.path.split(filename)
+  if not '.' in name:
+    return None
+  image, layer = name.split('.', 1)
+  store = openStore(directory if directory != '' else '.')
+  if store is not None and store.hasImage(image) and os.path.isfile(store.layerFile(layer)):
+    features, boxes = store.imageFeatures(image, layer)
+    return np.asarray(features), store.imageIndex(image)
+  store = openStore(os.path.join(directory, image))
+  if store is not None and os.path.isfile(store.layerFile(layer)):
+    index = []
+    for img in store.images.tolist():
+      index += store.imageIndex(img)
+    return np.asarray(store.layerData(layer)), index
+  return None
+
+########################################
+## CONVERTERS FROM NPZ + IDX FILES
+########################################
+def matrixParts(filename):
+  if os.path.isfile(filename):
+    yield filename
+  else:
+    i = 0
+    next = filename.replace('.',str(i)+'.')
+    while os.path.isfile(next):
+      yield next
+      i += 1
+      next = filename.replace('.',str(i)+'.')
+
+def loadPart(filename):
+  m = np.load(filename)
+  op = m['arr_0']
+  m.close()
+  return op
+
+# Convert a single (possibly multipart) matrix with its .idx file
+def convertMatrixAndIndex(filename, directory, layer, dtype=np.float32):
+  idxFile = re.sub(r'\..+$',r'.idx',filename)
+  index = [x.split() for x in open(idxFile)]
+  store = None
+  i = 0
+  for part in matrixParts(filename):
+    m = loadPart(part)
+    if store is None:
+      store,rowOf = createFeatureStore(directory, index, {layer:m.shape[1]}, dtype)
+    rows = rowOf[i:i+m.shape[0]]
+    store.setFeatures(layer, rows, m)
+    i += m.shape[0]
+  if store is not None:
+    store.flush()
+  return store
+
+# Convert a directory of per-image feature files (img.featuresExt + img.idx)
+def convertFeaturesDir(featuresDir, imageList, featuresExt, directory, dtype=np.float32):
+  index = []
+  for img in imageList:
+    index += [x.split() for x in open(featuresDir + '/' + img + '.idx')]
+  store = None
+  i = 0
+  for img in imageList:
+    m = loadPart(featuresDir + '/' + img + '.' + featuresExt)
+    if store is None:
+      store,rowOf = createFeatureStore(directory, index, {featuresExt:m.shape[1]}, dtype)
+    store.setFeatures(featuresExt, rowOf[i:i+m.shape[0]], m)
+    i += m.shape[0]
+  if store is not None:
+    store.flush()
+  return store
+
+if __name__ == "__main__":
+  import utils as cu
+  params = cu.loadParams('source imageList featuresExt outputDir dtype')
+  dtype = {'float32':np.float32, 'float16':np.float16}[params['dtype']]
+  if os.path.isdir(params['source']):
+    imageList = [x.strip() for x in open(params['imageList'])]
+    convertFeaturesDir(params['source'], imageList, params['featuresExt'], params['outputDir'], dtype)
+  else:
+    convertMatrixAndIndex(params['source'], params['outputDir'], params['featuresExt'], dtype)
@@ -0,0 +1,108 @@
+import os
+from collections import OrderedDict
+import numpy as np
+import Image
+
+import imageIndex as ii
+
+########################################
+## DECODED IMAGE CACHE
+########################################
+# Shared access to images for the RL environments, the feature backends and
+# the dataset scripts. Decoded images are kept as RGB uint8 arrays in an LRU
+# cache bounded by bytes, so images visited again in later epochs (or loaded
+# again after a cover) are not decoded again. Callers that resize the image
+# to a small target pass it as minSize=(width, height): JPEG images are then
+# decoded with draft(), at the smallest of 1/2, 1/4 or 1/8 of the resolution
+# that still covers the target. Sizes come from the index of the image
+# directory when it has one (see imageIndex) and the file has not been
+# modified since it was indexed, or else from the file header, and are
+# remembered for every file. Arrays are read-only: copy before drawing.
+
+CACHE_BYTES = 512*1024*1024
+
+class ImageCache():
+
+  def __init__(self, maxBytes=CACHE_BYTES):
+    self.maxBytes = maxBytes
+    self.entries = OrderedDict()
+    self.bytes = 0
+    self.sizes = {}
+    self.indexes = {}
+    self.hits = 0
+    self.misses = 0
+
+  def size(self, filename):
+    # (width, height), opening the image reads the header only
+    try:
+      return self.sizes[filename]
+    except KeyError:
+      size = self.indexedSize(filename)
+      self.sizes[filename] = size if size is not None else Image.open(filename).size
+      return self.sizes[filename]
+
+  def indexedSize(self, filename):
+    # Each directory index is opened once, on the first image of the directory
+    imageDir, name = os.path.split(os.path.normpath(filename))
+    try:
+      index = self.indexes[imageDir]
+    except KeyError:
+      index = self.indexes[imageDir] = ii.openIndex(imageDir)
+    mtime = index.mtime(name) if index is not None else None
+    # A file modified after the scan is read again from its header
+    if mtime is None or mtime != os.path.getmtime(filename):
+      return None
+    return index.size(name)
+
+  def decode(self, filename, minSize=None):
+    img = Image.open(filename)
+    self.sizes[filename] = img.size
+    if minSize is not None:
+      img.draft('RGB', tuple(minSize))
+    img = np.asarray(img.convert('RGB'))
+    # Cached arrays are shared by all callers
+    img.flags.writeable = False
+    return img
+
+  def load(self, filename, minSize=None):
+    # RGB (height x width x 3) array. With minSize, the array can be smaller
+    # than the image: scale coordinates with the ratio to size(filename)
+    key = (filename, tuple(minSize) if minSize is not None else None)
+    try:
+      img = self.entries.pop(key)
+      self.hits += 1
+    except KeyError:
+      img = self.decode(filename, minSize)
+      self.misses += 1
+      self.put(key, img)
+      return img
+    self.entries[key] = img
+    return img
+
+  def put(self, key, img):
+    if img.nbytes > self.maxBytes:
+      return
+    while self.bytes + img.nbytes > self.maxBytes:
+      self.bytes -= self.entries.popitem(last=False)[1].nbytes
+    self.entries[key] = img
+    self.bytes += img.nbytes
+
+  def clear(self):
+    self.entries = OrderedDict()
+    self.bytes = 0
+
+  def hitRate(self):
+    total = self.hits + self.misses
+    return float(self.hits)/total if total > 0 else 0.0
+
+  def report(self):
+    print 'ImageCache: {:d} hits, {:d} misses, hit rate {:5.3f}, {:d} images in {:.1f} MB'.format(self.hits, self.misses, self.hitRate(), len(self.entries), self.bytes/1048576.0)
+
+# Cache shared by the modules of a process
+cache = ImageCache()
+
+def imageSize(filename):
+  return cache.size(filename)
+
+def loadImage(filename, minSize=None):
+  return cache.load(filename, minSize)
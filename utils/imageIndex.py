@@ -0,0 +1,137 @@
+import os,sys
+import numpy as np
+import Image
+from multiprocessing import cpu_count
+
+import multiproc as mp
+
+########################################
+## IMAGE METADATA INDEX
+########################################
+# Width and height of every image of a directory, scanned once and kept in a
+# binary file next to the images, so a run gets all sizes from one mmap
+# instead of opening every image. The file has a header, fixed-size rows and
+# the pool of file names:
+#   header  magic, version, number of images, bytes of the pool (int64 x 4)
+#   rows    image id, width, height, name length (int32), name offset in
+#           the pool (int64), modification time (float64)
+#   pool    file names relative to the directory, one after the other
+# Rows are sorted by file name and the image id is the row. refreshIndex
+# only opens the images that are new or modified since the last scan.
+
+INDEX_FILE = 'images.index'
+MAGIC = 0x494d4758
+VERSION = 1
+HEADER_SIZE = 32
+EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SCAN_CHUNK = 256
+
+ROW_TYPE = np.dtype([('id',np.int32), ('width',np.int32), ('height',np.int32), ('length',np.int32),
+                     ('offset',np.int64), ('mtime',np.float64)])
+
+def indexFile(imageDir):
+  return os.path.join(imageDir, INDEX_FILE)
+
+class ImageIndex():
+
+  def __init__(self, filename):
+    header = np.fromfile(filename, np.int64, 4)
+    assert header[0] == MAGIC, 'Not an image index: ' + filename
+    self.rows = np.memmap(filename, ROW_TYPE, mode='r', offset=HEADER_SIZE, shape=(int(header[2]),)) if header[2] > 0 else np.zeros( (0), ROW_TYPE )
+    self.pool = np.memmap(filename, np.uint8, mode='r', offset=HEADER_SIZE + ROW_TYPE.itemsize*int(header[2]), shape=(int(header[3]),)) if header[3] > 0 else np.zeros( (0), np.uint8 )
+    self.ids = None
+
+  def __len__(self):
+    return len(self.rows)
+
+  def name(self, i):
+    start = self.rows['offset'][i]
+    return self.pool[start:start + self.rows['length'][i]].tostring()
+
+  def names(self):
+    return [self.name(i) for i in range(len(self.rows))]
+
+  def imageId(self, name):
+    # Dictionary of names built on the first lookup
+    if self.ids is None:
+      self.ids = dict( [(self.name(i),i) for i in range(len(self.rows))] )
+    return self.ids.get(name, -1)
+
+  def size(self, name):
+    # (width, height) of a file name, None if it is not indexed
+    i = self.imageId(name)
+    if i < 0:
+      return None
+    return (int(self.rows['width'][i]), int(self.rows['height'][i]))
+
+  def mtime(self, name):
+    # Modification time of the file when it was indexed, None if not indexed
+    i = self.imageId(name)
+    return float(self.rows['mtime'][i]) if i >= 0 else None
+
+  def __contains__(self, name):
+    return self.imageId(name) >= 0
+
+def openIndex(imageDir):
+  filename = indexFile(imageDir)
+  return ImageIndex(filename) if os.path.isfile(filename) else None
+
+########################################
+## SCAN AND REFRESH
+########################################
+def readSizes(task):
+  imageDir, names = task
+  sizes = []
+  for name in names:
+    try:
+      sizes.append( (name,) + Image.open(os.path.join(imageDir, name)).size )
+    except IOError:
+      print 'ImageIndex: cannot read',name
+  return sizes
+
+def writeIndex(filename, names, sizes, mtimes):
+  pool = ''.join(names)
+  rows = np.zeros( (len(names)), ROW_TYPE )
+  rows['id'] = np.arange(len(names))
+  rows['width'] = [sizes[n][0] for n in names]
+  rows['height'] = [sizes[n][1] for n in names]
+  rows['length'] = [len(n) for n in names]
+  rows['offset'] = np.cumsum([0] + [len(n) for n in names])[:-1]
+  rows['mtime'] = [mtimes[n] for n in names]
+  # Readers never see a partial file
+  with open(filename + '.tmp', 'wb') as out:
+    np.asarray([MAGIC, VERSION, len(names), len(pool)], np.int64).tofile(out)
+    rows.tofile(out)
+    out.write(pool)
+  os.rename(filename + '.tmp', filename)
+
+def refreshIndex(imageDir, numProcs=None, extensions=EXTENSIONS):
+  # Builds the index of imageDir, or updates it with new, modified and
+  # removed images. Returns the number of images that had to be opened
+  filename = indexFile(imageDir)
+  names = sorted([f for f in os.listdir(imageDir) if f.lower().endswith(extensions)])
+  mtimes = dict( [(n,os.path.getmtime(os.path.join(imageDir, n))) for n in names] )
+  sizes = {}
+  old = openIndex(imageDir)
+  if old is not None:
+    for i in range(len(old)):
+      n = old.name(i)
+      if mtimes.get(n) == old.rows['mtime'][i]:
+        sizes[n] = (int(old.rows['width'][i]), int(old.rows['height'][i]))
+    del old
+  pending = [n for n in names if n not in sizes]
+  if len(pending) > 0:
+    chunks = [ (imageDir, pending[i:i+SCAN_CHUNK]) for i in range(0, len(pending), SCAN_CHUNK) ]
+    numProcs = numProcs if numProcs is not None else cpu_count()
+    for n,w,h in mp.processData(chunks, readSizes, min(numProcs, len(chunks))):
+      sizes[n] = (w,h)
+  names = [n for n in names if n in sizes]
+  writeIndex(filename, names, sizes, mtimes)
+  return len(pending)
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print 'Use: imageIndex.py imageDir [numProcs]'
+    sys.exit()
+  opened = refreshIndex(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
+  print 'Indexed',len(ImageIndex(indexFile(sys.argv[1]))),'images,',opened,'opened'
@@ -30,31 +30,103 @@ def overlap(b1,b2):
   else:
     return 0
 
-def nonMaximumSuppression(boxes,scores,maxOverlap):
+########################################
+## PAIRWISE BOX MATRICES
+########################################
+# Maximum number of pairs evaluated at once (rows of A are processed in blocks)
+MAX_BLOCK_PAIRS = 2**22
+
+def boxArray(boxes):
+  boxes = np.asarray(boxes, dtype=np.float64)
+  return boxes.reshape( (-1,4) )
+
+def _pairwiseIntersection(A,B):
+  iw = np.minimum(A[:,2:3],B[:,2]) - np.maximum(A[:,0:1],B[:,0]) + 1
+  ih = np.minimum(A[:,3:4],B[:,3]) - np.maximum(A[:,1:2],B[:,1]) + 1
+  valid = np.logical_and(iw > 0, ih > 0)
+  return iw*ih, valid
+
+def _pairwiseMatrix(A,B,measure):
+  A,B = boxArray(A),boxArray(B)
+  R = np.zeros( (A.shape[0],B.shape[0]), np.float64 )
+  if A.shape[0] == 0 or B.shape[0] == 0:
+    return R
+  areaA = (A[:,2]-A[:,0]+1)*(A[:,3]-A[:,1]+1)
+  areaB = (B[:,2]-B[:,0]+1)*(B[:,3]-B[:,1]+1)
+  step = max(1, MAX_BLOCK_PAIRS/B.shape[0])
+  for i in range(0,A.shape[0],step):
+    inter,valid = _pairwiseIntersection(A[i:i+step],B)
+    if measure == 'iou':
+      denom = areaA[i:i+step,np.newaxis] + areaB - inter
+    else:
+      denom = np.tile(areaB, (inter.shape[0],1))
+    denom[~valid] = 1.0
+    R[i:i+step] = np.where(valid, inter/denom, 0.0)
+  return R
+
+# Symmetric Jaccard coefficient between all rows of A (Nx4) and B (Mx4): NxM matrix
+def iouMatrix(A,B):
+  return _pairwiseMatrix(A,B,'iou')
+
+# How much each box in A covers each box in B: NxM matrix
+def overlapMatrix(A,B):
+  return _pairwiseMatrix(A,B,'overlap')
+
+########################################
+## NON MAXIMUM SUPPRESSION
+########################################
+# Indices of the boxes (Nx4) kept by greedy NMS, in decreasing score order.
+# Stops as soon as maxKeep boxes have been kept.
+def nmsIndices(boxes,scores,maxOverlap,maxKeep=None):
+  boxes = boxArray(boxes)
+  order = np.argsort(scores)[::-1]
+  if maxKeep is None:
+    maxKeep = len(order)
+  if maxOverlap == 1.0:
+    return order[0:maxKeep]
+  areas = (boxes[:,2]-boxes[:,0]+1)*(boxes[:,3]-boxes[:,1]+1)
+  keep = []
+  while len(order) > 0 and len(keep) < maxKeep:
+    i = order[0]
+    keep.append(i)
+    rest = order[1:]
+    iw = np.minimum(boxes[i,2],boxes[rest,2]) - np.maximum(boxes[i,0],boxes[rest,0]) + 1
+    ih = np.minimum(boxes[i,3],boxes[rest,3]) - np.maximum(boxes[i,1],boxes[rest,1]) + 1
+    valid = np.logical_and(iw > 0, ih > 0)
+    inter = np.where(valid, iw*ih, 0.0)
+    ua = areas[i] + areas[rest] - inter
+    ua[~valid] = 1.0
+    order = rest[ inter/ua <= maxOverlap ]
+  return np.asarray(keep, dtype=np.int)
+
+# NMS of several categories in one call. Each category is suppressed on its
+# own boxes: shifting the categories apart and running one NMS gives the same
+# result, but every kept box is then compared with the remaining boxes of all
+# categories. maxKeep applies to the total number of boxes kept. Indices are
+# returned by decreasing score.
+def batchedNMS(boxes,scores,classIds,maxOverlap,maxKeep=None):
+  boxes = boxArray(boxes)
+  if boxes.shape[0] == 0:
+    return np.zeros( (0), np.int )
+  scores = np.asarray(scores)
+  classIds = np.asarray(classIds)
+  keep = []
+  for c in np.unique(classIds):
+    members = np.where(classIds == c)[0]
+    keep.append( members[nmsIndices(boxes[members],scores[members],maxOverlap,maxKeep)] )
+  keep = np.concatenate(keep)
+  keep = keep[ np.argsort(-scores[keep], kind='mergesort') ]
+  return keep[0:maxKeep] if maxKeep is not None else keep
+
+def nonMaximumSuppression(boxes,scores,maxOverlap,maxKeep=None):
   if maxOverlap == 1.0:
     return [map(float,x[1:]) for x in boxes],scores
-  s = np.argsort(scores)
+  if len(boxes) == 0:
+    return [],[]
   if len(boxes[0]) > 4:
-    boxes = [map(float,boxes[t][1:]) for t in s]
-  elif len(boxes[0]) == 4:
-    boxes = [boxes[t] for t in s]
-  scores = [scores[t] for t in s]
-  filteredBoxes = []
-  filteredScores = []
-  while len(boxes) > 0:
-    prevBox = boxes.pop()
-    filteredBoxes.append(prevBox)
-    filteredScores.append(scores.pop())
-    suppressed = []
-    for j in range(len(boxes)-1,-1,-1):
-      box = boxes[j]
-      ov = IoU(prevBox,box)
-      if ov > maxOverlap:
-        suppressed.append(j)
-    for sprs in suppressed:
-      boxes.pop(sprs)
-      scores.pop(sprs)
-  return (filteredBoxes,filteredScores)
+    boxes = [map(float,b[1:]) for b in boxes]
+  keep = nmsIndices([b[0:4] for b in boxes],scores,maxOverlap,maxKeep)
+  return ([boxes[k] for k in keep],[scores[k] for k in keep])
 
 ########################################
 ## ABSTRACT DETECTOR
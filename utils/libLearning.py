@@ -2,6 +2,7 @@ import numpy as np
 import utils as cu
 import libDetection as det
 import dataProcessor as dp
+import featureStore as fs
 from utils import emptyMatrix
 
 ###############################################
@@ -216,7 +217,24 @@ class LoadHardNegatives():
     candidates = np.asarray(candidates)
     return (features[candidates],imgList,box)
 
+def loadHardNegativesFromStore(featuresDir,negativesInfo,featuresExt,numFeatures,totalNegatives):
+  store = fs.FeatureStore(featuresDir)
+  hardng = emptyMatrix([totalNegatives,numFeatures])
+  boxes = []
+  i = 0
+  for img in negativesInfo.keys():
+    if not store.hasImage(img):
+      continue
+    # Keep the order of the feature file and skip repeated boxes
+    rows = np.unique( store.rowsForBoxes(img, [map(float,b) for b in negativesInfo[img]]) )
+    hardng[i:i+len(rows),:] = store.getFeatures(featuresExt, rows)
+    boxes += [ [img] + map(str,b) for b in store.getBoxes(rows).tolist() ]
+    i = i + len(rows)
+  return (hardng[0:i,:],boxes)
+
 def loadHardNegativesFromList(featuresDir,negativesInfo,featuresExt,numFeatures,totalNegatives,idx=False):
+  if fs.isFeatureStore(featuresDir):
+    return loadHardNegativesFromStore(featuresDir,negativesInfo,featuresExt,numFeatures,totalNegatives)
   i = 0
   task = LoadHardNegatives(negativesInfo)
   result = dp.processData(negativesInfo.keys(),featuresDir,featuresExt,task)
@@ -0,0 +1,44 @@
+import numpy as np
+
+########################################
+## FIXED-SIZE TEMPORAL WINDOW
+########################################
+# Keeps the last `length` rows, newest first. Every row is written twice,
+# at head and head+length, so the ordered window is always the contiguous
+# slice data[head:head+length]: pushing a row costs two row writes instead
+# of shifting the whole window, and reading the window copies nothing.
+# The window is a view of the buffer, copy it if it must survive a push.
+
+class RingBuffer():
+
+  def __init__(self, length, shape=(), dtype=np.float32, fill=0):
+    self.length = length
+    self.fill = fill
+    self.data = np.empty( (2*length,) + tuple(shape), dtype )
+    self.clear()
+
+  def clear(self):
+    self.data[...] = self.fill
+    self.head = 0
+
+  def push(self, row):
+    self.head = (self.head - 1) % self.length
+    self.data[self.head] = row
+    self.data[self.head + self.length] = row
+
+  def window(self):
+    return self.data[self.head:self.head + self.length]
+
+  def flat(self):
+    return self.window().reshape( (-1,) )
+
+  def __len__(self):
+    return self.length
+
+  def __getitem__(self, t):
+    return self.data[self.head + t]
+
+  def __setitem__(self, t, row):
+    i = (self.head + t) % self.length
+    self.data[i] = row
+    self.data[i + self.length] = row
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+import utils as cu
+import featureStore as fs
+
+########################################
+## NPZ MATRICES AGAINST THEIR STORES
+########################################
+# Converted to a store, per-image and whole matrices must be read by
+# loadMatrixAndIndex as they were read from the npz and .idx files.
+
+def writeMatrix(filename, features, index):
+  with open(filename, 'w') as outf:
+    np.savez_compressed(outf, features)
+  with open(filename.split('.')[0] + '.idx', 'w') as idx:
+    idx.write(''.join([' '.join(r) + '\n' for r in index]))
+
+class FeatureStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    rng = np.random.RandomState(0)
+    self.images = ['im00', 'im01', 'im02']
+    self.features = dict([ (img, rng.rand(4 + i, 8).astype(np.float32)) for i,img in enumerate(self.images) ])
+    self.index = dict([ (img, [ [img] + map(str, [k, k, 10 + k, 20 + k]) for k in range(4 + i) ]) for i,img in enumerate(self.images) ])
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def testImageFiles(self):
+    npzDir, storeDir = self.dir + '/npz', self.dir + '/store'
+    os.makedirs(npzDir)
+    for img in self.images:
+      writeMatrix(npzDir + '/' + img + '.fc6', self.features[img], self.index[img])
+    fs.convertFeaturesDir(npzDir, self.images, 'fc6', storeDir)
+    for img in self.images:
+      expected = cu.loadMatrixAndIndex(npzDir + '/' + img + '.fc6')
+      stored = cu.loadMatrixAndIndex(storeDir + '/' + img + '.fc6')
+      self.assertTrue(np.array_equal(stored[0], expected[0]))
+      self.assertEqual(stored[1], expected[1])
+      self.assertTrue(np.array_equal(cu.loadMatrix(storeDir + '/' + img + '.fc6'), expected[0]))
+
+  def testWholeMatrix(self):
+    # The rows of dir/npz.fc6 are read from the store dir/all as dir/all.fc6
+    writeMatrix(self.dir + '/npz.fc6', np.vstack([self.features[img] for img in self.images]),
+      sum([self.index[img] for img in self.images], []))
+    expected = cu.loadMatrixAndIndex(self.dir + '/npz.fc6')
+    fs.convertMatrixAndIndex(self.dir + '/npz.fc6', self.dir + '/all', 'fc6')
+    stored = cu.loadMatrixAndIndex(self.dir + '/all.fc6')
+    self.assertTrue(np.array_equal(stored[0], expected[0]))
+    self.assertEqual(stored[1], expected[1])
+
+if __name__ == "__main__":
+  unittest.main()
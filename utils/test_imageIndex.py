@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import Image
+
+import imageIndex as ii
+import imageCache as ic
+
+########################################
+## SIZES FROM THE INDEX AND FROM THE FILES
+########################################
+# ImageCache takes sizes from images.index only while the file is the one
+# that was indexed; files modified after the scan are read from the header.
+
+def writeImage(filename, width, height, mtime):
+  Image.fromarray(np.zeros( (height, width, 3), np.uint8 )).save(filename)
+  os.utime(filename, (mtime, mtime))
+
+class ImageIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    for i in range(4):
+      writeImage(self.filename(i), 20 + i, 10 + i, 1000000)
+    self.assertEqual(ii.refreshIndex(self.dir, 1), 4)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def filename(self, i):
+    return os.path.join(self.dir, 'im%04d.jpg' % i)
+
+  def testIndexedSizes(self):
+    index = ii.openIndex(self.dir)
+    self.assertEqual([index.size('im%04d.jpg' % i) for i in range(4)], [(20 + i, 10 + i) for i in range(4)])
+    self.assertEqual(index.size('missing.jpg'), None)
+    self.assertEqual(ic.ImageCache().size(self.filename(2)), (22, 12))
+
+  def testModifiedFile(self):
+    writeImage(self.filename(3), 77, 99, 2000000)
+    self.assertEqual(ic.ImageCache().size(self.filename(3)), (77, 99))
+    # The refresh opens the modified image only
+    self.assertEqual(ii.refreshIndex(self.dir, 1), 1)
+    self.assertEqual(ii.openIndex(self.dir).size('im0003.jpg'), (77, 99))
+
+  def testNewFile(self):
+    writeImage(self.filename(7), 31, 17, 1000000)
+    self.assertEqual(ic.ImageCache().size(self.filename(7)), (31, 17))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import numpy as np
+
+import ringBuffer as rb
+
+########################################
+## RING BUFFER AGAINST THE SHIFT LOOPS
+########################################
+# The agents used to shift their windows with Python loops. These are the
+# loops they had, fed with the same rows as a RingBuffer:
+#   RegionFilteringAgent  two rows, the previous one kept: same windows
+#   BoxSearchState        action history as a list of one-hot codes: same
+#   BoxSearchAgent and    temporalWindow rows, but the loop copied row 0
+#   TrackerAgent          forward, so every older row held the previous frame.
+#                         Same windows for temporalWindow 1; for larger
+#                         windows the ring holds the actual last frames.
+
+FEATURES = 6
+STEPS = 25
+
+def rows(seed=0):
+  rng = np.random.RandomState(seed)
+  return rng.rand(STEPS, FEATURES).astype(np.float32)
+
+def agentShift(window, row):
+  # BoxSearchAgent.integrateObservation and TrackerAgent before the ring
+  for t in range(window.shape[0]-1):
+    window[t+1,:] = window[t,:]
+  window[0,:] = row
+
+def regionShift(window, row):
+  # RegionFilteringAgent.integrateObservation before the ring
+  window[1,:] = window[0,:]
+  window[0,:] = row
+
+class RingBufferTest(unittest.TestCase):
+
+  def compare(self, length, shift, clearAt=()):
+    window = np.zeros( (length, FEATURES), np.float32 )
+    ring = rb.RingBuffer(length, (FEATURES,), np.float32)
+    for k,row in enumerate(rows()):
+      if k in clearAt:
+        window[...] = 0
+        ring.clear()
+      shift(window, row)
+      ring.push(row)
+      self.assertTrue(np.array_equal(ring.window(), window))
+      self.assertTrue(np.array_equal(ring.flat(), window.reshape( (-1,) )))
+
+  def testRegionFilteringWindow(self):
+    self.compare(2, regionShift)
+
+  def testAgentWindowOfOneFrame(self):
+    # temporalWindow 1, also after the history is cleaned by a landmark
+    self.compare(1, agentShift, clearAt=(7,15))
+
+  def testActionHistory(self):
+    numActions, length = 9, 10
+    codes = np.eye(numActions, dtype=np.float32)
+    history = [0 for i in range(numActions*length)]
+    ring = rb.RingBuffer(length, (numActions,), np.float32)
+    for action in np.random.RandomState(1).randint(0, numActions, STEPS):
+      # BoxSearchState.performAction before the ring
+      history = [1 if x == action else 0 for x in range(numActions)] + history[:-numActions]
+      ring.push(codes[action])
+      self.assertTrue(np.array_equal(ring.flat(), np.asarray(history, np.float32)))
+
+  def testAgentWindowOfSeveralFrames(self):
+    # The intended change: the ring keeps the last frames, newest first,
+    # where the shift loop repeated the previous frame in every older row
+    length = 4
+    data = rows()
+    window = np.zeros( (length, FEATURES), np.float32 )
+    ring = rb.RingBuffer(length, (FEATURES,), np.float32)
+    for k in range(STEPS):
+      agentShift(window, data[k])
+      ring.push(data[k])
+      last = [data[k-t] if k-t >= 0 else np.zeros(FEATURES, np.float32) for t in range(length)]
+      self.assertTrue(np.array_equal(ring.window(), np.asarray(last)))
+      self.assertTrue(np.array_equal(window[0], data[k]))
+      self.assertTrue(all([np.array_equal(window[t], last[1]) for t in range(1, length)]))
+
+  def testFrameIds(self):
+    # Frame ids follow the observations, and ids written back by the replay
+    # memory (frames[t] = id) are read back at the same position
+    ids = rb.RingBuffer(3, (), np.int64, -1)
+    for k in range(5):
+      ids.push(-2)
+      ids[0] = k
+    self.assertEqual([ids[t] for t in range(3)], [4, 3, 2])
+    ids.clear()
+    self.assertEqual([ids[t] for t in range(3)], [-1, -1, -1])
+
+if __name__ == "__main__":
+  unittest.main()
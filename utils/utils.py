@@ -5,6 +5,7 @@ import random
 import pickle
 import re
 import MemoryUsage
+import featureStore as fs
 
 floatType = np.float32
 topHards = 5000
@@ -56,6 +57,9 @@ def negOnes(size):
   return -1*posOnes(size)
 
 def loadMatrix(filename):
+  stored = fs.storedMatrix(filename)
+  if stored is not None:
+    return stored[0].astype(floatType)
   if os.path.isfile(filename):
     #print 'Single matrix file found'
     m = np.load( filename )
@@ -89,6 +93,10 @@ def loadMatrixNoCompression(filename):
     print 'No such file:',filename
 
 def loadMatrixAndIndex(filename):
+  # From a feature store if there is one (see featureStore.storedMatrix)
+  stored = fs.storedMatrix(filename)
+  if stored is not None:
+    return (stored[0].astype(floatType),stored[1])
   m = loadMatrix(filename)
   idxFile = re.sub(r'\..+$',r'.idx',filename)
   l = [x.split() for x in open(idxFile)]